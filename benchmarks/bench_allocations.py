@@ -0,0 +1,79 @@
+"""
+Measure allocations of a tight loop in each engine.
+
+Usage:
+    python benchmarks/bench_allocations.py [--iterations N]
+
+Runs `while i < N { i = i + 1; }` (1,000,000 iterations by default) under
+tracemalloc and reports, per engine, the number of ExecutionContext objects
+created (total and per iteration), the peak traced memory and wall time.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from macroni.interpreter.parse_cache import parse_source
+from macroni.interpreter.macroni_interpret import Interpreter, ENGINES
+from macroni.interpreter.types import ExecutionContext
+
+LOOP_SCRIPT = "i = 0;\nwhile i < {n} {{\n    i = i + 1;\n}}\n"
+
+
+def count_contexts():
+    """
+    Wrap ExecutionContext.__init__ so every construction is counted.
+
+    Returns:
+        A one-element list holding the running count.
+    """
+    counter = [0]
+    init = ExecutionContext.__init__
+
+    def counting_init(self, *args, **kwargs):
+        counter[0] += 1
+        init(self, *args, **kwargs)
+
+    ExecutionContext.__init__ = counting_init
+    return counter
+
+
+def run(tree, engine: str, counter: list) -> tuple[int, int, float]:
+    interp = Interpreter(engine=engine)
+    ctx = ExecutionContext(node=tree, eval_cback=interp.execute)
+    counter[0] = 0
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    interp.execute(ctx)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return counter[0], peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    tree = parse_source(LOOP_SCRIPT.format(n=args.iterations))
+    counter = count_contexts()
+
+    print(
+        f"{'engine':<10} {'contexts':>10} {'per iter':>9} {'peak KiB':>10} {'seconds':>8}"
+    )
+    for engine in ENGINES:
+        contexts, peak, elapsed = run(tree, engine, counter)
+        print(
+            f"{engine:<10} {contexts:>10} {contexts / args.iterations:>9.2f} "
+            f"{peak / 1024:>10.1f} {elapsed:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
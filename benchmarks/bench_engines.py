@@ -0,0 +1,93 @@
+"""
+Compare the compiled (closure) engine and the ahead-of-time transpiled code
+against the reference tree-walker.
+
+Usage:
+    python benchmarks/bench_engines.py [--repeat N] [script.macroni ...]
+
+Each script (by default tests/test_loops.macroni, tests/test_functions.macroni
+and benchmarks/workloads/*.macroni) is parsed once. Per engine it is run once
+to compile and warm up, then REPEAT more times in the same interpreter with
+its output suppressed, so the timings cover execution only. The best and mean
+wall times are reported per engine.
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from macroni.interpreter.parse_cache import parse_source
+from macroni.interpreter import aot
+from macroni.interpreter.macroni_interpret import Interpreter, ENGINES, BUILTINS
+from macroni.interpreter.types import ExecutionContext
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCRIPTS = [
+    os.path.join(HERE, "..", "tests", "test_loops.macroni"),
+    os.path.join(HERE, "..", "tests", "test_functions.macroni"),
+    *sorted(glob.glob(os.path.join(HERE, "workloads", "*.macroni"))),
+]
+
+
+def run_once(interp: Interpreter, tree) -> float:
+    ctx = ExecutionContext(node=tree, eval_cback=interp.execute)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        interp.execute(ctx)
+    return time.perf_counter() - start
+
+
+def time_script(tree, engine: str, repeat: int) -> list[float]:
+    # the first run compiles the tree, later runs reuse the compiled code
+    interp = Interpreter(engine=engine)
+    run_once(interp, tree)
+    return [run_once(interp, tree) for _ in range(repeat)]
+
+
+def time_aot(source: str, path: str, repeat: int) -> list[float]:
+    code = aot.compile_source(source, path, BUILTINS)
+    interp = Interpreter()
+    timings = []
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            aot.run_code(code, interp)
+        timings.append(time.perf_counter() - start)
+    # the first run binds the builtins, like the warm-up of the engines
+    return timings[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scripts", nargs="*", default=DEFAULT_SCRIPTS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'script':<32} {'engine':<10} {'best ms':>10} {'mean ms':>10} {'speedup':>8}"
+    )
+    for path in args.scripts:
+        with open(path, "r") as f:
+            source = f.read()
+        tree = parse_source(source)
+
+        results = {e: time_script(tree, e, args.repeat) for e in ENGINES}
+        results["aot"] = time_aot(source, path, args.repeat)
+        reference = min(results["tree"])
+        for engine, timings in results.items():
+            best = min(timings)
+            print(
+                f"{os.path.basename(path):<32} {engine:<10} {best * 1000:>10.3f} "
+                f"{statistics.mean(timings) * 1000:>10.3f} {reference / best:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Measure end-to-end startup time of `macroni --file` on the test suite.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat N] [--preload] [script.macroni ...]
+
+Each script runs in a fresh interpreter process REPEAT times, so imports are
+paid on every run, as they are for a user. Pass --preload to compare against
+loading OCR, OpenCV and the input libraries up front.
+"""
+
+import argparse
+import glob
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def time_run(script: str, extra: list[str]) -> float:
+    cmd = [sys.executable, "-m", "macroni.cli", "--file", script, *extra]
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scripts", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--preload", action="store_true")
+    args = parser.parse_args()
+
+    scripts = args.scripts or sorted(glob.glob("tests/test_*.macroni", root_dir=ROOT))
+    extra = ["--preload"] if args.preload else []
+
+    print(f"{'script':<32} {'best ms':>10} {'mean ms':>10}")
+    bests = []
+    for script in scripts:
+        timings = [time_run(script, extra) for _ in range(args.repeat)]
+        bests.append(min(timings))
+        print(
+            f"{os.path.basename(script):<32} {min(timings) * 1000:>10.1f} "
+            f"{statistics.mean(timings) * 1000:>10.1f}"
+        )
+    print(f"{'total (best)':<32} {sum(bests) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Run the interpreter micro-benchmarks and compare them against a baseline.
+
+Usage:
+    python benchmarks/bench_suite.py [--engine E ...] [--repeat N]
+        [--output results.json] [--baseline baseline.json]
+        [--save-baseline] [--threshold 0.15] [workload.macroni ...]
+
+Each workload (benchmarks/workloads/*.macroni by default) declares how many
+operations it performs in a `# ops: N` header line. It is run once per
+engine to warm up the compiled code, then REPEAT times; the best run gives
+ops/sec. A separate run under tracemalloc counts the ExecutionContext
+objects created per operation and the peak traced memory.
+
+Every workload/engine pair slower than the baseline by more than THRESHOLD
+(a fraction, 0.15 = 15% by default), or creating more contexts per
+operation, is reported and the exit status is 1. --save-baseline writes the
+results to the baseline file instead of comparing.
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_allocations import count_contexts
+from macroni.interpreter import modules
+from macroni.interpreter.macroni_interpret import Interpreter, ENGINES
+from macroni.interpreter.types import ExecutionContext
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORKLOADS = sorted(glob.glob(os.path.join(HERE, "workloads", "*.macroni")))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+# the tree engine is roughly 10x slower, so it is only run when asked for
+DEFAULT_ENGINES = ["compiled", "stack"]
+# bump when the result layout changes
+RESULTS_VERSION = 1
+
+
+def read_ops(path: str) -> int:
+    with open(path, "r") as f:
+        for line in f:
+            match = re.match(r"\s*#\s*ops:\s*(\d+)", line)
+            if match:
+                return int(match.group(1))
+    raise Exception(f"{path} has no `# ops: N` header")
+
+
+def run_once(interp: Interpreter, program) -> float:
+    ctx = ExecutionContext(node=program.main.tree, eval_cback=interp.execute)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        interp.run_program(ctx, program)
+    return time.perf_counter() - start
+
+
+def bench(path: str, engine: str, repeat: int, counter: list) -> dict:
+    """
+    Returns:
+        dict: the results of one workload on one engine
+    """
+    ops = read_ops(path)
+    program = modules.load_program(path)
+    interp = Interpreter(engine=engine)
+    run_once(interp, program)
+    timings = [run_once(interp, program) for _ in range(repeat)]
+
+    counter[0] = 0
+    tracemalloc.start()
+    run_once(interp, program)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        "ops": ops,
+        "best_s": best,
+        "mean_s": statistics.mean(timings),
+        "ops_per_sec": ops / best,
+        "contexts_per_op": counter[0] / ops,
+        "peak_kib": peak / 1024,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Returns:
+        list[str]: a message per regression, empty if there is none
+    """
+    regressions = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        ratio = cur["ops_per_sec"] / base["ops_per_sec"]
+        if ratio < 1 - threshold:
+            regressions.append(
+                f"{key}: {cur['ops_per_sec']:,.0f} ops/s, "
+                f"{(1 - ratio) * 100:.1f}% slower than {base['ops_per_sec']:,.0f}"
+            )
+        # contexts are counted exactly, so any increase is a change in the code
+        if cur["contexts_per_op"] > base["contexts_per_op"] + 1e-9:
+            regressions.append(
+                f"{key}: {cur['contexts_per_op']:.2f} contexts/op, "
+                f"up from {base['contexts_per_op']:.2f}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("workloads", nargs="*", default=DEFAULT_WORKLOADS)
+    parser.add_argument(
+        "--engine", action="append", choices=ENGINES, help="repeat for several"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args()
+
+    counter = count_contexts()
+    results = {}
+    print(
+        f"{'workload':<24} {'engine':<10} {'ops/s':>12} {'mean ms':>10} "
+        f"{'ctx/op':>8} {'peak KiB':>10}"
+    )
+    for path in args.workloads:
+        name = os.path.basename(path)
+        for engine in args.engine or DEFAULT_ENGINES:
+            r = results[f"{name}/{engine}"] = bench(path, engine, args.repeat, counter)
+            print(
+                f"{name:<24} {engine:<10} {r['ops_per_sec']:>12,.0f} "
+                f"{r['mean_s'] * 1000:>10.1f} {r['contexts_per_op']:>8.2f} "
+                f"{r['peak_kib']:>10.1f}"
+            )
+
+    report = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline first")
+        return
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    if baseline.get("version") != RESULTS_VERSION:
+        print(f"Baseline {args.baseline} is from another version, not compared")
+        return
+
+    regressions = compare(results, baseline["results"], args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions over {args.threshold * 100:g}% against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
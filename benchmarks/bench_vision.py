@@ -0,0 +1,313 @@
+"""
+Measure template matching and OCR latency on synthetic or recorded screens,
+without a display.
+
+Usage:
+    python benchmarks/bench_vision.py [--repeat N] [--images DIR] [--ocr]
+        [--output results.json]
+
+Synthetic screens (1080p, 1440p, 4K) are drawn with windows, text and noise,
+with a button at a known position; its template examples are written to a
+temporary template directory. With --images, PNG/JPG screenshots from DIR are
+used instead and the template is cut from the middle of each.
+
+Starting from a base case (1080p, 1 template example, 5 scales, full screen,
+threshold 0.8, exhaustive search), one parameter is varied at a time:
+resolution, number of template examples, number of scales, region size,
+threshold and coarse-to-fine pyramid levels, the latter on each
+resolution. Each case
+runs the same pipeline as @find_template after the capture (downscale, then
+locate_template_in_image) and reports best/mean latency and whether the
+button was found. --ocr also times find_text_in_image per region size and
+upscale (needs easyocr).
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from macroni.util.template_match import locate_template_in_image
+
+RESOLUTIONS = {"1080p": (1920, 1080), "1440p": (2560, 1440), "4k": (3840, 2160)}
+TEMPLATE_COUNTS = [1, 2, 4, 8]
+SCALE_COUNTS = [1, 3, 5, 9]
+# width and height of the searched region, as a fraction of the screen
+REGIONS = {"full": 1.0, "half": 0.5, "quarter": 0.25}
+THRESHOLDS = [0.6, 0.7, 0.8, 0.9]
+PYRAMID_LEVELS = [0, 1, 2]
+UPSCALES = [0.5, 1.0, 1.5]
+BASE = {
+    "resolution": "1080p",
+    "templates": 1,
+    "scales": 5,
+    "region": "full",
+    "threshold": 0.8,
+    "pyramid": 0,
+}
+# same as locate_template_on_screen
+DOWNSCALE = 0.8
+BUTTON_TEXT = "Login"
+BUTTON_SIZE = (140, 48)
+
+
+def draw_button(img, x: int, y: int, shade: int = 0):
+    w, h = BUTTON_SIZE
+    cv2.rectangle(img, (x, y), (x + w, y + h), (40 + shade, 120, 220 - shade), -1)
+    cv2.rectangle(img, (x, y), (x + w, y + h), (255, 255, 255), 2)
+    cv2.putText(
+        img,
+        BUTTON_TEXT,
+        (x + 24, y + 33),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        1.0,
+        (255, 255, 255),
+        2,
+        cv2.LINE_AA,
+    )
+
+
+def synthetic_screen(width: int, height: int, seed: int = 0):
+    """
+    Returns:
+        tuple: (BGR screen, (x, y) of the button's top-left corner)
+    """
+    rng = np.random.default_rng(seed)
+    # desktop gradient
+    ramp = np.linspace(60, 140, width, dtype=np.float32)
+    img = np.empty((height, width, 3), np.uint8)
+    img[:] = np.stack([ramp, ramp * 0.8, ramp * 0.6], axis=-1).astype(np.uint8)
+    # windows with title bars and lines of text
+    for _ in range(max(4, width * height // 250_000)):
+        w = int(rng.integers(width // 8, width // 2))
+        h = int(rng.integers(height // 8, height // 2))
+        x = int(rng.integers(0, width - w))
+        y = int(rng.integers(0, height - h))
+        color = tuple(int(c) for c in rng.integers(180, 250, 3))
+        cv2.rectangle(img, (x, y), (x + w, y + h), color, -1)
+        cv2.rectangle(img, (x, y), (x + w, y + 28), (70, 70, 70), -1)
+        for line_y in range(y + 50, y + h - 10, 26):
+            words = " ".join(
+                "".join(chr(97 + int(c)) for c in rng.integers(0, 26, 5))
+                for _ in range(max(1, w // 80))
+            )
+            cv2.putText(
+                img,
+                words,
+                (x + 10, line_y),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                (30, 30, 30),
+                1,
+                cv2.LINE_AA,
+            )
+    noise = rng.integers(-6, 7, img.shape, dtype=np.int16)
+    img = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    pos = (width * 3 // 5, height * 3 // 5)
+    draw_button(img, *pos)
+    return img, pos
+
+
+def write_templates(directory: str, screen, pos, count: int) -> list[str]:
+    """
+    Write count template examples: the button cut from the screen, then
+    variants of it in other shades.
+    """
+    x, y = pos
+    w, h = BUTTON_SIZE
+    paths = []
+    for i in range(count):
+        if i == 0:
+            example = screen[y - 2 : y + h + 3, x - 2 : x + w + 3]
+        else:
+            example = np.zeros((h + 5, w + 5, 3), np.uint8)
+            draw_button(example, 2, 2, shade=min(30 * i, 150))
+        path = os.path.join(directory, f"ex{i}.png")
+        cv2.imwrite(path, example)
+        paths.append(path)
+    return paths
+
+
+def recorded_screens(directory: str) -> dict:
+    screens = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        if not path.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        img = cv2.imread(path)
+        h, w = img.shape[:2]
+        bw, bh = BUTTON_SIZE
+        screens[os.path.basename(path)] = (img, ((w - bw) // 2, (h - bh) // 2))
+    return screens
+
+
+def crop_region(screen, pos, fraction: float):
+    """
+    Returns:
+        tuple: (part of the screen of the given size around pos, its origin)
+    """
+    if fraction >= 1.0:
+        return screen, (0, 0)
+    h, w = screen.shape[:2]
+    rw, rh = int(w * fraction), int(h * fraction)
+    x = min(max(0, pos[0] - rw // 2), w - rw)
+    y = min(max(0, pos[1] - rh // 2), h - rh)
+    return screen[y : y + rh, x : x + rw], (x, y)
+
+
+def time_match(screen, pos, paths, case: dict, repeat: int) -> dict:
+    region, origin = crop_region(screen, pos, REGIONS[case["region"]])
+    n = case["scales"]
+    scales = [1.0] if n == 1 else np.linspace(0.8, 1.2, n)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        haystack = cv2.resize(
+            region, None, fx=DOWNSCALE, fy=DOWNSCALE, interpolation=cv2.INTER_AREA
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            hits = locate_template_in_image(
+                haystack,
+                paths,
+                scales=scales,
+                threshold=case["threshold"],
+                template_scale=DOWNSCALE,
+                pyramid_levels=case["pyramid"],
+            )
+        timings.append(time.perf_counter() - start)
+
+    bw, bh = BUTTON_SIZE
+    want = (pos[0] - origin[0] + bw / 2, pos[1] - origin[1] + bh / 2)
+    found = any(
+        abs(hit.center[0] / DOWNSCALE - want[0]) < 10
+        and abs(hit.center[1] / DOWNSCALE - want[1]) < 10
+        for hit in hits
+    )
+    return {
+        "best_ms": min(timings) * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "hits": len(hits),
+        "found": found,
+    }
+
+
+def match_cases(screens: dict, workdir: str, repeat: int) -> list[dict]:
+    cases = []
+    axes = [
+        ("resolution", list(screens)),
+        ("templates", TEMPLATE_COUNTS),
+        ("scales", SCALE_COUNTS),
+        ("region", list(REGIONS)),
+        ("threshold", THRESHOLDS),
+    ]
+    base = dict(BASE)
+    if base["resolution"] not in screens:
+        base["resolution"] = next(iter(screens))
+    for axis, values in axes:
+        for value in values:
+            case = dict(base, **{axis: value})
+            screen, pos = screens[case["resolution"]]
+            directory = tempfile.mkdtemp(dir=workdir)
+            paths = write_templates(directory, screen, pos, case["templates"])
+            result = time_match(screen, pos, paths, case, repeat)
+            cases.append({"axis": axis, "value": value, **case, **result})
+    # coarse-to-fine pays off most on large screens, so try it on each
+    for name in screens:
+        for levels in PYRAMID_LEVELS[1:]:
+            case = dict(base, resolution=name, pyramid=levels)
+            screen, pos = screens[name]
+            directory = tempfile.mkdtemp(dir=workdir)
+            paths = write_templates(directory, screen, pos, case["templates"])
+            result = time_match(screen, pos, paths, case, repeat)
+            cases.append(
+                {"axis": "pyramid", "value": f"{name} L{levels}", **case, **result}
+            )
+    return cases
+
+
+def ocr_cases(screens: dict, repeat: int) -> list[dict]:
+    from macroni.util.ocr import find_text_in_image, get_reader
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_reader()
+    name = BASE["resolution"] if BASE["resolution"] in screens else next(iter(screens))
+    screen, pos = screens[name]
+    cases = []
+    for region in REGIONS:
+        for upscale in UPSCALES:
+            img, _ = crop_region(screen, pos, REGIONS[region])
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = find_text_in_image(img, 0.45, BUTTON_TEXT, upscale)
+                timings.append(time.perf_counter() - start)
+            cases.append(
+                {
+                    "axis": "ocr",
+                    "value": f"{region} x{upscale:g}",
+                    "resolution": name,
+                    "best_ms": min(timings) * 1000,
+                    "mean_ms": statistics.mean(timings) * 1000,
+                    "hits": len(results or []),
+                    "found": bool(results),
+                }
+            )
+    return cases
+
+
+def print_table(cases: list[dict]):
+    print(
+        f"{'axis':<11} {'value':<14} {'best ms':>9} {'mean ms':>9} "
+        f"{'hits':>5} {'found':>6}"
+    )
+    for case in cases:
+        print(
+            f"{case['axis']:<11} {str(case['value']):<14} {case['best_ms']:>9.1f} "
+            f"{case['mean_ms']:>9.1f} {case['hits']:>5} "
+            f"{'yes' if case['found'] else 'NO':>6}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--images", help="directory of recorded screenshots")
+    parser.add_argument("--ocr", action="store_true", help="also time OCR")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.images:
+        screens = recorded_screens(args.images)
+        if not screens:
+            parser.error(f"no PNG/JPG images in {args.images}")
+    else:
+        screens = {name: synthetic_screen(w, h) for name, (w, h) in RESOLUTIONS.items()}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = match_cases(screens, workdir, args.repeat)
+    if args.ocr:
+        try:
+            import easyocr  # noqa: F401
+        except ImportError:
+            print("OCR skipped: easyocr is not installed")
+        else:
+            cases += ocr_cases(screens, args.repeat)
+
+    print_table(cases)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(cases, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
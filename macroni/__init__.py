@@ -0,0 +1,14 @@
+from macroni.interpreter.registry import builtin, register_builtin
+from macroni.interpreter.plugins import load_plugins
+
+# the embedding API needs the parser and the engines, which the CLI only
+# imports once it knows what to run
+_EMBED = ("compile", "Program", "RunResult", "ScriptTimeout")
+
+
+def __getattr__(name):
+    if name in _EMBED:
+        from macroni import embed
+
+        return getattr(embed, name)
+    raise AttributeError(f"module 'macroni' has no attribute {name!r}")
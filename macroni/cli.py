@@ -9,21 +9,17 @@ COLORS = {
     "white": "\033[37m",
 }
 
-print(
-    f"{COLORS["yellow"]}Importing dependencies, this may take a moment especially the first time...{COLORS['reset']}"
-)
 import click
 
 try:
     import readline
 except ImportError:
     import pyreadline3
-from macroni.interpreter.macroni_interpret import Interpreter
-from macroni.interpreter.macroni_interpret import DBG
-from macroni.interpreter.grammar import calc_parser
-from macroni.interpreter.types import ExecutionContext
+from macroni.interpreter.types import ENGINES, ExecutionContext
 
-print(f"{COLORS['green']}Dependencies loaded{COLORS['reset']}")
+# The interpreter, parser and transpiler are imported where they are used,
+# so `macroni run --daemon` only pays for click and a socket before handing
+# the script to the warm process.
 
 STMT_STACK = []
 
@@ -44,15 +40,19 @@ def count_brackets(text):
     return len(stack)
 
 
-def run_interactive(debug=False):
+def run_interactive(debug=False, engine="compiled"):
     """Run macroni in interactive mode."""
+    from macroni.interpreter import parse_cache, plugins
+    from macroni.interpreter.macroni_interpret import Interpreter
+
+    plugins.load_plugins()
     print("Macroni Interactive Mode")
     print("Enter code (will execute when brackets/braces are balanced)")
     print()
 
-    interp = Interpreter()
+    interp = Interpreter(engine=engine, debug=debug)
     # Create a persistent context to maintain variables between commands
-    persistent_context = ExecutionContext(debug=debug, eval_cback=interp.eval)
+    persistent_context = ExecutionContext(debug=debug, eval_cback=interp.execute)
 
     while True:
         try:
@@ -83,10 +83,10 @@ def run_interactive(debug=False):
 
             # Parse and execute the accumulated code
             if buffer.strip():
-                tree = calc_parser.parse(buffer)
+                tree = parse_cache.parse(buffer)
                 # Update the node in the persistent context and execute
                 persistent_context.node = tree
-                result = interp.eval(persistent_context)
+                result = interp.execute(persistent_context)
                 if result is not None:
                     print(result)
 
@@ -103,7 +103,7 @@ def run_interactive(debug=False):
             continue
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option(
     "-f",
     "--file",
@@ -120,57 +120,330 @@ def run_interactive(debug=False):
     "-b",
     "--breakpoints",
     multiple=True,
-    help="List of breakpoints to set in the script (by line number).",
+    help='Breakpoint to set in the script: a line number, optionally with a condition ("42 if i > 100").',
+)
+@click.option(
+    "-e",
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="compiled",
+    show_default=True,
+    help="Evaluation engine: compiled closures, the same on an explicit stack "
+    "(no recursion limit), or the reference tree-walker.",
+)
+@click.option(
+    "--preload",
+    is_flag=True,
+    help="Load OCR, OpenCV and input libraries at startup instead of on first use.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Time every line, function and builtin; print a table at exit.",
+)
+@click.option(
+    "--sample",
+    is_flag=True,
+    help="Sample the call stack in the background (low overhead; SIGUSR1 dumps).",
+)
+@click.option(
+    "--sample-interval",
+    type=click.FloatRange(min=0.1),
+    default=10.0,
+    show_default=True,
+    help="Milliseconds between samples.",
+)
+@click.option(
+    "--profile-output",
+    type=click.Path(dir_okay=False),
+    help="Collapsed-stack file for flamegraph tools [default: <script>.collapsed].",
+)
+@click.option(
+    "--plugins",
+    "plugin_dirs",
+    multiple=True,
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory of Python plugins defining builtins (also MACRONI_PLUGIN_PATH).",
+)
+@click.option(
+    "--screen",
+    "screen_spec",
+    help="Read the screen from an image, a directory of frames or a video "
+    "instead of the display (each capture takes the next frame).",
+)
+@click.option(
+    "--screen-loop",
+    is_flag=True,
+    help="Start --screen frames over at the end instead of failing.",
 )
-def main(filepath, debug, breakpoints: list):
+@click.pass_context
+def main(
+    ctx,
+    filepath,
+    debug,
+    breakpoints: list,
+    engine,
+    preload,
+    profile,
+    sample,
+    sample_interval,
+    profile_output,
+    plugin_dirs,
+    screen_spec,
+    screen_loop,
+):
     """Run a macroni script from a file or start interactive mode."""
+    if plugin_dirs:
+        from macroni.interpreter import plugins
+
+        plugins.load_plugins(plugin_dirs)
+    if screen_spec:
+        from macroni.util import screen
+
+        try:
+            screen.set_source(screen.open_source(screen_spec, loop=screen_loop))
+        except Exception as e:
+            raise click.BadParameter(str(e), param_hint="--screen")
+    if ctx.invoked_subcommand is not None:
+        return
     print(
         f"{COLORS['cyan']}For documentation and guidelines, visit: https://github.com/srschreiber/macroni\nFeel free to report issues or contribute!{COLORS['reset']}"
     )
+    if preload:
+        from macroni.interpreter.macroni_interpret import preload as preload_all
+
+        print(f"{COLORS['yellow']}Loading dependencies...{COLORS['reset']}")
+        preload_all()
+        print(f"{COLORS['green']}Dependencies loaded{COLORS['reset']}")
+
     # If no file provided, start interactive mode
     if not filepath:
-        run_interactive(debug=debug)
+        run_interactive(debug=debug, engine=engine)
         return
 
-    # Read the script from the file
-    with open(filepath, "r") as f:
-        script_content = f.read()
+    if debug:
+        from macroni.interpreter.macroni_interpret import DBG
+
+        try:
+            DBG.set_breakpoints(list(breakpoints))
+        except Exception as e:
+            raise click.BadParameter(str(e), param_hint="--breakpoints")
+
+    run_profiled(
+        filepath,
+        profile_output,
+        engine=engine,
+        debug=debug,
+        profile=profile,
+        sample=sample,
+        interval_ms=sample_interval,
+    )
+
+
+def run_file(filepath, engine="compiled", debug=False, profiler=None, sampler=None):
+    """Run a macroni script file and return the value of its last statement."""
+    from macroni.interpreter import aot, modules, plugins
+    from macroni.interpreter.macroni_interpret import Interpreter
+
+    plugins.load_plugins()
+    program = modules.load_program(filepath)
+    if sampler is not None:
+        sampler.add_program(program)
+
+    interp = Interpreter(engine=engine, profiler=profiler, debug=debug)
+    sampling = sampler is not None and sampler.running
+    if not debug and engine == "compiled" and profiler is None and not sampling:
+        # use the artifact of `macroni compile` if the sources are unchanged
+        code = aot.load_cache(filepath, program.digest)
+        if code is not None:
+            return aot.run_code(code, interp)
 
     if debug:
-        DBG.set_breakpoints(list(breakpoints))
-
-    # Parse and execute the script
-    interp = Interpreter()
-    tree = calc_parser.parse(script_content)
-    imps = get_import_paths(tree)
-    imported_scripts = []
-    for imp in imps:
-        with open(imp, "r") as f:
-            imported_scripts.append(f.read())
-    prepended_imps = "\n".join(imported_scripts)
-    script_with_imports = prepended_imps + "\n" + script_content
-    # parse the combined script
-    tree = calc_parser.parse(script_with_imports)
-    # load all of the imported modules and prepend them to the script_content
-
-    root_context = ExecutionContext(node=tree, debug=debug, eval_cback=interp.eval)
-    interp.eval(root_context)
-
-
-def get_import_paths(node):
-    """Recursively extract import paths from the AST node."""
-    import_paths = []
-
-    if hasattr(node, "data") and node.data == "import_stmt":
-        # Extract the string value (import path)
-        import_path = node.children[0].value.strip('"').strip("'")
-        import_paths.append(import_path)
-
-    # Recursively check child nodes
-    for child in getattr(node, "children", []):
-        import_paths.extend(get_import_paths(child))
-
-    return import_paths
+        from macroni.interpreter.macroni_interpret import DBG
+
+        DBG.resolve(program.main.tree)
+
+    root_context = ExecutionContext(
+        node=program.main.tree, debug=debug, eval_cback=interp.execute
+    )
+    return interp.run_program(root_context, program)
+
+
+def run_profiled(
+    filepath,
+    output=None,
+    engine="compiled",
+    debug=False,
+    profile=False,
+    sample=False,
+    interval_ms=10.0,
+):
+    """
+    Run a script file with the instrumenting profiler (profile) or the
+    sampling profiler (sample), then report where the time went.
+
+    SIGUSR1 starts the sampling profiler in any run, or dumps its profile
+    so far, without stopping the script.
+    """
+    import os
+    from macroni.interpreter.profiler import Profiler
+    from macroni.interpreter.sampler import Sampler, install_dump_signal
+
+    if profile and engine != "compiled":
+        raise click.UsageError("--profile needs the compiled engine")
+    if profile and sample:
+        raise click.UsageError("--profile and --sample cannot be combined")
+    output = output or os.path.splitext(os.path.basename(filepath))[0] + ".collapsed"
+    profiler = Profiler() if profile else None
+    sampler = Sampler(interval=interval_ms / 1000)
+    install_dump_signal(sampler, output)
+    if sample:
+        sampler.start()
+    try:
+        return run_file(
+            filepath, engine=engine, debug=debug, profiler=profiler, sampler=sampler
+        )
+    finally:
+        # also when the script fails or is interrupted
+        sampler.stop()
+        if profiler is not None or sampler.total:
+            report = profiler if profiler is not None else sampler
+            print(f"\n{COLORS['cyan']}Profile (wall time):{COLORS['reset']}")
+            print(report.table())
+            report.write_collapsed(output)
+            print(f"Collapsed stacks written to {output} (e.g. flamegraph.pl {output})")
+
+
+@main.command("compile")
+@click.argument("filepath", type=click.Path(exists=True))
+@click.option("--show-source", is_flag=True, help="Print the generated Python source.")
+def compile_command(filepath, show_source):
+    """Compile a script ahead of time; `macroni --file` then runs the cached code."""
+    from macroni.interpreter import aot, modules, plugins
+    from macroni.interpreter.macroni_interpret import BUILTINS
+    from macroni.interpreter.transpiler import Transpiler
+
+    try:
+        # plugin builtins are bound by name in the generated code
+        plugins.load_plugins()
+        program = modules.load_program(filepath)
+        source = Transpiler(BUILTINS).transpile(program.flatten())
+    except Exception as e:
+        raise click.ClickException(f"Cannot compile {filepath}: {e}")
+    if show_source:
+        print(source)
+    code = compile(source, filepath, "exec")
+    path = aot.cache_path(filepath, program.digest)
+    aot.write_cache(path, code)
+    print(f"{COLORS['green']}Compiled {filepath} -> {path}{COLORS['reset']}")
+
+
+@main.command("run")
+@click.argument("filepath", type=click.Path(exists=True))
+@click.option(
+    "-e",
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="compiled",
+    show_default=True,
+    help="Evaluation engine: compiled closures, the same on an explicit stack "
+    "(no recursion limit), or the reference tree-walker.",
+)
+@click.option(
+    "--daemon", is_flag=True, help="Run the script in a `macroni serve` process."
+)
+@click.option("--socket", "socket_path", help="Socket of the daemon.")
+def run_command(filepath, engine, daemon, socket_path):
+    """Run a script, locally or in a warm daemon."""
+    if not daemon:
+        run_file(filepath, engine=engine)
+        return
+    from macroni import daemon as macroni_daemon
+
+    ok = macroni_daemon.run_remote(
+        filepath, engine=engine, socket_path=socket_path or macroni_daemon.SOCKET_PATH
+    )
+    if not ok:
+        raise SystemExit(1)
+
+
+@main.command("test")
+@click.argument("paths", nargs=-1, type=click.Path(exists=True))
+@click.option(
+    "-e",
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="compiled",
+    show_default=True,
+    help="Evaluation engine to run the tests with.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Worker processes; 1 runs every test in this process.",
+)
+@click.option(
+    "--preload",
+    is_flag=True,
+    help="Load OCR, OpenCV and input libraries once per process up front.",
+)
+@click.option("-v", "--verbose", is_flag=True, help="Show the output of passing tests.")
+@click.pass_context
+def test_command(ctx, paths, engine, jobs, preload, verbose):
+    """Run test scripts (tests/test_*.macroni by default) in a warm process."""
+    import time
+    from macroni import testrunner
+
+    scripts = testrunner.discover(paths or ["tests"])
+    if not scripts:
+        raise click.ClickException("No test_*.macroni scripts found")
+
+    def report(result):
+        status = (
+            f"{COLORS['green']}PASS" if result.ok else f"{COLORS['red']}FAIL"
+        ) + COLORS["reset"]
+        print(f"{status} {result.seconds:8.3f}s  {result.path}")
+        if not result.ok:
+            print(f"     {result.error}")
+        if result.output and (verbose or not result.ok):
+            for line in result.output.rstrip().splitlines():
+                print(f"     | {line}")
+
+    start = time.perf_counter()
+    results = testrunner.run_tests(
+        scripts,
+        engine=engine,
+        jobs=jobs,
+        plugin_dirs=ctx.parent.params["plugin_dirs"],
+        preload=preload,
+        on_result=report,
+    )
+    failed = [r for r in results if not r.ok]
+    print(
+        f"\n{len(results) - len(failed)} passed, {len(failed)} failed "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    for result in failed:
+        print(f"  FAILED {result.path}: {result.error}")
+    if failed:
+        raise SystemExit(1)
+
+
+@main.command("serve")
+@click.option("--socket", "socket_path", help="Socket to listen on.")
+@click.option(
+    "--lazy",
+    is_flag=True,
+    help="Do not load OCR, OpenCV and input libraries until a script needs them.",
+)
+def serve_command(socket_path, lazy):
+    """Keep an interpreter warm and run scripts sent by `macroni run --daemon`."""
+    from macroni import daemon as macroni_daemon
+
+    macroni_daemon.serve(socket_path or macroni_daemon.SOCKET_PATH, preload=not lazy)
 
 
 if __name__ == "__main__":
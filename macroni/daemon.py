@@ -0,0 +1,187 @@
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+import traceback
+from macroni.cli import COLORS, run_file
+
+SOCKET_PATH = os.environ.get("MACRONI_SOCKET") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+    f"macroni-{os.getuid()}.sock" if hasattr(os, "getuid") else "macroni.sock",
+)
+
+# Protocol: one JSON object per line in both directions.
+#   client -> daemon: {"script": path, "cwd": dir, "engine": name}
+#   daemon -> client: {"stdout": text} ..., then
+#                     {"ok": bool, "value": repr or null, "error": text or null,
+#                      "seconds": float}
+
+
+class _StdoutStream(io.TextIOBase):
+    """
+    Sends everything the script prints to the client as it is printed.
+    """
+
+    def __init__(self, out):
+        self._out = out
+        self.connected = True
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text and self.connected:
+            try:
+                _send(self._out, {"stdout": text})
+            except OSError:
+                # client went away, the script still runs to completion
+                self.connected = False
+        return len(text)
+
+
+def serve(socket_path: str = SOCKET_PATH, preload: bool = True):
+    """
+    Run scripts sent by run_remote, one at a time, in this process.
+
+    Imported modules, the OCR model, the LALR parser and parsed programs
+    stay loaded between scripts. Every script still gets its own
+    Interpreter, so no variables or settings leak from one to the next.
+    """
+    _require_unix_sockets()
+    from macroni.interpreter import plugins
+
+    # report a broken plugin now rather than to the first client
+    plugins.load_plugins()
+    if preload:
+        from macroni.interpreter.macroni_interpret import preload as preload_all
+
+        print(f"{COLORS['yellow']}Loading dependencies...{COLORS['reset']}")
+        try:
+            preload_all()
+        except ImportError as e:
+            print(f"Warning: could not preload dependencies ({e})")
+
+    _remove_stale_socket(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        # created 0600 so no other user can connect, even before listen()
+        umask = os.umask(0o177)
+        try:
+            server.bind(socket_path)
+        finally:
+            os.umask(umask)
+        server.listen()
+        print(f"{COLORS['green']}Serving on {socket_path}{COLORS['reset']}")
+        try:
+            while True:
+                conn, _ = server.accept()
+                with conn, conn.makefile("rw", encoding="utf-8") as stream:
+                    _handle(stream)
+        except KeyboardInterrupt:
+            print("\nStopping...")
+        finally:
+            with contextlib.suppress(OSError):
+                os.unlink(socket_path)
+
+
+def run_remote(filepath: str, engine: str = "compiled", socket_path=SOCKET_PATH):
+    """
+    Run filepath in the daemon listening on socket_path, printing its output
+    as it arrives.
+
+    Returns:
+        bool: True if the script finished without an error
+    """
+    _require_unix_sockets()
+    request = {
+        "script": os.path.abspath(filepath),
+        "cwd": os.getcwd(),
+        "engine": engine,
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        try:
+            conn.connect(socket_path)
+        except OSError as e:
+            raise SystemExit(
+                f"Cannot reach macroni daemon at {socket_path} ({e}). "
+                "Start it with `macroni serve`."
+            )
+        with conn.makefile("rw", encoding="utf-8") as stream:
+            _send(stream, request)
+            for line in stream:
+                msg = json.loads(line)
+                if "stdout" in msg:
+                    print(msg["stdout"], end="", flush=True)
+                    continue
+                if msg["error"]:
+                    print(msg["error"], end="", file=sys.stderr, flush=True)
+                return msg["ok"]
+    print("Error: macroni daemon closed the connection")
+    return False
+
+
+def _handle(stream):
+    line = stream.readline()
+    if not line:
+        return
+    start = time.perf_counter()
+    result = {"ok": True, "value": None, "error": None}
+    cwd = os.getcwd()
+    out = _StdoutStream(stream)
+    try:
+        request = json.loads(line)
+        # scripts resolve imports, templates and caches relative to the client
+        os.chdir(request["cwd"])
+        with contextlib.redirect_stdout(out):
+            value = run_file(
+                request["script"], engine=request.get("engine", "compiled")
+            )
+        result["value"] = repr(value) if value is not None else None
+    except KeyboardInterrupt:
+        raise
+    except BaseException:
+        # SystemExit from a script (e.g. through a native call) fails that
+        # request; the daemon keeps serving
+        result["ok"] = False
+        result["error"] = traceback.format_exc()
+    finally:
+        os.chdir(cwd)
+    result["seconds"] = time.perf_counter() - start
+    if out.connected:
+        with contextlib.suppress(OSError):
+            _send(stream, result)
+    status = "ok" if result["ok"] else "failed"
+    print(f"{_request_name(line)}: {status} in {result['seconds'] * 1000:.1f} ms")
+
+
+def _request_name(line: str) -> str:
+    try:
+        return json.loads(line)["script"]
+    except (ValueError, KeyError, TypeError):
+        return "<invalid request>"
+
+
+def _send(stream, msg: dict):
+    stream.write(json.dumps(msg) + "\n")
+    stream.flush()
+
+
+def _remove_stale_socket(socket_path: str):
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            # nobody is listening, left over from a daemon that died
+            os.unlink(socket_path)
+            return
+    raise SystemExit(f"A macroni daemon is already serving on {socket_path}")
+
+
+def _require_unix_sockets():
+    if not hasattr(socket, "AF_UNIX"):
+        raise SystemExit("Daemon mode needs Unix domain sockets")
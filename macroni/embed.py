@@ -0,0 +1,152 @@
+import contextlib
+import ctypes
+import dataclasses
+import io
+import threading
+import time
+from typing import Any, Iterable
+from macroni.interpreter import modules, plugins
+from macroni.interpreter.macroni_interpret import Interpreter
+from macroni.interpreter.types import ExecutionContext, ScriptTimeout
+
+
+@dataclasses.dataclass
+class RunResult:
+    # value of the last statement (None if the script failed)
+    value: Any = None
+    # everything the script printed, unless output was not captured
+    output: str = ""
+    # the script's top-level variables when it stopped
+    globals: dict = dataclasses.field(default_factory=dict)
+    # what stopped the script, a ScriptTimeout if it ran out of time
+    error: Exception | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class Program:
+    """
+    A script parsed, resolved and compiled once, to be run any number of
+    times from Python. Create it with compile().
+
+    Every run starts from fresh variables and settings; only the compiled
+    code is shared. Runs of one program must not overlap.
+    """
+
+    def __init__(self, program: modules.Program, engine: str = "compiled"):
+        start = time.perf_counter()
+        self.program = program
+        self.engine = engine
+        self._interp = Interpreter(engine=engine)
+        if engine != "tree":
+            # compile everything now instead of during the first run
+            compiler = self._interp.compiler
+            for module in program.imports:
+                compiler.source = module.path
+                for name, (params, body) in module.functions.items():
+                    compiler.function(name, params, body)
+                compiler.compile(module.body)
+            compiler.source = program.main.path
+            compiler.compile(program.main.tree)
+        self.compile_seconds = time.perf_counter() - start
+
+    def run(
+        self,
+        globals: dict | None = None,
+        timeout: float | None = None,
+        capture_output: bool = True,
+    ) -> RunResult:
+        """
+        Run the program once.
+
+        Args:
+            globals: variables defined before the script starts. Values are
+                passed as they are, so lists the script changes are changed
+                for the caller too.
+            timeout: seconds after which the script is stopped. A builtin
+                blocked in C (e.g. @wait) finishes its call first.
+            capture_output: collect what the script prints in the result
+                instead of writing it to stdout
+
+        Returns:
+            RunResult: errors are reported in it rather than raised
+        """
+        result = RunResult()
+        self._interp.reset()
+        context = ExecutionContext(
+            node=self.program.main.tree,
+            vars=dict(globals or {}),
+            eval_cback=self._interp.execute,
+        )
+        output = io.StringIO()
+        redirect = (
+            contextlib.redirect_stdout(output)
+            if capture_output
+            else contextlib.nullcontext()
+        )
+        start = time.perf_counter()
+        try:
+            with redirect, _deadline(timeout):
+                result.value = self._interp.run_program(context, self.program)
+        except ScriptTimeout:
+            result.error = ScriptTimeout(f"Script timed out after {timeout} s")
+        except Exception as e:
+            result.error = e
+        result.seconds = time.perf_counter() - start
+        result.output = output.getvalue()
+        result.globals = context.vars
+        return result
+
+
+def compile(
+    source: str,
+    imports: Iterable[str] = (),
+    filename: str = "<string>",
+    engine: str = "compiled",
+) -> Program:
+    """
+    Parse a script, load what it imports and compile it, for Program.run.
+
+    Args:
+        source: the script
+        imports: paths of scripts imported before the script's own imports
+        filename: where the script would be, for resolving its imports
+        engine: one of types.ENGINES
+
+    Raises:
+        Exception: if the script does not parse or an import fails
+    """
+    plugins.load_plugins()
+    return Program(modules.program_from_source(source, filename, imports), engine)
+
+
+@contextlib.contextmanager
+def _deadline(timeout: float | None):
+    # raises ScriptTimeout in this thread, wherever it is, once timeout passes
+    if timeout is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    lock = threading.Lock()
+    running = True
+
+    def expire():
+        with lock:
+            if running:
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(thread_id),
+                    ctypes.py_object(ScriptTimeout),
+                )
+
+    timer = threading.Timer(timeout, expire)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    finally:
+        with lock:
+            running = False
+        timer.cancel()
@@ -0,0 +1,140 @@
+import importlib.util
+import marshal
+import os
+from types import CodeType
+from typing import Any
+from .compiler import (
+    CompiledFunction,
+    bind_outer,
+    call_function,
+    define_function,
+    destructure,
+    foreach_tick,
+    index_value,
+    load_name,
+    read_outer,
+    write_outer,
+)
+from .parse_cache import CACHE_DIR, parse_source
+from .registry import Builtin, lookup
+from .resolver import Scope
+from .transpiler import Transpiler
+from .types import ExecutionContext, ControlSignal, RET_SIG, UNSET
+
+# bump when the generated code changes shape, so stale artifacts are ignored
+TRANSPILER_VERSION = 3
+MAGIC = b"MCNI" + importlib.util.MAGIC_NUMBER + TRANSPILER_VERSION.to_bytes(2, "little")
+
+
+class Globals(dict):
+    """
+    Top-level variables of a transpiled script. Generated code reads them
+    with g[name], so a missing name must be a macroni error.
+    """
+
+    __slots__ = ()
+
+    def __missing__(self, name):
+        raise Exception(f"Variable not found: {name}")
+
+
+def transpile(source: str, builtins: dict[str, Builtin]) -> str:
+    """
+    Parse source and lower it into Python source.
+    """
+    return Transpiler(builtins).transpile(parse_source(source))
+
+
+def compile_source(source: str, filename: str, builtins: dict[str, Builtin]):
+    """
+    Transpile source and compile the result to a Python code object.
+    """
+    return compile(transpile(source, builtins), filename, "exec")
+
+
+def cache_path(script_path: str, digest: str) -> str:
+    """
+    Location of the compiled artifact for script_path, keyed by digest
+    (modules.Program.digest, which covers the script and its imports).
+    """
+    directory = os.path.join(os.path.dirname(os.path.abspath(script_path)), CACHE_DIR)
+    stem = os.path.splitext(os.path.basename(script_path))[0]
+    return os.path.join(directory, f"{stem}.{digest}.mbc")
+
+
+def write_cache(path: str, code: CodeType):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        marshal.dump(code, f)
+    os.replace(tmp, path)
+
+
+def load_cache(script_path: str, digest: str) -> CodeType | None:
+    """
+    Returns:
+        The cached code object for this exact program, or None.
+    """
+    path = cache_path(script_path, digest)
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def runtime_namespace(interp) -> dict:
+    """
+    Globals the generated module runs with.
+    """
+    return {
+        "__builtins__": __builtins__,
+        "ControlSignal": ControlSignal,
+        "RET_SIG": RET_SIG,
+        "UNSET": UNSET,
+        "Scope": Scope,
+        "CompiledFunction": CompiledFunction,
+        "_builtin": lambda name: lookup(name).bind(interp),
+        "_call": call_function,
+        "_define": define_function,
+        "_bind_outer": bind_outer,
+        "_read_outer": read_outer,
+        "_write_outer": write_outer,
+        "_destructure": destructure,
+        "_foreach_tick": foreach_tick,
+        "_index": index_value,
+        "_load_name": load_name,
+        "_eq": _eq,
+        "_ne": _ne,
+        "_fail": _fail,
+    }
+
+
+def run_code(code: CodeType, interp) -> Any:
+    """
+    Execute a transpiled script in a fresh root context.
+    """
+    namespace = runtime_namespace(interp)
+    exec(code, namespace)
+    ctx = ExecutionContext(vars=Globals(), eval_cback=interp.execute)
+    return namespace["_main"](ctx)
+
+
+def _eq(a: Any, b: Any) -> int:
+    # check for null comparison
+    if a is None or b is None:
+        return 1 if a is b else 0
+    return 1 if a == b else 0
+
+
+def _ne(a: Any, b: Any) -> int:
+    if a is None or b is None:
+        return 0 if a is b else 1
+    return 1 if a != b else 0
+
+
+def _fail(message: str):
+    raise Exception(message)
@@ -0,0 +1,754 @@
+import ast
+from typing import Any, Callable
+from lark import Tree, Token
+from .types import (
+    ExecutionContext,
+    ControlSignal,
+    RET_SIG,
+    BRK_SIG,
+    EXIT_SIG,
+    CNT_SIG,
+    UNSET,
+    ScriptTimeout,
+)
+from .profiler import BUILTIN, FUNCTION, LINE, line_label
+from .registry import Builtin, name_of
+from .resolver import FRAME_NAMES, Scope, resolve_function
+
+# A compiled node: takes the execution context and returns the node's value
+Code = Callable[[ExecutionContext], Any]
+
+
+class Compiler:
+    """
+    Turns a Lark tree into a tree of pre-bound Python closures.
+
+    Every node is inspected once at compile time. Running the result only
+    calls closures, instead of re-matching node.data/node.children on every
+    visit like Interpreter.eval does. Semantics must stay identical to the
+    tree-walking engine, which is kept as the reference implementation.
+    """
+
+    def __init__(self, interp, debugger, builtins: dict[str, Builtin]):
+        self.interp = interp
+        self.debugger = debugger
+        # name -> Builtin (registry.BUILTINS), resolved per call site
+        self.builtins = builtins
+        # (id(node), scope) -> (node, code); the node is kept so its id
+        # stays unique, and the scope since slot indices differ per layout
+        self._cache: dict[tuple[int, Scope | None], tuple[Any, Code]] = {}
+        # id(body) -> function compiled from it
+        self._functions: dict[int, CompiledFunction] = {}
+        # scope of the function body being compiled, None at top level
+        self._scope: Scope | None = None
+        # profiler.Profiler to instrument the code with, if any
+        self.profiler = None
+        # file the code being compiled comes from, to label profiled lines
+        self.source: str | None = None
+        # compile debugger hooks into statement blocks (--debug)
+        self.debug = False
+
+    def compile(self, node: Any, scope: Scope | None = None) -> Code:
+        """
+        Compile node for execution in a context laid out by scope
+        (None for top-level code, where variables live in ctx.vars).
+        """
+        saved = self._scope
+        self._scope = scope
+        try:
+            return self._code(node)
+        finally:
+            self._scope = saved
+
+    def function(self, name: str, params: list[str], body: Tree) -> "CompiledFunction":
+        """
+        Compile a function definition (once per body).
+        """
+        hit = self._functions.get(id(body))
+        if hit is not None and hit.body is body and hit.name == name:
+            return hit
+        scope = resolve_function(name, params, body)
+        code = self.compile(body, scope)
+        if self.profiler is not None:
+            code = self.profiler.wrap(FUNCTION, f"{name}()", code)
+        fn = CompiledFunction(name, params, body, scope, code)
+        self._functions[id(body)] = fn
+        return fn
+
+    def _code(self, node: Any) -> Code:
+        key = (id(node), self._scope)
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] is node:
+            return hit[1]
+        code = self._compile(node)
+        self._cache[key] = (node, code)
+        return code
+
+    def _compile(self, node: Any) -> Code:
+        if isinstance(node, Token):
+            return self._compile_token(node)
+
+        if isinstance(node, Tree):
+            handler = getattr(self, f"_c_{node.data}", None)
+            if handler is not None:
+                return handler(node, node.children)
+            # passthrough for inlined rules
+            if len(node.children) == 1:
+                return self._code(node.children[0])
+            return _fail(f"Unknown tree node: {node.data}")
+
+        return _fail(f"Unknown node type: {type(node)}")
+
+    def _compile_token(self, node: Token) -> Code:
+        match node.type:
+            case "NUMBER":
+                val = float(node)
+                return _const(int(val) if val.is_integer() else val)
+            case "STRING":
+                return _const(ast.literal_eval(str(node)))
+            case "NAME":
+                return self._compile_load(str(node))
+        return _const(str(node))
+
+    def _c_builtin(self, node, c) -> Code:
+        # looked up and checked once here, then called directly
+        found = self.builtins.get(name_of(node))
+        if found is None:
+            return _fail(f"Unknown built-in: @{name_of(node)}")
+        items = [self._code(x) for x in c[1].children] if len(c) == 2 else []
+        error = found.check(len(items))
+        if error is not None:
+            return _fail(error)
+        fn = found.bind(self.interp)
+        if self.profiler is not None:
+            fn = self.profiler.wrap(BUILTIN, f"@{found.name}", fn)
+
+        match items:
+            case []:
+                return lambda ctx: fn()
+            case [x]:
+                return lambda ctx: fn(x(ctx))
+            case [x, y]:
+                return lambda ctx: fn(x(ctx), y(ctx))
+            case [x, y, z]:
+                return lambda ctx: fn(x(ctx), y(ctx), z(ctx))
+        return lambda ctx: fn(*[item(ctx) for item in items])
+
+    # ---------- variables ----------
+
+    def _compile_load(self, name: str) -> Code:
+        scope = self._scope
+
+        if scope is None:
+            # top level: variables live in ctx.vars
+            def load_global(ctx: ExecutionContext):
+                try:
+                    return ctx.vars[name]
+                except KeyError:
+                    raise Exception(f"Variable not found: {name}") from None
+
+            return load_global
+
+        i = scope.index.get(name)
+        if i is None:
+            # not assigned in this function: resolved through the callers
+            # if a frame may bind it, else read from the top level
+            if name in FRAME_NAMES:
+                return lambda ctx: ctx.lookup(name)
+            return lambda ctx: load_name(ctx, name)
+
+        if name in scope.outer:
+            return lambda ctx: read_outer(ctx, i, name)
+
+        def load_slot(ctx: ExecutionContext):
+            v = ctx.slots[i]
+            # not assigned yet, the caller's value is visible
+            return v if v is not UNSET else ctx.parent.lookup(name)
+
+        return load_slot
+
+    def _compile_store(self, name: str) -> Callable[[ExecutionContext, Any], None]:
+        scope = self._scope
+        i = scope.index.get(name) if scope is not None else None
+
+        if i is None:
+            if scope is not None:
+                # e.g. a debugger `eval` assigning in a function frame
+                FRAME_NAMES.add(name)
+
+            def store_var(ctx: ExecutionContext, val):
+                ctx.vars[name] = val
+
+            return store_var
+
+        if name in scope.outer:
+            return lambda ctx, val: write_outer(ctx, i, name, val)
+
+        def store_slot(ctx: ExecutionContext, val):
+            ctx.slots[i] = val
+
+        return store_slot
+
+    def _compile_store_single(self, name: str, expr: Code) -> Code:
+        scope = self._scope
+        i = scope.index.get(name) if scope is not None else None
+
+        if i is None:
+            if scope is not None:
+                FRAME_NAMES.add(name)
+
+            def run_var(ctx: ExecutionContext):
+                ctx.vars[name] = expr(ctx)
+
+            return run_var
+
+        if name not in scope.outer:
+
+            def run_slot(ctx: ExecutionContext):
+                ctx.slots[i] = expr(ctx)
+
+            return run_slot
+
+        store = self._compile_store(name)
+
+        def run_outer(ctx: ExecutionContext):
+            store(ctx, expr(ctx))
+
+        return run_outer
+
+    # ---------- statements ----------
+
+    def _c_import_stmt(self, node, c) -> Code:
+        # imports should be pre-loaded by now
+        return _const(None)
+
+    def _c_outer_stmt(self, node, c) -> Code:
+        if len(c) != 1:
+            return _unmatched(node)
+        name = str(c[0])
+        return lambda ctx: bind_outer(ctx, name)
+
+    def _c_stmt_block(self, node, c) -> Code:
+        stmts = [self._code(stmt) for stmt in c]
+        if self.profiler is not None:
+            stmts = [self._profile_line(n, stmt) for n, stmt in zip(c, stmts)]
+        pairs = list(zip(c, stmts))
+        if self.debug:
+            return self._debug_block(pairs)
+
+        def run(ctx: ExecutionContext):
+            last = 0
+            for stmt_node, stmt in pairs:
+                last = stmt(ctx)
+                if last.__class__ is ControlSignal and (
+                    last.signal is RET_SIG
+                    or last.signal is BRK_SIG
+                    or last.signal is CNT_SIG
+                ):
+                    return last
+            return last
+
+        return run
+
+    def _debug_block(self, pairs: list) -> Code:
+        # only compiled in with --debug, so normal runs pay nothing for it
+        at_statement = self.debugger.at_statement
+
+        def run(ctx: ExecutionContext):
+            last = 0
+            for stmt_node, stmt in pairs:
+                if ctx.debug:
+                    at_statement(ctx, stmt_node)
+                last = stmt(ctx)
+                if last.__class__ is ControlSignal and (
+                    last.signal is RET_SIG
+                    or last.signal is BRK_SIG
+                    or last.signal is CNT_SIG
+                ):
+                    return last
+            return last
+
+        return run
+
+    def _profile_line(self, node: Any, code: Code) -> Code:
+        label = line_label(self.source, node)
+        if label is None:
+            return code
+        return self.profiler.wrap(LINE, label, code)
+
+    def _c_params(self, node, c) -> Code:
+        params = [str(x) for x in c]
+        return lambda ctx: list(params)
+
+    def _c_store_val(self, node, c) -> Code:
+        num_names = 0
+        for i in range(len(c) - 1):
+            if isinstance(c[i], Token) and c[i].type == "NAME":
+                num_names += 1
+        names = [str(x) for x in c[:num_names]]
+        exprs = [self._code(e) for e in c[num_names:]]
+
+        if num_names == 1 and len(exprs) == 1:
+            return self._compile_store_single(names[0], exprs[0])
+
+        stores = [self._compile_store(name) for name in names]
+
+        def run(ctx: ExecutionContext):
+            vals = destructure([e(ctx) for e in exprs], num_names)
+            for store, val in zip(stores, vals):
+                store(ctx, val)
+            return None
+
+        return run
+
+    def _c_expr_stmt(self, node, c) -> Code:
+        if len(c) != 1:
+            return _unmatched(node)
+        return self._code(c[0])
+
+    def _c_return_stmt(self, node, c) -> Code:
+        if len(c) != 1:
+            return _unmatched(node)
+        expr = self._code(c[0])
+        return lambda ctx: ControlSignal(expr(ctx), RET_SIG)
+
+    def _c_break_stmt(self, node, c) -> Code:
+        return lambda ctx: ControlSignal([], BRK_SIG)
+
+    def _c_continue_stmt(self, node, c) -> Code:
+        return lambda ctx: ControlSignal([], CNT_SIG)
+
+    def _c_func_def(self, node, c) -> Code:
+        if not c:
+            return _unmatched(node)
+        name = str(c[0])
+        params = []
+        body = None
+        for child in c[1:]:
+            if isinstance(child, Tree) and child.data == "params":
+                params = [str(x) for x in child.children]
+            elif isinstance(child, Tree) and child.data == "stmt_block":
+                body = child
+        if body is None:
+            return _fail(f"Function body missing for {name}")
+        defined = f"Defined {name}({', '.join(params)})"
+        fn = self.function(name, params, body)
+
+        def run(ctx: ExecutionContext):
+            define_function(ctx, fn)
+            return defined
+
+        return run
+
+    def _c_loop_stmt(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        condition = self._code(c[0])
+        block = self._code(c[1])
+
+        def run(ctx: ExecutionContext):
+            while condition(ctx) != 0:
+                v = block(ctx)
+                if v.__class__ is ControlSignal:
+                    if v.signal is BRK_SIG:
+                        break
+                    if v.signal is RET_SIG:
+                        return v
+            return 0
+
+        return run
+
+    def _c_foreach_tick_func(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        tick_provider_name = str(c[0])
+        func_name = str(c[1])
+        return lambda ctx: foreach_tick(ctx, tick_provider_name, func_name)
+
+    # ---------- expressions ----------
+
+    def _c_conditional_expr(self, node, c) -> Code:
+        if len(c) == 2:
+            condition = self._code(c[0])
+            t_block = self._code(c[1])
+            return lambda ctx: t_block(ctx) if condition(ctx) else None
+        if len(c) == 3:
+            condition = self._code(c[0])
+            t_block = self._code(c[1])
+            f_block = self._code(c[2])
+            return lambda ctx: t_block(ctx) if condition(ctx) else f_block(ctx)
+        return _unmatched(node)
+
+    def _c_call(self, node, c) -> Code:
+        if len(c) == 2 and isinstance(c[1], Tree) and c[1].data == "args":
+            items = [self._code(x) for x in c[1].children]
+        elif len(c) == 1:
+            items = []
+        else:
+            return _fail("Invalid call syntax")
+        name = str(c[0])
+        return lambda ctx: call_function(ctx, name, [item(ctx) for item in items])
+
+    def _c_args(self, node, c) -> Code:
+        items = [self._code(x) for x in c]
+        return lambda ctx: [item(ctx) for item in items]
+
+    def _c_index(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        container_expr = self._code(c[0])
+        idx_expr = self._code(c[1])
+        return lambda ctx: index_value(container_expr(ctx), idx_expr(ctx))
+
+    def _c_and_op(self, node, c) -> Code:
+        if len(c) != 2:
+            return _fail("and_op requires exactly two operands")
+        left, right = self._code(c[0]), self._code(c[1])
+        return lambda ctx: (1 if right(ctx) else 0) if left(ctx) else 0
+
+    def _c_or_op(self, node, c) -> Code:
+        if len(c) != 2:
+            return _fail("or_op requires exactly two operands")
+        left, right = self._code(c[0]), self._code(c[1])
+        return lambda ctx: 1 if left(ctx) else (1 if right(ctx) else 0)
+
+    def _c_add(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+
+        def run(ctx: ExecutionContext):
+            a = left(ctx)
+            b = right(ctx)
+            if isinstance(a, str) or isinstance(b, str):
+                return str(a) + str(b)
+            return a + b
+
+        return run
+
+    def _c_sub(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+        return lambda ctx: left(ctx) - right(ctx)
+
+    def _c_neg(self, node, c) -> Code:
+        if len(c) != 1:
+            return _unmatched(node)
+        operand = self._code(c[0])
+        return lambda ctx: -operand(ctx)
+
+    def _c_mul(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+        return lambda ctx: left(ctx) * right(ctx)
+
+    def _c_div(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+        return lambda ctx: left(ctx) / right(ctx)
+
+    def _c_mod(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+
+        def run(ctx: ExecutionContext):
+            result = left(ctx) % right(ctx)
+            # Convert to int if result is a whole number
+            if isinstance(result, float) and result.is_integer():
+                return int(result)
+            return result
+
+        return run
+
+    def _c_const(self, node, c) -> Code:
+        # decoded and folded by folding.fold_constants
+        return _const(c[0])
+
+    def _c_null(self, node, c) -> Code:
+        return _const(None)
+
+    def _c_true(self, node, c) -> Code:
+        return _const(1)
+
+    def _c_false(self, node, c) -> Code:
+        return _const(0)
+
+    def _c_tuple(self, node, c) -> Code:
+        items = [self._code(x) for x in c]
+        return lambda ctx: tuple([item(ctx) for item in items])
+
+    def _c_list(self, node, c) -> Code:
+        if len(c) == 1 and isinstance(c[0], Tree) and c[0].data == "list_items":
+            return self._code(c[0])
+        return lambda ctx: []
+
+    def _c_list_items(self, node, c) -> Code:
+        items = [self._code(x) for x in c]
+        return lambda ctx: [item(ctx) for item in items]
+
+    # comparisons (return 1/0)
+    def _c_gt(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+        return lambda ctx: 1 if left(ctx) > right(ctx) else 0
+
+    def _c_lt(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+        return lambda ctx: 1 if left(ctx) < right(ctx) else 0
+
+    def _c_ge(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+        return lambda ctx: 1 if left(ctx) >= right(ctx) else 0
+
+    def _c_le(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+        return lambda ctx: 1 if left(ctx) <= right(ctx) else 0
+
+    def _c_eq(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+
+        def run(ctx: ExecutionContext):
+            first_eval = left(ctx)
+            second_eval = right(ctx)
+            # check for null comparison
+            if first_eval is None or second_eval is None:
+                return 1 if first_eval is second_eval else 0
+            return 1 if first_eval == second_eval else 0
+
+        return run
+
+    def _c_ne(self, node, c) -> Code:
+        if len(c) != 2:
+            return _unmatched(node)
+        left, right = self._code(c[0]), self._code(c[1])
+
+        def run(ctx: ExecutionContext):
+            first_eval = left(ctx)
+            second_eval = right(ctx)
+            # check for null comparison
+            if first_eval is None or second_eval is None:
+                return 0 if first_eval is second_eval else 1
+            return 1 if first_eval != second_eval else 0
+
+        return run
+
+
+class CompiledFunction:
+    """
+    A user function defined by the compiled engine.
+    """
+
+    __slots__ = ("name", "params", "body", "scope", "code")
+
+    def __init__(self, name: str, params: list[str], body: Tree, scope: Scope, code):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.scope = scope
+        self.code = code
+
+    def run_body(self, ctx: ExecutionContext) -> Any:
+        """
+        Run the body as part of ctx, without arguments, and return its raw
+        value (signals included), as foreach_tick expects.
+        """
+        frame = tick_frame(ctx, self)
+        try:
+            return self.code(frame)
+        finally:
+            commit_tick_frame(ctx, frame)
+
+    def __repr__(self):
+        return f"<fn {self.name}({', '.join(self.params)})>"
+
+
+# ---------- runtime helpers, shared with the transpiler ----------
+
+
+def load_name(ctx: ExecutionContext, name: str) -> Any:
+    """
+    Load a name the running function does not assign. Only names in
+    resolver.FRAME_NAMES can be bound by a caller; any other is read from
+    the top level directly instead of walking every caller. The set only
+    grows, so it is checked on each read.
+    """
+    if name in FRAME_NAMES:
+        return ctx.lookup(name)
+    return ctx.root.lookup(name)
+
+
+def read_outer(ctx: ExecutionContext, i: int, name: str) -> Any:
+    """
+    Load a local declared `outer`: through its binding once the `outer`
+    statement ran, from its own slot (or the callers) before that.
+    """
+    target = ctx.outer_vars.get(name)
+    if target is not None:
+        return target.read_view(name)
+    v = ctx.slots[i]
+    return v if v is not UNSET else ctx.parent.lookup(name)
+
+
+def write_outer(ctx: ExecutionContext, i: int, name: str, val: Any):
+    target = ctx.outer_vars.get(name)
+    if target is not None:
+        target.write_var(name, val)
+    else:
+        ctx.slots[i] = val
+
+
+def bind_outer(ctx: ExecutionContext, name: str):
+    """
+    Run an `outer name;` statement.
+
+    In the tree engine every call starts with a copy of its caller's
+    variables, so `outer` binds to the caller whenever the caller can see
+    name, and writes change the caller's view rather than the frame that
+    first defined it.
+    """
+    if ctx.parent is not None and ctx.outer_vars is ctx.parent.outer_vars:
+        # a foreach_tick body (see tick_frame) binds as its caller would
+        ctx = ctx.parent
+    # First check if parent already has this variable marked as outer
+    if ctx.parent and name in ctx.parent.outer_vars:
+        ctx.outer_vars[name] = ctx.parent.outer_vars[name]
+        return None
+    # Otherwise bind to the caller if name is visible from it
+    if ctx.parent is not None and ctx.parent.sees(name):
+        ctx.outer_vars[name] = ctx.parent
+    return None
+
+
+def tick_frame(ctx: ExecutionContext, fn) -> ExecutionContext:
+    """
+    Frame to run the body of fn in for foreach_tick. The tree engine runs
+    the body in the caller's context itself, so the frame shares the
+    caller's `outer` bindings and commit_tick_frame hands everything it
+    assigned or defined back to the caller.
+    """
+    frame = ctx.create_frame(fn.scope, [UNSET] * fn.scope.nparams, fn.body)
+    frame.depth = ctx.depth
+    frame.outer_vars = ctx.outer_vars
+    return frame
+
+
+def commit_tick_frame(ctx: ExecutionContext, frame: ExecutionContext):
+    """
+    Write the variables and functions set by a foreach_tick body (see
+    tick_frame) to the caller ctx, as if the body had run there.
+    """
+    for name, val in zip(frame.scope.names, frame.slots):
+        if val is not UNSET:
+            target = ctx.outer_vars.get(name)
+            (target if target is not None else ctx).write_var(name, val)
+    for name, val in frame.vars.items():
+        target = ctx.outer_vars.get(name)
+        (target if target is not None else ctx).write_var(name, val)
+    if frame.funcs is not ctx.funcs:
+        for fn in frame.funcs.values():
+            if ctx.funcs.get(fn.name) is not fn:
+                define_function(ctx, fn)
+
+
+def destructure(vals: list, num_names: int) -> list:
+    """
+    Match assigned values to num_names targets.
+    """
+    # Only flatten tuples/lists if we have multiple names (destructuring)
+    if num_names > 1:
+        vals_flat = []
+        for v in vals:
+            if isinstance(v, (tuple, list)):
+                vals_flat.extend(v)
+            else:
+                vals_flat.append(v)
+        if len(vals_flat) != num_names:
+            raise Exception("Arity mismatch in multiple assignment")
+        return vals_flat
+    if len(vals) != 1:
+        raise Exception(f"Expected 1 value for single assignment, got {len(vals)}")
+    return vals
+
+
+def define_function(ctx: ExecutionContext, fn: "CompiledFunction"):
+    if ctx.parent is not None and ctx.funcs is ctx.parent.funcs:
+        # functions are shared with the caller until this frame defines one
+        ctx.funcs = dict(ctx.funcs)
+    ctx.funcs[fn.name] = fn
+
+
+def call_function(ctx: ExecutionContext, name: str, arg_values: list) -> Any:
+    """
+    Call the user function name in a new frame and return its value.
+    """
+    fn = ctx.funcs.get(name)
+    if fn is None:
+        raise Exception(f"Function not found: {name}")
+    if len(arg_values) != fn.scope.nparams:
+        raise Exception(f"Arity mismatch: {name} expects {fn.scope.nparams} args")
+
+    v = fn.code(ctx.create_frame(fn.scope, arg_values, fn.body))
+    if v.__class__ is ControlSignal and v.signal is RET_SIG:
+        return v.get_single() if v.is_single() else v.get_multiple()
+
+    # return is optional, so if values are present return them
+    return v if v is not None else 0
+
+
+def foreach_tick(ctx: ExecutionContext, tick_provider_name: str, func_name: str):
+    while True:
+        provider = ctx.funcs.get(tick_provider_name)
+        if provider is None:
+            raise Exception(f"Tick provider func not found: {tick_provider_name}")
+
+        # controls timeout
+        results = provider.run_body(ctx)
+        if results is None or (
+            isinstance(results, ControlSignal) and results.is_signal(EXIT_SIG)
+        ):
+            break
+        fn = ctx.funcs.get(func_name)
+        if fn is None:
+            raise Exception(f"Function not found: {func_name}")
+        results = fn.run_body(ctx)
+    return results
+
+
+def index_value(container: Any, idx: Any) -> Any:
+    if not isinstance(idx, int):
+        raise Exception("Index must be an integer")
+    try:
+        return container[idx] if container and len(container) > idx else None
+    except ScriptTimeout:
+        raise
+    except Exception as e:
+        raise Exception(f"Index error: {e}")
+
+
+def _const(value: Any) -> Code:
+    return lambda ctx: value
+
+
+def _fail(message: str) -> Code:
+    def run(ctx: ExecutionContext):
+        raise Exception(message)
+
+    return run
+
+
+def _unmatched(node: Tree) -> Code:
+    # mirrors the tree-walker when a known node has an unexpected shape
+    return _fail(f"Unknown node type: {type(node)}")
@@ -0,0 +1,110 @@
+import ast
+import math
+import operator
+from typing import Any
+from lark import Tree, Token
+
+# bump when the folded tree changes shape, so cached trees are re-parsed
+FOLDING_VERSION = 1
+# longer folded strings are built at run time instead of stored in the tree
+MAX_FOLDED_STR = 1024
+
+
+def add(a, b):
+    if isinstance(a, str) or isinstance(b, str):
+        return str(a) + str(b)
+    return a + b
+
+
+def mod(a, b):
+    result = a % b
+    # Convert to int if result is a whole number
+    if isinstance(result, float) and result.is_integer():
+        return int(result)
+    return result
+
+
+def eq(a, b):
+    # check for null comparison
+    if a is None or b is None:
+        return 1 if a is b else 0
+    return 1 if a == b else 0
+
+
+def ne(a, b):
+    if a is None or b is None:
+        return 0 if a is b else 1
+    return 1 if a != b else 0
+
+
+# operators without side effects, by tree node, with macroni semantics
+OPERATORS = {
+    "add": add,
+    "sub": operator.sub,
+    "mul": operator.mul,
+    "div": operator.truediv,
+    "mod": mod,
+    "neg": operator.neg,
+    "gt": lambda a, b: 1 if a > b else 0,
+    "lt": lambda a, b: 1 if a < b else 0,
+    "ge": lambda a, b: 1 if a >= b else 0,
+    "le": lambda a, b: 1 if a <= b else 0,
+    "eq": eq,
+    "ne": ne,
+}
+
+_FOLDABLE = {
+    **OPERATORS,
+    "and_op": lambda a, b: (1 if b else 0) if a else 0,
+    "or_op": lambda a, b: 1 if a else (1 if b else 0),
+}
+_KEYWORDS = {"null": None, "true": 1, "false": 0}
+
+
+def fold_constants(tree: Tree) -> Tree:
+    """
+    Post-parse pass: decode every literal once and fold operators whose
+    operands are all constant (e.g. `60 * 1000`), in place.
+
+    Folded nodes become `const` trees whose only child is the Python value,
+    so the engines return it without decoding anything.
+
+    Returns:
+        tree, for chaining after parse
+    """
+    # bottom-up, so operands are folded before the operators using them
+    for node in tree.iter_subtrees():
+        c = node.children
+        match node.data:
+            case "number" if len(c) == 1 and _is_token(c[0], "NUMBER"):
+                val = float(c[0])
+                _make_const(node, int(val) if val.is_integer() else val)
+            case "string" if len(c) == 1 and _is_token(c[0], "STRING"):
+                _make_const(node, ast.literal_eval(str(c[0])))
+            case "null" | "true" | "false" if not c:
+                _make_const(node, _KEYWORDS[node.data])
+            case op if op in _FOLDABLE and c and all(_is_const(x) for x in c):
+                try:
+                    value = _FOLDABLE[op](*[x.children[0] for x in c])
+                except Exception:
+                    # e.g. division by zero: left for the engine to report
+                    continue
+                if isinstance(value, float) and not math.isfinite(value):
+                    continue
+                if isinstance(value, str) and len(value) > MAX_FOLDED_STR:
+                    continue
+                _make_const(node, value)
+    return tree
+
+
+def _make_const(node: Tree, value: Any):
+    node.data = "const"
+    node.children = [value]
+
+
+def _is_const(node: Any) -> bool:
+    return isinstance(node, Tree) and node.data == "const"
+
+
+def _is_token(node: Any, type_: str) -> bool:
+    return isinstance(node, Token) and node.type == type_
@@ -1,7 +1,8 @@
 import enum
+import re
 from collections.abc import Iterable
 from .types import ExecutionContext
-from macroni.interpreter.grammar import calc_parser
+from macroni.interpreter import parse_cache
 
 try:
     import readline
@@ -19,55 +20,132 @@ class StepMode(enum.Enum):
     OUT = "out"
 
 
+class Breakpoint:
+    """
+    A line to pause at, optionally only when a condition holds
+    (`42 if i > 100`). The condition is parsed once, when the breakpoint
+    is set, and compiled like any other code.
+    """
+
+    __slots__ = ("line", "condition", "tree")
+
+    def __init__(self, line: int, condition: str | None = None):
+        self.line = line
+        self.condition = condition
+        self.tree = None
+        if condition is not None:
+            # report syntax errors when the breakpoint is set
+            self.tree = parse_cache.parse(condition.rstrip().rstrip(";") + ";")
+
+    def should_pause(self, ctx: ExecutionContext) -> bool:
+        if self.condition is None:
+            return True
+        cond_ctx = ctx.create_sibling_context(node=self.tree)
+        cond_ctx.debug = False
+        try:
+            return bool(ctx.eval_cback(cond_ctx))
+        except Exception as e:
+            print(f"Breakpoint condition `{self.condition}` failed: {e}")
+            return True
+
+    def __str__(self):
+        if self.condition is None:
+            return str(self.line)
+        return f"{self.line} if {self.condition}"
+
+
+def parse_breakpoint(spec: str) -> Breakpoint:
+    """
+    Parse `LINE` or `LINE if CONDITION`.
+
+    Raises:
+        Exception: if spec is neither, or the condition does not parse
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*(?:if\s+(.+?))?\s*", str(spec))
+    if match is None:
+        raise Exception(f"Invalid breakpoint {spec!r}, expected LINE [if CONDITION]")
+    return Breakpoint(int(match.group(1)), match.group(2))
+
+
 class Debugger:
     def __init__(self):
-        self.breakpoints = set()
+        # line -> Breakpoint
+        self.breakpoints: dict[int, Breakpoint] = {}
         self.mode: StepMode = StepMode.RUN
         self.target_depth = None
         self.last_line = None
 
     def set_breakpoints(self, breakpoints: Iterable[any]):
-        bps = set(map(int, breakpoints))
-        print(f"Setting breakpoints: {bps}")
-        self.breakpoints = bps
+        bps = [parse_breakpoint(bp) for bp in breakpoints]
+        self.breakpoints = {bp.line: bp for bp in bps}
+        print(f"Setting breakpoints: {', '.join(map(str, bps)) or 'none'}")
 
-    def maybe_pause(self, ctx: ExecutionContext = None):
-        if ctx is None or not ctx.debug:
-            return
-        line = getattr(ctx.node.meta, "line", None)
-        print(f"Checking line {line} at call depth {ctx.depth if ctx else 'unknown'}")
+    def resolve(self, tree):
+        """
+        Move each breakpoint to the first statement at or after its line in
+        tree (the script being debugged), so every breakpoint can be hit.
+        """
+        lines = sorted(
+            {
+                stmt.meta.line
+                for block in tree.find_data("stmt_block")
+                for stmt in block.children
+                if hasattr(stmt, "meta") and not stmt.meta.empty
+            }
+        )
+        resolved = {}
+        for line, bp in sorted(self.breakpoints.items()):
+            target = next((x for x in lines if x >= line), None)
+            if target is None:
+                print(f"Breakpoint {bp} is after the last statement, ignored")
+                continue
+            if target != line:
+                print(f"Breakpoint {bp} moved to line {target}")
+                bp.line = target
+            resolved.setdefault(target, bp)
+        self.breakpoints = resolved
+
+    def at_statement(self, ctx: ExecutionContext, node):
+        """
+        Called before each statement while debugging. Without a breakpoint
+        on the line or a step in progress, returns right away.
+        """
+        line = getattr(node.meta, "line", None)
         if line is None:
             return
+        bp = self.breakpoints.get(line)
+        if bp is None and self.mode is StepMode.RUN:
+            self.last_line = line
+            return
 
-        line = int(line)
-        if line in self.breakpoints:
+        if bp is not None and bp.should_pause(ctx):
             print(f"Hit breakpoint at line {line}")
-            self._pause(ctx=ctx, reason="breakpoint")
+            self._pause(ctx, node, reason="breakpoint")
             return
 
         match self.mode:
             case StepMode.STEP:
                 if self.last_line is None or line != self.last_line:
                     self.mode = StepMode.RUN
-                    self._pause(ctx, reason="step")
+                    self._pause(ctx, node, reason="step")
                     return
             case StepMode.NEXT:
                 if ctx.depth <= self.target_depth and line != self.last_line:
                     self.mode = StepMode.RUN
-                    self._pause(ctx, reason="next")
+                    self._pause(ctx, node, reason="next")
                     return
             case StepMode.OUT:
                 if ctx.depth < self.target_depth:
                     self.mode = StepMode.RUN
-                    self._pause(ctx, reason="out")
+                    self._pause(ctx, node, reason="out")
                     return
 
         self.last_line = line
 
-    def _pause(self, ctx: ExecutionContext, reason):
-        print(f"Paused ({reason}) at line {ctx.node.meta.line}")
-        self.last_line = ctx.node.meta.line
-        self.repl(ctx)
+    def _pause(self, ctx: ExecutionContext, node, reason):
+        print(f"Paused ({reason}) at line {node.meta.line}")
+        self.last_line = node.meta.line
+        self.repl(ctx.create_sibling_context(node=node))
 
     def repl(self, ctx: ExecutionContext):
         while True:
@@ -86,8 +164,32 @@ class Debugger:
                 self.mode = StepMode.OUT
                 self.target_depth = ctx.depth
                 return
+            if cmd == "b" or cmd.startswith("b "):
+                if cmd == "b":
+                    print(
+                        f"breakpoints: {', '.join(map(str, self.breakpoints.values()))}"
+                    )
+                    continue
+                try:
+                    bp = parse_breakpoint(cmd[2:])
+                except Exception as e:
+                    print(f"Error: {e}")
+                    continue
+                self.breakpoints[bp.line] = bp
+                print(f"Breakpoint set at {bp}")
+                continue
+            if cmd.startswith("clear "):
+                removed = (
+                    self.breakpoints.pop(int(cmd[6:]), None)
+                    if cmd[6:].strip().isdigit()
+                    else None
+                )
+                print(
+                    f"Cleared breakpoint {removed}" if removed else "No such breakpoint"
+                )
+                continue
             if cmd == "mem":
-                print(f"vars: {ctx.vars}")
+                print(f"vars: {ctx.snapshot_vars()}")
                 print(f"funcs: {ctx.funcs}")
                 continue
             if cmd.startswith("eval "):
@@ -96,7 +198,7 @@ class Debugger:
                     print("Error: eval requires an expression")
                     continue
                 try:
-                    parsed_expr = calc_parser.parse(expression)
+                    parsed_expr = parse_cache.parse(expression)
                     eval_ctx = ctx.create_sibling_context(node=parsed_expr)
                     # do not step through eval
                     eval_ctx.debug = False
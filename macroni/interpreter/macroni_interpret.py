@@ -2,20 +2,27 @@ from lark import Tree, Token
 import ast
 import time
 import random
-import pyautogui
 import json
 import os
-from PIL import ImageGrab
-from macroni.util.mouse_utils import move_mouse_to
-from macroni.util.template_match import locate_template_on_screen
-from macroni.util.input_handler import send_input, left_click, press_and_release
-from pynput import mouse, keyboard
-from macroni.util import output_handler
 from threading import Event
 import threading
-from macroni.util.ocr import region_capture, ocr_find_text
+from macroni.util.lazy import LazyModule
 from macroni.interpreter.macroni_debugger import Debugger
-from .types import ExecutionContext
+from macroni.interpreter.compiler import Compiler
+from macroni.interpreter.trampoline import StackCompiler
+from macroni.interpreter import registry
+from macroni.interpreter.registry import BUILTINS, builtin
+from macroni.interpreter.plugins import resolve_native
+from .types import (
+    ExecutionContext,
+    ControlSignal,
+    RET_SIG,
+    BRK_SIG,
+    EXIT_SIG,
+    CNT_SIG,
+    ENGINES,
+    ScriptTimeout,
+)
 from typing import Any, Iterable
 
 try:
@@ -27,60 +34,124 @@ except ImportError:
         pass
 
 
-class Sigl: ...
-
-
-# used to track return signal
-RET_SIG: Sigl = Sigl()
-BRK_SIG: Sigl = Sigl()
-EXIT_SIG: Sigl = Sigl()
-CNT_SIG: Sigl = Sigl()
 DBG = Debugger()
 
+# heavy dependencies, imported by the first builtin that needs them
+pyautogui = LazyModule("pyautogui")
+screen = LazyModule("macroni.util.screen")
+mouse_utils = LazyModule("macroni.util.mouse_utils")
+template_match = LazyModule("macroni.util.template_match")
+input_handler = LazyModule("macroni.util.input_handler")
+output_handler = LazyModule("macroni.util.output_handler")
+ocr = LazyModule("macroni.util.ocr")
+LAZY_MODULES = (
+    pyautogui,
+    screen,
+    mouse_utils,
+    template_match,
+    input_handler,
+    output_handler,
+    ocr,
+)
+
+
+def preload():
+    """
+    Import every heavy dependency and load the OCR model now, instead of
+    when a builtin first needs them.
+    """
+    for module in LAZY_MODULES:
+        module.load()
+    ocr.get_reader()
+
 
-class ControlSignal:
-    def __init__(self, values: list[Any], signal: Sigl = None):
-        self.values = []
-        if isinstance(values, list) or isinstance(values, tuple):
-            self.values = values
-        else:
-            self.values = [values]
-        self.signal = signal
+class Interpreter:
+    def __init__(self, engine: str = "compiled", profiler=None, debug=False):
+        """
+        TEMPLATE DIR:
+        Each file will be: target/ex1.png target/ex2.png etc.
 
-    def is_single(self) -> bool:
-        return len(self.values) == 1
+        ENGINE:
+        "compiled" lowers the tree into closures once and runs those,
+        "stack" is "compiled" with calls run on an explicit stack, so deep
+        recursion does not hit the Python recursion limit,
+        "tree" walks the tree on every evaluation (reference implementation).
 
-    def get_single(self) -> Any:
-        if self.is_single():
-            return self.values[0]
-        raise Exception("Multiple return values present")
+        PROFILER:
+        a profiler.Profiler the "compiled" engine records lines, functions
+        and builtins in.
 
-    def get_multiple(self) -> list[Any]:
-        return self.values
+        DEBUG:
+        compile the debugger's breakpoint and stepping hooks into the code.
+        Without it the compiled engines ignore context.debug.
+        """
+        if engine not in ENGINES:
+            raise Exception(f"Unknown engine: {engine}")
+        if profiler is not None and engine != "compiled":
+            raise Exception("Profiling needs the compiled engine")
+        self.reset()
+        self.engine = engine
+        compiler = StackCompiler if engine == "stack" else Compiler
+        self.compiler = compiler(self, DBG, BUILTINS)
+        self.compiler.profiler = profiler
+        self.compiler.debug = debug
+
+    def reset(self):
+        """
+        Forget the settings scripts change (the template directory), so the
+        interpreter can run another script as if it was new.
+        """
+        self.template_dir = "./templates"
 
-    def is_signal(self, signal: Sigl) -> bool:
-        return self.signal is signal
+    def execute(self, context: ExecutionContext) -> Any:
+        """
+        Evaluate context.node with the selected engine.
+        """
+        if self.engine == "tree":
+            return self.eval(context)
+        return self.compiler.compile(context.node, context.scope)(context)
 
+    def run_program(self, context: ExecutionContext, program) -> Any:
+        """
+        Import the modules of a modules.Program into context, then run the
+        script itself there (context.node is its tree).
+        """
+        for module in program.imports:
+            self.import_module(context, module)
+        self.compiler.source = program.main.path
+        return self.execute(context)
 
-class Interpreter:
-    def __init__(self):
+    def import_module(self, context: ExecutionContext, module) -> Any:
         """
-        TEMPLATE DIR:
-        Each file will be: target/ex1.png target/ex2.png etc.
+        Bind the functions of a modules.Module into context, then run the
+        rest of its top-level code there, as if it was part of the script.
+        Imported code is never paused on by the debugger.
         """
-        self.template_dir = "./templates"
+        self.compiler.source = module.path
+        for name, (params, body) in module.functions.items():
+            if self.engine == "tree":
+                context.funcs[name] = (params, body)
+            else:
+                context.funcs[name] = self.compiler.function(name, params, body)
+        module_context = context.create_sibling_context(node=module.body)
+        module_context.debug = False
+        return self.execute(module_context)
 
     def eval_child(self, parent_context: ExecutionContext, node: any) -> Any:
         child_context = parent_context.create_child_context(node=node)
         return self.eval(child_context)
 
     def eval_sibling(self, sibling_context: ExecutionContext, node: any) -> Any:
-        sibling_ctx = sibling_context.create_sibling_context(node=node)
-        return self.eval(sibling_ctx)
+        return self.eval_node(node, sibling_context)
 
     def eval(self, context: ExecutionContext) -> Any:
-        node = context.node
+        return self.eval_node(context.node, context)
 
+    def eval_node(self, node: any, context: ExecutionContext) -> Any:
+        """
+        Evaluate node in context. Siblings share the same context object, the
+        node is passed separately so no context is allocated per AST node.
+        """
         # Tokens
         match node:
             case Token(type="NUMBER"):
@@ -110,6 +181,9 @@ class Interpreter:
             c = node.children
 
             match t:
+                case "const":
+                    # literal or constant expression, decoded after parsing
+                    return c[0]
                 case "import_stmt":
                     # imports should be pre-loaded by now
                     return None
@@ -139,9 +213,9 @@ class Interpreter:
                 case "stmt_block":
                     last = 0
                     for stmt in c:
-                        stmt_ctx = context.create_sibling_context(node=stmt)
-                        DBG.maybe_pause(ctx=stmt_ctx)
-                        last = self.eval_sibling(context, stmt)
+                        if context.debug:
+                            DBG.at_statement(context, stmt)
+                        last = self.eval_node(stmt, context)
                         match last:
                             case ControlSignal(signal=signal) if signal in (
                                 RET_SIG,
@@ -158,8 +232,8 @@ class Interpreter:
                 case "index":
                     match c:
                         case [arg1, arg2]:
-                            container = self.eval_sibling(context, arg1)
-                            idx = self.eval_sibling(context, arg2)
+                            container = self.eval_node(arg1, context)
+                            idx = self.eval_node(arg2, context)
 
                             if not isinstance(idx, int):
                                 raise Exception("Index must be an integer")
@@ -170,6 +244,8 @@ class Interpreter:
                                     if container and len(container) > idx
                                     else None
                                 )
+                            except ScriptTimeout:
+                                raise
                             except Exception as e:
                                 raise Exception(f"Index error: {e}")
 
@@ -180,7 +256,7 @@ class Interpreter:
                             num_names += 1
                     # now eval all exprs
                     exprs = c[num_names:]
-                    vals = [self.eval_sibling(context, e) for e in exprs]
+                    vals = [self.eval_node(e, context) for e in exprs]
 
                     # Only flatten tuples/lists if we have multiple names (destructuring)
                     if num_names > 1:
@@ -216,67 +292,22 @@ class Interpreter:
                 case "expr_stmt":
                     match c:
                         case [expr]:
-                            return self.eval_sibling(context, expr)
-
-                case "print_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            # Print all arguments separated by spaces
-                            print(*args)
-                            return None
+                            return self.eval_node(expr, context)
 
                 # special type of built in that returns the evaluated arguments
                 case "return_stmt":
                     match c:
                         case [args_node]:
-                            args = self.eval_sibling(context, args_node)
+                            args = self.eval_node(args_node, context)
                             return ControlSignal(args, RET_SIG)
 
-                case "swap_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            # make sure first arg is list
-                            if len(args) != 3:
-                                raise Exception(
-                                    f"swap() takes exactly 3 arguments, got {len(args)}"
-                                )
-                            lst = args[0]
-                            idx1 = int(args[1])
-                            idx2 = int(args[2])
-                            if not isinstance(lst, list):
-                                raise Exception(
-                                    "First argument to swap() must be a list"
-                                )
-                            if (
-                                idx1 < 0
-                                or idx1 >= len(lst)
-                                or idx2 < 0
-                                or idx2 >= len(lst)
-                            ):
-                                raise Exception("swap() index out of range")
-                            lst[idx1], lst[idx2] = lst[idx2], lst[idx1]
-                            # return the modified list
-                            return lst
-
-                case "copy_func":
-                    match c:
-                        case [val_node]:
-                            val = self.eval_sibling(context, val_node)
-                            if isinstance(val, list):
-                                return val.copy()
-                            if isinstance(val, tuple):
-                                return tuple(val)
-                            return val  # for other types, just return as is
-
                 case "and_op":
                     match c:
                         case [left, right]:
-                            left_val = self.eval_sibling(context, left)
+                            left_val = self.eval_node(left, context)
                             if not left_val:
                                 return 0
-                            right_val = self.eval_sibling(context, right)
+                            right_val = self.eval_node(right, context)
                             return 1 if right_val else 0
                         case _:
                             raise Exception("and_op requires exactly two operands")
@@ -284,10 +315,10 @@ class Interpreter:
                 case "or_op":
                     match c:
                         case [left, right]:
-                            left_val = self.eval_sibling(context, left)
+                            left_val = self.eval_node(left, context)
                             if left_val:
                                 return 1
-                            right_val = self.eval_sibling(context, right)
+                            right_val = self.eval_node(right, context)
                             return 1 if right_val else 0
                         case _:
                             raise Exception("or_op requires exactly two operands")
@@ -303,7 +334,7 @@ class Interpreter:
 
                             for child in rest:
                                 if isinstance(child, Tree) and child.data == "params":
-                                    params = self.eval_sibling(context, child)
+                                    params = self.eval_node(child, context)
                                 elif (
                                     isinstance(child, Tree)
                                     and child.data == "stmt_block"
@@ -317,7 +348,7 @@ class Interpreter:
                             return f"Defined {name}({', '.join(params)})"
 
                 case "args":
-                    return [self.eval_sibling(context, x) for x in c]
+                    return [self.eval_node(x, context) for x in c]
                 case "break_stmt":
                     # emit break signal
                     return ControlSignal([], BRK_SIG)
@@ -330,7 +361,7 @@ class Interpreter:
                             isinstance(args_node, Tree) and args_node.data == "args"
                         ):
                             name = str(name_node)
-                            arg_values = self.eval_sibling(context, args_node)
+                            arg_values = self.eval_node(args_node, context)
                         case [name_node]:
                             name = str(name_node)
                             arg_values = []
@@ -363,8 +394,8 @@ class Interpreter:
                 case "add":
                     match c:
                         case [left, right]:
-                            a = self.eval_sibling(context, left)
-                            b = self.eval_sibling(context, right)
+                            a = self.eval_node(left, context)
+                            b = self.eval_node(right, context)
                             if isinstance(a, str) or isinstance(b, str):
                                 return str(a) + str(b)
                             return a + b
@@ -372,35 +403,35 @@ class Interpreter:
                 case "sub":
                     match c:
                         case [left, right]:
-                            return self.eval_sibling(context, left) - self.eval_sibling(
-                                context, right
+                            return self.eval_node(left, context) - self.eval_node(
+                                right, context
                             )
 
                 case "neg":
                     match c:
                         case [operand]:
-                            return -self.eval_sibling(context, operand)
+                            return -self.eval_node(operand, context)
 
                 case "mul":
                     match c:
                         case [left, right]:
-                            return self.eval_sibling(context, left) * self.eval_sibling(
-                                context, right
+                            return self.eval_node(left, context) * self.eval_node(
+                                right, context
                             )
 
                 case "div":
                     match c:
                         case [left, right]:
-                            return self.eval_sibling(context, left) / self.eval_sibling(
-                                context, right
+                            return self.eval_node(left, context) / self.eval_node(
+                                right, context
                             )
 
                 case "mod":
                     match c:
                         case [left, right]:
-                            result = self.eval_sibling(
-                                context, left
-                            ) % self.eval_sibling(context, right)
+                            result = self.eval_node(left, context) % self.eval_node(
+                                right, context
+                            )
                             # Convert to int if result is a whole number
                             if isinstance(result, float) and result.is_integer():
                                 return int(result)
@@ -417,7 +448,7 @@ class Interpreter:
 
                 case "tuple":
                     # Evaluate all children and return as tuple
-                    return tuple(self.eval_sibling(context, child) for child in c)
+                    return tuple(self.eval_node(child, context) for child in c)
 
                 case "list":
                     match c:
@@ -429,13 +460,13 @@ class Interpreter:
                             and list_items_node.data == "list_items"
                         ):
                             # List with items
-                            return self.eval_sibling(context, list_items_node)
+                            return self.eval_node(list_items_node, context)
                         case _:
                             return []
 
                 case "list_items":
                     # Evaluate all items and return as list
-                    return [self.eval_sibling(context, child) for child in c]
+                    return [self.eval_node(child, context) for child in c]
 
                 # comparisons (return 1/0 like you had)
                 case "gt":
@@ -443,8 +474,8 @@ class Interpreter:
                         case [left, right]:
                             return (
                                 1
-                                if self.eval_sibling(context, left)
-                                > self.eval_sibling(context, right)
+                                if self.eval_node(left, context)
+                                > self.eval_node(right, context)
                                 else 0
                             )
 
@@ -453,8 +484,8 @@ class Interpreter:
                         case [left, right]:
                             return (
                                 1
-                                if self.eval_sibling(context, left)
-                                < self.eval_sibling(context, right)
+                                if self.eval_node(left, context)
+                                < self.eval_node(right, context)
                                 else 0
                             )
 
@@ -463,8 +494,8 @@ class Interpreter:
                         case [left, right]:
                             return (
                                 1
-                                if self.eval_sibling(context, left)
-                                >= self.eval_sibling(context, right)
+                                if self.eval_node(left, context)
+                                >= self.eval_node(right, context)
                                 else 0
                             )
 
@@ -473,8 +504,8 @@ class Interpreter:
                         case [left, right]:
                             return (
                                 1
-                                if self.eval_sibling(context, left)
-                                <= self.eval_sibling(context, right)
+                                if self.eval_node(left, context)
+                                <= self.eval_node(right, context)
                                 else 0
                             )
 
@@ -482,8 +513,8 @@ class Interpreter:
                     match c:
                         case [left, right]:
                             # check if comparing to null
-                            first_eval = self.eval_sibling(context, left)
-                            second_eval = self.eval_sibling(context, right)
+                            first_eval = self.eval_node(left, context)
+                            second_eval = self.eval_node(right, context)
                             # check for null comparison
                             if first_eval is None:
                                 return 1 if second_eval is None else 0
@@ -494,8 +525,8 @@ class Interpreter:
                 case "ne":
                     match c:
                         case [left, right]:
-                            first_eval = self.eval_sibling(context, left)
-                            second_eval = self.eval_sibling(context, right)
+                            first_eval = self.eval_node(left, context)
+                            second_eval = self.eval_node(right, context)
                             # check for null comparison
                             if first_eval is None:
                                 return 0 if second_eval is None else 1
@@ -507,8 +538,8 @@ class Interpreter:
                 case "loop_stmt":
                     match c:
                         case [condition, block]:
-                            while self.eval_sibling(context, condition) != 0:
-                                v = self.eval_sibling(context, block)
+                            while self.eval_node(condition, context) != 0:
+                                v = self.eval_node(block, context)
                                 match v:
                                     case ControlSignal(signal=signal) if (
                                         signal is BRK_SIG
@@ -524,57 +555,6 @@ class Interpreter:
                                         return v
                             return 0
 
-                case "wait_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) >= 1 and len(args) <= 3:
-                                duration = args[0]
-                                # if second arg is scalar, make it (0, scalar)
-                                random_range = (0, 0)
-
-                                if len(args) == 3:
-                                    random_range = (args[1], args[2])
-                                elif len(args) == 2:
-                                    random_range = (0, args[1])
-                            else:
-                                raise Exception(
-                                    f"wait() takes 1 - 3 arguments, got {len(args)}"
-                                )
-                            return wait_func(duration, random_range)
-
-                case "rand_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) == 1:
-                                low = 0
-                                high = args[0]
-                            elif len(args) == 2:
-                                low = args[0]
-                                high = args[1]
-                            else:
-                                raise Exception(
-                                    f"rand() takes 1 or 2 arguments, got {len(args)}"
-                                )
-                            return random.uniform(low, high)
-
-                case "rand_i_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) == 1:
-                                low = 0
-                                high = args[0]
-                            elif len(args) == 2:
-                                low = args[0]
-                                high = args[1]
-                            else:
-                                raise Exception(
-                                    f"rand_i() takes 1 or 2 arguments, got {len(args)}"
-                                )
-                            return random.randint(low, high)
-
                 case "foreach_tick_func":
                     match c:
                         case [tick_provider_name_node, func_name_node]:
@@ -591,7 +571,7 @@ class Interpreter:
                                 ]
 
                                 # controls timeout
-                                results = self.eval_sibling(context, tick_provider_body)
+                                results = self.eval_node(tick_provider_body, context)
                                 if results is None or (
                                     isinstance(results, ControlSignal)
                                     and results.is_signal(EXIT_SIG)
@@ -602,398 +582,359 @@ class Interpreter:
                                     raise Exception(f"Function not found: {func_name}")
                                 _, body = context.funcs[func_name]
                                 # Evaluate function body in current context
-                                results = self.eval_sibling(context, body)
+                                results = self.eval_node(body, context)
                             return results
 
-                case "mouse_move_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) < 3:
-                                raise Exception(
-                                    f"mouse_move() takes at least 3 arguments, got {len(args)}"
-                                )
-                            x_offset = args[0]
-                            y_offset = args[1]
-                            if x_offset is None or y_offset is None:
-                                return None
-                            pps = args[2]
-                            humanLike = bool(args[3]) if len(args) >= 4 else True
-                            move_mouse_to(x_offset, y_offset, pps, humanLike)
-                            return 0
-
-                case "set_template_dir_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) == 0:
-                                raise Exception(
-                                    f"set_template_dir() takes exactly 1 argument, got {len(args)}"
-                                )
-                            self.template_dir = str(args)
-                            print(f"Template directory set to: {self.template_dir}")
-                            return self.template_dir
-                            # Here you would set the template directory in your application
-
-                case "find_template_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) != 1 and len(args) != 5:
-                                raise Exception(
-                                    f"find_template() takes 1 or 5 arguments (template_name [, left, top, width, height]), got {len(args)}"
-                                )
-                            template_name = str(args[0])
-                            region = None
-                            if len(args) == 5:
-                                # region format: (left, top, width, height)
-                                region = (args[1], args[2], args[3], args[4])
-                            pos = locate_template_on_screen(
-                                template_dir=self.template_dir,
-                                template_name=template_name,
-                                downscale=1.0,
-                            )
-                            if pos is not None and len(pos) != 0:
-                                return pos[0][0], pos[0][1]
-                            return None, None  # not found
-
-                case "find_templates_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) < 1 or len(args) > 6:
-                                raise Exception(
-                                    f"find_templates() takes 1 to 6 arguments (template_name [, left, top, width, height, top_k]), got {len(args)}"
-                                )
-                            template_name = str(args[0])
-                            region = None
-                            top_k = 10  # default to finding up to 10 matches
-
-                            if len(args) == 2:
-                                # Just template_name and top_k
-                                top_k = int(args[1])
-                            elif len(args) == 6:
-                                # region format: (left, top, width, height) and top_k
-                                region = (args[1], args[2], args[3], args[4])
-                                top_k = int(args[5])
-                            elif len(args) == 5:
-                                # region format: (left, top, width, height), no top_k
-                                region = (args[1], args[2], args[3], args[4])
-
-                            positions = locate_template_on_screen(
-                                template_dir=self.template_dir,
-                                template_name=template_name,
-                                downscale=1.0,
-                                top_k=top_k,
-                            )
-                            if positions is not None and len(positions) > 0:
-                                # Return tuple of tuples
-                                return tuple(positions)
-                            return tuple()  # empty tuple if not found
-
-                case "get_coordinates_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) < 1 or len(args) > 2:
-                                raise Exception(
-                                    f"get_coordinates() takes 1 or 2 arguments (message [, use_cache]), got {len(args)}"
-                                )
-                            message = str(args[0])
-                            use_cache = bool(args[1]) if len(args) == 2 else False
-                            x, y = get_coordinates_interactive(message, use_cache)
-                            return (x, y)
-
-                case "check_pixel_color_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) < 6 or len(args) > 7:
-                                raise Exception(
-                                    f"check_pixel_color() takes 6 or 7 arguments (x, y, radius, r, g, b [, tolerance]), got {len(args)}"
-                                )
-                            x = int(args[0])
-                            y = int(args[1])
-                            radius = int(args[2])
-                            target_r = int(args[3])
-                            target_g = int(args[4])
-                            target_b = int(args[5])
-                            tolerance = int(args[6]) if len(args) == 7 else 0
-                            found = check_pixel_color_in_radius(
-                                x, y, radius, target_r, target_g, target_b, tolerance
-                            )
-                            return 1 if found else 0
-
-                case "get_pixel_color_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) < 1 or len(args) > 2:
-                                raise Exception(
-                                    f"get_pixel_color() takes 1 or 2 arguments (alias [, use_cache]), got {len(args)}"
-                                )
-                            alias = str(args[0])
-                            use_cache = bool(args[1]) if len(args) == 2 else False
-                            r, g, b = get_pixel_color_interactive(alias, use_cache)
-                            return (r, g, b)
-
                 case "conditional_expr":
                     match c:
                         case [condition_node, t_block]:
-                            condition = self.eval_sibling(context, condition_node)
+                            condition = self.eval_node(condition_node, context)
                             if condition:
-                                return self.eval_sibling(context, t_block)
+                                return self.eval_node(t_block, context)
                             return None
                         case [condition_node, t_block, f_block]:
-                            condition = self.eval_sibling(context, condition_node)
+                            condition = self.eval_node(condition_node, context)
                             if condition:
-                                return self.eval_sibling(context, t_block)
+                                return self.eval_node(t_block, context)
                             else:
-                                return self.eval_sibling(context, f_block)
+                                return self.eval_node(f_block, context)
 
-                case "left_click_func":
-                    left_click()
-                    return 0
+                case "builtin":
+                    return self.call_builtin(
+                        registry.name_of(node), self.eval_builtin_args(context, node)
+                    )
 
-                case "send_input_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) != 3:
-                                raise Exception(
-                                    f"send_input() takes exactly 3 arguments (type, key, action), got {len(args)}"
-                                )
-                            t = str(args[0])
-                            key = str(args[1])
-                            action = str(args[2])
-                            send_input(t, key, action)
-                            return 0
+                # passthrough for inlined rules
+                case _ if len(c) == 1:
+                    return self.eval_node(c[0], context)
 
-                case "press_and_release_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) < 2:
-                                raise Exception(
-                                    f"press_and_release() takes at least 2 arguments (delay_ms, key1, [key2, ...]), got {len(args)}"
-                                )
-                            delay_ms = int(args[0])
-                            keys = [str(k) for k in args[1:]]
-                            press_and_release(delay_ms, *keys)
-                            return 0
+                case _:
+                    raise Exception(f"Unknown tree node: {t}")
 
-                case "record_func":
-                    match c:
-                        case [args_node]:
-                            new_ctx = context.create_sibling_context(node=args_node)
-                            new_ctx.debug = False  # disable debug during recording
-                            args = self.eval(new_ctx)
-                            if len(args) < 1 or len(args) > 3:
-                                raise Exception(
-                                    f"record() takes 1-3 arguments (recording_name [, start_button, stop_button]), got {len(args)}"
-                                )
-                            recording_name = str(args[0])
-                            start_button = str(args[1]) if len(args) >= 2 else "space"
-                            stop_button = str(args[2]) if len(args) == 3 else "esc"
-                            # inf means only cares about points before events and not mimicking mouse path
-                            squash_distance = (
-                                int(args[3]) if len(args) == 4 else float("inf")
-                            )
-                            record_interactive(
-                                recording_name,
-                                start_button,
-                                stop_button,
-                                squash_distance,
-                            )
-                            return 0
+        raise Exception(f"Unknown node type: {type(node)}")
 
-                case "playback_func":
-                    match c:
-                        case [args_node]:
-                            new_ctx = context.create_sibling_context(node=args_node)
-                            new_ctx.debug = False  # disable debug during playback
-                            args = self.eval(new_ctx)
-                            if len(args) < 1 or len(args) > 2:
-                                raise Exception(
-                                    f"playback() takes 1-2 arguments (recording_name [, stop_button]), got {len(args)}"
-                                )
-                            recording_name = str(args[0])
-                            stop_button = str(args[1]) if len(args) == 2 else "esc"
-                            playback_interactive(recording_name, stop_button)
-                            return 0
+    def eval_builtin_args(self, context: ExecutionContext, node: Tree) -> list[Any]:
+        """
+        Evaluate the arguments of a built-in call into a list.
+        """
+        if len(node.children) < 2:
+            return []
+        if not registry.lookup(registry.name_of(node)).debug:
+            context = context.create_sibling_context(node=node)
+            context.debug = False  # disable debug during recording/playback
+        return self.eval_node(node.children[1], context)
+
+    def call_builtin(self, name: str, args: list[Any]) -> Any:
+        """
+        Run the built-in @name with already evaluated arguments.
+        """
+        return registry.lookup(name).call(self, args)
+
+
+# ---------- built-ins ----------
+# Each function's parameters are the builtin's signature (see registry).
+
+
+@builtin("print")
+def print_func(*args):
+    # Print all arguments separated by spaces
+    print(*args)
+    return None
+
+
+@builtin("fail")
+def fail_func(*message):
+    # Stop the script with an error, e.g. a failed check in a test
+    raise Exception(" ".join(str(m) for m in message) or "fail() called")
+
+
+@builtin("swap")
+def swap_func(lst, idx1, idx2):
+    idx1 = int(idx1)
+    idx2 = int(idx2)
+    # make sure first arg is list
+    if not isinstance(lst, list):
+        raise Exception("First argument to swap() must be a list")
+    if idx1 < 0 or idx1 >= len(lst) or idx2 < 0 or idx2 >= len(lst):
+        raise Exception("swap() index out of range")
+    lst[idx1], lst[idx2] = lst[idx2], lst[idx1]
+    # return the modified list
+    return lst
+
+
+@builtin("copy")
+def copy_func(val):
+    if isinstance(val, list):
+        return val.copy()
+    if isinstance(val, tuple):
+        return tuple(val)
+    return val  # for other types, just return as is
+
+
+@builtin("wait")
+def wait_func(duration, low=None, high=None):
+    # a single extra argument is the upper bound of the random delay
+    if low is None:
+        random_range = (0, 0)
+    elif high is None:
+        random_range = (0, low)
+    else:
+        random_range = (low, high)
+    random_delay = random.uniform(random_range[0], random_range[1])
+    print(f"Waiting for {duration + random_delay} ms...")
+    time.sleep((duration + random_delay) / 1000)
+    return duration + random_delay
 
-                case "recording_exists_func":
-                    match c:
-                        case [name_node]:
-                            recording_name = str(self.eval_sibling(context, name_node))
-                            return 1 if recording_exists(recording_name) else 0
 
-                case "len_func":
-                    match c:
-                        case [val_node]:
-                            val = self.eval_sibling(context, val_node)
-                            if val is None:
-                                return 0
-                            if isinstance(val, (tuple, list, str)):
-                                return len(val)
-                            raise Exception(
-                                f"len() requires a tuple, list, or string, got {type(val)}"
-                            )
+@builtin("rand")
+def rand_func(low, high=None):
+    if high is None:
+        low, high = 0, low
+    return random.uniform(low, high)
 
-                case "time_func":
-                    return time.time()
 
-                case "shuffle_func":
-                    match c:
-                        case [val_node]:
-                            val = self.eval_sibling(context, val_node)
-                            if val is None:
-                                return tuple()
-                            if isinstance(val, tuple):
-                                # Convert to list, shuffle, convert back to tuple
-                                lst = list(val)
-                                random.shuffle(lst)
-                                return tuple(lst)
-                            elif isinstance(val, list):
-                                # Create a copy and shuffle it
-                                lst = val.copy()
-                                random.shuffle(lst)
-                                return lst
-                            raise Exception(
-                                f"shuffle() requires a tuple or list, got {type(val)}"
-                            )
+@builtin("rand_i")
+def rand_i_func(low, high=None):
+    if high is None:
+        low, high = 0, low
+    return random.randint(low, high)
 
-                case "get_pixel_at_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) != 2:
-                                raise Exception(
-                                    f"get_pixel_at() takes exactly 2 arguments (x, y), got {len(args)}"
-                                )
-                            x = int(args[0])
-                            y = int(args[1])
-                            # Capture pixel color at the specified coordinates
-                            screenshot = ImageGrab.grab(bbox=(x, y, x + 1, y + 1))
-                            pixel = screenshot.getpixel((0, 0))
-                            r, g, b = pixel[0], pixel[1], pixel[2]
-                            return (r, g, b)
-
-                case "append_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) != 2:
-                                raise Exception(
-                                    f"append() takes exactly 2 arguments (list, item), got {len(args)}"
-                                )
-                            lst = args[0]
-                            item = args[1]
-                            if not isinstance(lst, list):
-                                raise Exception(
-                                    f"append() requires a list as first argument, got {type(lst)}"
-                                )
-                            # Append the item to the list (modifies in place)
-                            lst.append(item)
-                            return lst
 
-                case "pop_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) < 1 or len(args) > 2:
-                                raise Exception(
-                                    f"pop() takes 1 or 2 arguments (list [, index]), got {len(args)}"
-                                )
-                            lst = args[0]
-                            if not isinstance(lst, list):
-                                raise Exception(
-                                    f"pop() requires a list as first argument, got {type(lst)}"
-                                )
-                            if len(lst) == 0:
-                                raise Exception("pop() called on empty list")
-                            # Pop from specific index or from end
-                            if len(args) == 2:
-                                index = int(args[1])
-                                if index < 0 or index >= len(lst):
-                                    raise Exception(
-                                        f"pop() index {index} out of range for list of length {len(lst)}"
-                                    )
-                                return lst.pop(index)
-                            else:
-                                return lst.pop()
+@builtin("mouse_move")
+def mouse_move_func(x_offset, y_offset, pps, human_like=True):
+    if x_offset is None or y_offset is None:
+        return None
+    mouse_utils.move_mouse_to(x_offset, y_offset, pps, bool(human_like))
+    return 0
 
-                case "capture_region_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) < 1 or len(args) > 2:
-                                raise Exception(
-                                    f"capture_region() takes 1 or 2 arguments (region_key [, overwrite_cache]), got {len(args)}"
-                                )
-                            region_key = str(args[0])
-                            overwrite_cache = bool(args[1]) if len(args) == 2 else False
-                            region = region_capture(region_key, overwrite_cache)
-                            return region
 
-                case "mouse_position_func":
-                    pos = pyautogui.position()
-                    return (pos.x, pos.y)
+@builtin("set_template_dir", stateful=True)
+def set_template_dir_func(interp, template_dir):
+    interp.template_dir = str(template_dir)
+    print(f"Template directory set to: {interp.template_dir}")
+    return interp.template_dir
 
-                case "ocr_find_text_func":
-                    match c:
-                        case [args_node]:
-                            args = self.eval_sibling(context, args_node)
-                            if len(args) < 0 or len(args) > 4:
-                                raise Exception(
-                                    f"ocr_find_text() takes 0 to 4 arguments (region, min_conf, filter, upscale), got {len(args)}"
-                                )
 
-                            # Parse arguments with defaults
-                            region = (
-                                args[0]
-                                if len(args) >= 1 and args[0] is not None
-                                else None
-                            )
-                            min_conf = float(args[1]) if len(args) >= 2 else 0.45
-                            if len(args) >= 3 and args[2] is not None:
-                                if isinstance(args[2], (list, tuple)):
-                                    filter_text = [str(f) for f in args[2]]
-                                else:
-                                    filter_text = [str(args[2])]
-                            else:
-                                filter_text = None
-                            upscale = float(args[3]) if len(args) >= 4 else 1.0
-
-                            # Call OCR function
-                            results = ocr_find_text(
-                                region=region,
-                                min_conf=min_conf,
-                                filter=filter_text,
-                                upscale=upscale,
-                            )
-                            if results is None:
-                                return []
-                            # Convert OCRResult objects to tuples for macroni
-                            # Format: [(text, conf, [[x1, y1], [x2, y2], [x3, y3], [x4, y4]]), ...]
-                            return [(r.text, r.conf, r.bbox) for r in results]
+@builtin("find_template", stateful=True)
+def find_template_func(interp, template_name, *rest):
+    # [region (left, top, width, height)] [, pyramid_levels]
+    if len(rest) not in (0, 1, 4, 5):
+        raise Exception(
+            f"find_template() takes 1, 2, 5 or 6 arguments (template_name [, left, top, width, height] [, pyramid_levels]), got {len(rest) + 1}"
+        )
+    pos = template_match.locate_template_on_screen(
+        template_dir=interp.template_dir,
+        template_name=str(template_name),
+        downscale=1.0,
+        region=_region(rest[:4]),
+        pyramid_levels=int(rest[-1]) if len(rest) in (1, 5) else 0,
+    )
+    if pos is not None and len(pos) != 0:
+        return pos[0][0], pos[0][1]
+    return None, None  # not found
 
-                # passthrough for inlined rules
-                case _ if len(c) == 1:
-                    return self.eval_sibling(context, c[0])
 
-                case _:
-                    raise Exception(f"Unknown tree node: {t}")
+@builtin("find_templates", stateful=True)
+def find_templates_func(interp, template_name, *rest):
+    # [region (left, top, width, height)] [, top_k [, pyramid_levels]]
+    if len(rest) not in (0, 1, 2, 4, 5, 6):
+        raise Exception(
+            f"find_templates() takes 1-3, 5, 6 or 7 arguments (template_name [, left, top, width, height] [, top_k [, pyramid_levels]]), got {len(rest) + 1}"
+        )
+    region = rest[:4] if len(rest) >= 4 else ()
+    options = rest[len(region) :]
+    top_k = int(options[0]) if len(options) > 0 else 10
+    positions = template_match.locate_template_on_screen(
+        template_dir=interp.template_dir,
+        template_name=str(template_name),
+        downscale=1.0,
+        top_k=top_k,
+        region=_region(region),
+        pyramid_levels=int(options[1]) if len(options) > 1 else 0,
+    )
+    if positions is not None and len(positions) > 0:
+        # Return tuple of tuples
+        return tuple(positions)
+    return tuple()  # empty tuple if not found
 
-        raise Exception(f"Unknown node type: {type(node)}")
 
+def _region(args) -> tuple | None:
+    # (left, top, width, height) builtin arguments, or None for no region
+    if len(args) < 4:
+        return None
+    left, top, width, height = (int(v) for v in args[:4])
+    if width <= 0 or height <= 0:
+        raise Exception(f"Region width and height must be positive, got {args[:4]}")
+    return left, top, width, height
+
+
+@builtin("get_coordinates")
+def get_coordinates_func(message, use_cache=False):
+    x, y = get_coordinates_interactive(str(message), bool(use_cache))
+    return (x, y)
+
+
+@builtin("check_pixel_color")
+def check_pixel_color_func(x, y, radius, r, g, b, tolerance=0):
+    found = check_pixel_color_in_radius(
+        int(x), int(y), int(radius), int(r), int(g), int(b), int(tolerance)
+    )
+    return 1 if found else 0
 
-def wait_func(duration, random_range: tuple = (0, 0)):
-    wait_time = duration
-    random_delay = random.uniform(random_range[0], random_range[1])
-    print(f"Waiting for {wait_time + random_delay} ms...")
-    time.sleep((wait_time + random_delay) / 1000)
-    return wait_time + random_delay
+
+@builtin("get_pixel_color")
+def get_pixel_color_func(alias, use_cache=False):
+    r, g, b = get_pixel_color_interactive(str(alias), bool(use_cache))
+    return (r, g, b)
+
+
+@builtin("left_click")
+def left_click_func():
+    input_handler.left_click()
+    return 0
+
+
+@builtin("send_input")
+def send_input_func(type, key, action):
+    input_handler.send_input(str(type), str(key), str(action))
+    return 0
+
+
+@builtin("press_and_release")
+def press_and_release_func(delay_ms, key, *keys):
+    keys = [str(k) for k in (key, *keys)]
+    input_handler.press_and_release(int(delay_ms), *keys)
+    return 0
+
+
+# recording reads the keyboard, so its arguments are never debugged
+@builtin("record", debug=False)
+def record_func(
+    recording_name,
+    start_button="space",
+    stop_button="esc",
+    # inf means only cares about points before events and not mimicking mouse path
+    squash_distance=float("inf"),
+):
+    if squash_distance != float("inf"):
+        squash_distance = int(squash_distance)
+    record_interactive(
+        str(recording_name), str(start_button), str(stop_button), squash_distance
+    )
+    return 0
+
+
+@builtin("playback", debug=False)
+def playback_func(recording_name, stop_button="esc"):
+    playback_interactive(str(recording_name), str(stop_button))
+    return 0
+
+
+@builtin("recording_exists")
+def recording_exists_func(recording_name):
+    return 1 if recording_exists(str(recording_name)) else 0
+
+
+@builtin("len")
+def len_func(val):
+    if val is None:
+        return 0
+    if isinstance(val, (tuple, list, str)):
+        return len(val)
+    raise Exception(f"len() requires a tuple, list, or string, got {type(val)}")
+
+
+@builtin("time")
+def time_func():
+    return time.time()
+
+
+@builtin("shuffle")
+def shuffle_func(val):
+    if val is None:
+        return tuple()
+    if isinstance(val, tuple):
+        # Convert to list, shuffle, convert back to tuple
+        lst = list(val)
+        random.shuffle(lst)
+        return tuple(lst)
+    elif isinstance(val, list):
+        # Create a copy and shuffle it
+        lst = val.copy()
+        random.shuffle(lst)
+        return lst
+    raise Exception(f"shuffle() requires a tuple or list, got {type(val)}")
+
+
+@builtin("get_pixel_at")
+def get_pixel_at_func(x, y):
+    x = int(x)
+    y = int(y)
+    # Capture pixel color at the specified coordinates
+    return screen.pixel_at(x, y)
+
+
+@builtin("append")
+def append_func(lst, item):
+    if not isinstance(lst, list):
+        raise Exception(f"append() requires a list as first argument, got {type(lst)}")
+    # Append the item to the list (modifies in place)
+    lst.append(item)
+    return lst
+
+
+@builtin("pop")
+def pop_func(lst, index=None):
+    if not isinstance(lst, list):
+        raise Exception(f"pop() requires a list as first argument, got {type(lst)}")
+    if len(lst) == 0:
+        raise Exception("pop() called on empty list")
+    # Pop from specific index or from end
+    if index is None:
+        return lst.pop()
+    index = int(index)
+    if index < 0 or index >= len(lst):
+        raise Exception(
+            f"pop() index {index} out of range for list of length {len(lst)}"
+        )
+    return lst.pop(index)
+
+
+@builtin("capture_region")
+def capture_region_func(region_key, overwrite_cache=False):
+    return ocr.region_capture(str(region_key), bool(overwrite_cache))
+
+
+@builtin("mouse_position")
+def mouse_position_func():
+    pos = pyautogui.position()
+    return (pos.x, pos.y)
+
+
+@builtin("ocr_find_text")
+def ocr_find_text_func(region=None, min_conf=0.45, filter=None, upscale=1.0):
+    if filter is not None:
+        if isinstance(filter, (list, tuple)):
+            filter = [str(f) for f in filter]
+        else:
+            filter = [str(filter)]
+    results = ocr.ocr_find_text(
+        region=region,
+        min_conf=float(min_conf),
+        filter=filter,
+        upscale=float(upscale),
+    )
+    if results is None:
+        return []
+    # Convert OCRResult objects to tuples for macroni
+    # Format: [(text, conf, [[x1, y1], [x2, y2], [x3, y3], [x4, y4]]), ...]
+    return [(r.text, r.conf, r.bbox) for r in results]
+
+
+@builtin("call_native")
+def call_native_func(target, *args):
+    # "module:function"; arguments and result are shared, not converted
+    return resolve_native(str(target))(*args)
 
 
 def load_coordinates_cache(cache_file="coordinates_cache.json"):
@@ -1002,6 +943,8 @@ def load_coordinates_cache(cache_file="coordinates_cache.json"):
         try:
             with open(cache_file, "r") as f:
                 return json.load(f)
+        except ScriptTimeout:
+            raise
         except Exception as e:
             print(f"Warning: Could not load cache file: {e}")
             return {}
@@ -1013,6 +956,8 @@ def save_coordinates_cache(cache, cache_file="coordinates_cache.json"):
     try:
         with open(cache_file, "w") as f:
             json.dump(cache, f, indent=2)
+    except ScriptTimeout:
+        raise
     except Exception as e:
         print(f"Warning: Could not save cache file: {e}")
 
@@ -1073,6 +1018,8 @@ def load_pixel_colors_cache(cache_file="pixel_colors_cache.json"):
         try:
             with open(cache_file, "r") as f:
                 return json.load(f)
+        except ScriptTimeout:
+            raise
         except Exception as e:
             print(f"Warning: Could not load pixel colors cache file: {e}")
             return {}
@@ -1084,6 +1031,8 @@ def save_pixel_colors_cache(cache, cache_file="pixel_colors_cache.json"):
     try:
         with open(cache_file, "w") as f:
             json.dump(cache, f, indent=2)
+    except ScriptTimeout:
+        raise
     except Exception as e:
         print(f"Warning: Could not save pixel colors cache file: {e}")
 
@@ -1127,9 +1076,7 @@ def get_pixel_color_interactive(alias, use_cache=False):
 
     # Capture the current mouse position and pixel color
     x, y = pyautogui.position()
-    screenshot = ImageGrab.grab(bbox=(x, y, x + 1, y + 1))
-    pixel = screenshot.getpixel((0, 0))
-    r, g, b = pixel[0], pixel[1], pixel[2]
+    r, g, b = screen.pixel_at(x, y)
 
     print(f"✓ Captured color at ({x}, {y}): RGB({r}, {g}, {b})\n")
 
@@ -1160,40 +1107,9 @@ def check_pixel_color_in_radius(
     Returns:
         bool: True if the color is found within radius, False otherwise
     """
-    # Define the bounding box for the screenshot
-    left = center_x - radius
-    top = center_y - radius
-    right = center_x + radius
-    bottom = center_y + radius
-
-    # Capture screenshot of the region
-    screenshot = ImageGrab.grab(bbox=(left, top, right, bottom))
-    pixels = screenshot.load()
-
-    width, height = screenshot.size
-
-    # Check each pixel in the captured region
-    for x in range(width):
-        for y in range(height):
-            # Calculate distance from center
-            dx = x - radius
-            dy = y - radius
-            distance = (dx * dx + dy * dy) ** 0.5
-
-            # Only check pixels within the radius
-            if distance <= radius:
-                pixel = pixels[x, y]
-                r, g, b = pixel[0], pixel[1], pixel[2]
-
-                # Check if pixel matches target color within tolerance
-                if (
-                    abs(r - target_r) <= tolerance
-                    and abs(g - target_g) <= tolerance
-                    and abs(b - target_b) <= tolerance
-                ):
-                    return True
-
-    return False
+    return screen.color_in_radius(
+        center_x, center_y, radius, (target_r, target_g, target_b), tolerance
+    )
 
 
 def load_recordings_cache(cache_file="recordings_cache.json"):
@@ -1202,6 +1118,8 @@ def load_recordings_cache(cache_file="recordings_cache.json"):
         try:
             with open(cache_file, "r") as f:
                 return json.load(f)
+        except ScriptTimeout:
+            raise
         except Exception as e:
             print(f"Warning: Could not load recordings cache file: {e}")
             return {}
@@ -1213,6 +1131,8 @@ def save_recordings_cache(cache, cache_file="recordings_cache.json"):
     try:
         with open(cache_file, "w") as f:
             json.dump(cache, f, indent=2)
+    except ScriptTimeout:
+        raise
     except Exception as e:
         print(f"Warning: Could not save recordings cache file: {e}")
 
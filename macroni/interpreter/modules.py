@@ -0,0 +1,197 @@
+import hashlib
+import os
+from typing import Iterable
+from lark import Tree
+from . import parse_cache
+
+
+class Module:
+    """
+    A parsed script file. Modules are shared by every program that imports
+    them in this process, so neither the tree nor the tables may be mutated.
+    """
+
+    __slots__ = (
+        "path",
+        "stamp",
+        "digest",
+        "tree",
+        "imports",
+        "defs",
+        "functions",
+        "body",
+    )
+
+    def __init__(self, path: str, stamp: tuple, source: str, tree: Tree):
+        self.path = path
+        self.stamp = stamp
+        self.digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+        self.tree = tree
+        # import paths as written, resolved when the program is loaded
+        self.imports = get_import_paths(tree)
+        # top-level functions: name -> (params, body), bound by reference
+        self.defs = []
+        self.functions = {}
+        stmts = []
+        for stmt in _statements(tree):
+            kind = stmt.data if isinstance(stmt, Tree) else None
+            if kind == "func_def" and stmt.children:
+                name, params, body = _function_parts(stmt)
+                if body is not None:
+                    self.defs.append(stmt)
+                    self.functions[name] = (params, body)
+                    continue
+            if kind != "import_stmt":
+                stmts.append(stmt)
+        # what is left to run when the module is imported
+        self.body = Tree("stmt_block", stmts)
+
+    def __repr__(self):
+        return f"<module {self.path}>"
+
+
+class Program:
+    """
+    A script and the modules it imports, transitively, in the order they
+    have to run: every module after the modules it imports, each once.
+    """
+
+    __slots__ = ("main", "imports", "digest")
+
+    def __init__(self, main: Module, imports: list[Module]):
+        self.main = main
+        self.imports = imports
+        # changes whenever the script or any module it imports changes
+        digests = "\n".join(m.digest for m in [*imports, main])
+        self.digest = hashlib.sha256(digests.encode("utf-8")).hexdigest()[:16]
+
+    def flatten(self) -> Tree:
+        """
+        One tree running the whole program, for the transpiler. Imported
+        functions come first in each module, as they are bound on import.
+        """
+        stmts = []
+        for module in self.imports:
+            stmts.extend(module.defs)
+            stmts.extend(module.body.children)
+        stmts.extend(_statements(self.main.tree))
+        return Tree("stmt_block", stmts)
+
+
+# absolute path -> module, parsed once per process
+_modules: dict[str, Module] = {}
+
+
+def load_module(path: str) -> Module:
+    """
+    Parse the script at path, or return the module parsed earlier if the
+    file did not change since.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    module = _modules.get(path)
+    if module is not None and module.stamp == stamp:
+        return module
+
+    with open(path, "r") as f:
+        source = f.read()
+    module = Module(path, stamp, source, parse_cache.parse_program(path, source))
+    _modules[path] = module
+    return module
+
+
+def load_program(filepath: str) -> Program:
+    """
+    Load a script and everything it imports.
+    """
+    main = load_module(filepath)
+    return Program(main, resolve_imports(main))
+
+
+def program_from_source(
+    source: str, path: str = "<string>", imports: Iterable[str] = ()
+) -> Program:
+    """
+    Load a script given as source, as if it was the file at path (which
+    does not have to exist; its imports are resolved next to it).
+
+    Args:
+        imports: paths of scripts to import before the script's own imports
+    """
+    main = Module(path, None, source, parse_cache.parse(source))
+    main.imports = [*imports, *main.imports]
+    return Program(main, resolve_imports(main))
+
+
+def resolve_imports(module: Module) -> list[Module]:
+    """
+    Modules imported by module, directly or not, dependencies first.
+
+    Raises:
+        Exception: if a module ends up importing itself
+    """
+    order = []
+    done = set()
+    _visit(module, [module.path], order, done)
+    return order
+
+
+def _visit(module: Module, stack: list[str], order: list, done: set):
+    for imp in module.imports:
+        dep = load_module(_find(imp, module.path))
+        if dep.path in stack:
+            cycle = stack[stack.index(dep.path) :] + [dep.path]
+            names = " -> ".join(os.path.relpath(p) for p in cycle)
+            raise Exception(f"Circular import: {names}")
+        if dep.path in done:
+            continue
+        _visit(dep, stack + [dep.path], order, done)
+        done.add(dep.path)
+        order.append(dep)
+
+
+def _find(imp: str, importer: str) -> str:
+    # relative to the working directory, then to the importing file
+    if os.path.exists(imp):
+        return imp
+    beside = os.path.join(os.path.dirname(importer), imp)
+    if os.path.exists(beside):
+        return beside
+    raise Exception(f"Cannot import {imp}: file not found")
+
+
+def get_import_paths(node):
+    """Recursively extract import paths from the AST node."""
+    import_paths = []
+
+    if hasattr(node, "data") and node.data == "import_stmt":
+        # Extract the string value (import path)
+        import_path = node.children[0].value.strip('"').strip("'")
+        import_paths.append(import_path)
+
+    # Recursively check child nodes
+    for child in getattr(node, "children", []):
+        import_paths.extend(get_import_paths(child))
+
+    return import_paths
+
+
+def _function_parts(node: Tree) -> tuple[str, list[str], Tree | None]:
+    # name, parameter names and body of a func_def node
+    name = str(node.children[0])
+    params = []
+    body = None
+    for child in node.children[1:]:
+        if isinstance(child, Tree) and child.data == "params":
+            params = [str(x) for x in child.children]
+        elif isinstance(child, Tree) and child.data == "stmt_block":
+            body = child
+    return name, params, body
+
+
+def _statements(tree: Tree) -> list:
+    # start -> stmt_block
+    while tree.data != "stmt_block":
+        tree = tree.children[0]
+    return tree.children
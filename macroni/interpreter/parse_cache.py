@@ -0,0 +1,109 @@
+import functools
+import glob
+import hashlib
+import os
+import pickle
+import lark
+from lark import Tree
+from .folding import FOLDING_VERSION, fold_constants
+from .grammar import calc_grammar, calc_parser
+
+CACHE_DIR = "__macroni_cache__"
+# sources up to this many characters are memoized in memory (REPL, debugger eval)
+SMALL_SOURCE = 4096
+# programs kept in memory by a long-running process (macroni serve)
+MAX_PROGRAMS = 32
+# trees pickled by another grammar, lark version or folding pass are never reused
+GRAMMAR_KEY = hashlib.sha256(
+    f"{lark.__version__}\n{FOLDING_VERSION}\n{calc_grammar}".encode("utf-8")
+).hexdigest()[:16]
+
+
+# digest of a program's source -> its tree, most recently used last
+_programs: dict[str, Tree] = {}
+
+
+def parse(source: str) -> Tree:
+    """
+    Parse source, reusing the tree of an identical small source parsed
+    before. Trees are shared, so they must not be mutated.
+    """
+    if len(source) > SMALL_SOURCE:
+        return parse_source(source)
+    return _parse_small(source)
+
+
+def parse_source(source: str) -> Tree:
+    """
+    Parse source without caching, with literals decoded and constants folded.
+    """
+    return fold_constants(calc_parser.parse(source))
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_small(source: str) -> Tree:
+    return parse_source(source)
+
+
+def parse_program(filepath: str, source: str) -> Tree:
+    """
+    Parse source, the content of the script at filepath.
+
+    Trees are cached on disk keyed by the hash of source, so editing the
+    script invalidates the entry. Entries of older versions are removed.
+    """
+    digest = _digest(source)
+    tree = _programs.pop(digest, None)
+    if tree is None:
+        tree = _load_program(filepath, digest, source)
+    _programs[digest] = tree
+    if len(_programs) > MAX_PROGRAMS:
+        del _programs[next(iter(_programs))]
+    return tree
+
+
+def _load_program(filepath: str, digest: str, source: str) -> Tree:
+    path = _cache_file(filepath, f"{digest}.tree")
+    try:
+        with open(path, "rb") as f:
+            key, tree = pickle.load(f)
+        if key == GRAMMAR_KEY:
+            return tree
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        pass
+
+    tree = parse_source(source)
+    pattern = glob.escape(_cache_file(filepath, "")) + "[0-9a-f]" * 16 + ".tree"
+    for stale in glob.glob(pattern):
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+    _write(
+        path,
+        "wb",
+        lambda f: pickle.dump((GRAMMAR_KEY, tree), f, pickle.HIGHEST_PROTOCOL),
+    )
+    return tree
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _cache_file(filepath: str, suffix: str) -> str:
+    directory = os.path.join(os.path.dirname(os.path.abspath(filepath)), CACHE_DIR)
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(directory, f"{stem}.{suffix}")
+
+
+def _write(path: str, mode: str, dump):
+    # the cache is an optimization: an unwritable directory only costs a parse
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, mode) as f:
+            dump(f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
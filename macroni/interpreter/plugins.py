@@ -0,0 +1,100 @@
+import importlib
+import importlib.util
+import os
+import sys
+from typing import Any, Callable, Iterable
+
+# installed packages declare plugins under this entry point group
+ENTRY_POINT_GROUP = "macroni.plugins"
+# directories of plugin files, separated by os.pathsep
+PLUGIN_PATH_ENV = "MACRONI_PLUGIN_PATH"
+
+# entry point names and plugin files imported by this process
+_loaded: set[str] = set()
+_entry_points_loaded = False
+# "module:function" -> callable, for @call_native
+_natives: dict[str, Callable] = {}
+
+
+def load_plugins(directories: Iterable[str] = ()) -> list[str]:
+    """
+    Import the plugins of installed packages, of the directories in
+    MACRONI_PLUGIN_PATH and of directories. Each plugin is imported once
+    per process; importing it registers its builtins (see
+    registry.register_builtin).
+
+    An installed package declares its plugin as an entry point in the
+    "macroni.plugins" group, either a module or a function called without
+    arguments. A plugin directory holds one plugin per *.py file.
+
+    Returns:
+        list[str]: the plugins imported by this call
+    """
+    global _entry_points_loaded
+    loaded = []
+    if not _entry_points_loaded:
+        # scanning installed packages takes a while, so only when needed
+        from importlib.metadata import entry_points
+
+        _entry_points_loaded = True
+        for ep in entry_points(group=ENTRY_POINT_GROUP):
+            if ep.name in _loaded:
+                continue
+            _loaded.add(ep.name)
+            try:
+                plugin = ep.load()
+                if callable(plugin):
+                    plugin()
+            except Exception as e:
+                raise Exception(f"Cannot load plugin {ep.name} ({ep.value}): {e}")
+            loaded.append(ep.name)
+
+    env = os.environ.get(PLUGIN_PATH_ENV, "")
+    for directory in [*env.split(os.pathsep), *directories]:
+        if not directory:
+            continue
+        if not os.path.isdir(directory):
+            raise Exception(f"Plugin directory not found: {directory}")
+        for entry in sorted(os.listdir(directory)):
+            path = os.path.abspath(os.path.join(directory, entry))
+            if not entry.endswith(".py") or path in _loaded:
+                continue
+            _loaded.add(path)
+            _import_file(path)
+            loaded.append(path)
+    return loaded
+
+
+def _import_file(path: str):
+    name = "macroni_plugin_" + os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception as e:
+        del sys.modules[name]
+        raise Exception(f"Cannot load plugin {path}: {e}")
+
+
+def resolve_native(target: str) -> Callable:
+    """
+    The Python callable named by target, "module:function" (the function
+    may be dotted, e.g. "builtins:list.append"). Resolved once per target.
+    """
+    fn = _natives.get(target)
+    if fn is not None:
+        return fn
+    module_name, sep, attr = target.partition(":")
+    if not sep or not module_name or not attr:
+        raise Exception(f"Native function must be 'module:function', got {target!r}")
+    try:
+        fn: Any = importlib.import_module(module_name)
+        for part in attr.split("."):
+            fn = getattr(fn, part)
+    except (ImportError, AttributeError) as e:
+        raise Exception(f"Cannot find native function {target}: {e}")
+    if not callable(fn):
+        raise Exception(f"Native function {target} is not callable")
+    _natives[target] = fn
+    return fn
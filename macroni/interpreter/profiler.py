@@ -0,0 +1,111 @@
+import os
+import time
+from typing import Any, Callable
+
+# what a profiled frame is: a source line, a user function or a builtin
+LINE = "line"
+FUNCTION = "fn"
+BUILTIN = "builtin"
+
+
+class Profiler:
+    """
+    Instrumenting profiler for the compiled engine (see Compiler.profiler).
+
+    Records wall time per source line, user function and builtin:
+    inclusive time counts everything until the frame returns, exclusive
+    time leaves out the profiled frames it ran. A recursive frame adds to
+    its inclusive time only at its outermost level.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        # (kind, label) -> [calls, inclusive, exclusive]
+        self.stats: dict[tuple[str, str], list] = {}
+        # labels from the outermost frame down -> exclusive seconds
+        self.stacks: dict[tuple[str, ...], float] = {}
+        # open frames: [key, path, start, seconds spent in child frames]
+        self._frames: list[list] = []
+        # key -> how many frames of it are open
+        self._open: dict[tuple[str, str], int] = {}
+
+    def wrap(self, kind: str, label: str, fn: Callable) -> Callable:
+        """
+        Returns:
+            fn, recording each call as a frame
+        """
+        key = (kind, label)
+        enter, leave = self.enter, self.leave
+
+        def profiled(*args):
+            enter(key)
+            try:
+                return fn(*args)
+            finally:
+                leave()
+
+        return profiled
+
+    def enter(self, key: tuple[str, str]):
+        frames = self._frames
+        path = (frames[-1][1] if frames else ()) + (key[1],)
+        self._open[key] = self._open.get(key, 0) + 1
+        frames.append([key, path, self.clock(), 0.0])
+
+    def leave(self):
+        key, path, start, children = self._frames.pop()
+        elapsed = self.clock() - start
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats[key] = [0, 0.0, 0.0]
+        stat[0] += 1
+        opened = self._open[key] - 1
+        self._open[key] = opened
+        if opened == 0:
+            stat[1] += elapsed
+        stat[2] += elapsed - children
+        self.stacks[path] = self.stacks.get(path, 0.0) + elapsed - children
+        if self._frames:
+            self._frames[-1][3] += elapsed
+
+    def table(self, limit: int = 30) -> str:
+        """
+        The most expensive frames by inclusive time, as a text table.
+        """
+        rows = sorted(self.stats.items(), key=lambda kv: kv[1][1], reverse=True)
+        total = sum(stat[2] for stat in self.stats.values()) or 1.0
+        lines = [
+            f"{'kind':<8} {'name':<40} {'calls':>9} {'incl (s)':>10} "
+            f"{'excl (s)':>10} {'excl %':>7}"
+        ]
+        for (kind, label), (calls, inclusive, exclusive) in rows[:limit]:
+            lines.append(
+                f"{kind:<8} {label[-40:]:<40} {calls:>9} {inclusive:>10.4f} "
+                f"{exclusive:>10.4f} {100 * exclusive / total:>6.1f}%"
+            )
+        if len(rows) > limit:
+            lines.append(f"... {len(rows) - limit} more")
+        return "\n".join(lines)
+
+    def write_collapsed(self, path: str):
+        """
+        Write the stacks in the collapsed format flamegraph tools read:
+        `frame;frame;frame microseconds` per line.
+        """
+        with open(path, "w") as f:
+            for stack, seconds in sorted(self.stacks.items()):
+                micros = round(seconds * 1e6)
+                if micros > 0:
+                    names = ";".join(name.replace(";", ":") for name in stack)
+                    f.write(f"{names} {micros}\n")
+
+
+def line_label(source: str | None, node: Any) -> str | None:
+    """
+    "file:line" of a statement, or None if the parser did not record it.
+    """
+    line = getattr(getattr(node, "meta", None), "line", None)
+    if line is None:
+        return None
+    name = os.path.basename(source) if source else "<script>"
+    return f"{name}:{line}"
@@ -0,0 +1,207 @@
+import ast
+import inspect
+from functools import partial
+from typing import Any, Callable
+
+
+class Builtin:
+    """
+    A function scripts call as @name(...).
+
+    The parameters, defaults and *rest of fn are the builtin's signature,
+    so they are declared once, in Python. Engines check the argument count
+    of each call site once, when compiling it, and then call fn directly.
+    """
+
+    __slots__ = ("name", "fn", "signature", "min_args", "max_args", "stateful", "debug")
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        signature: str | None = None,
+        stateful: bool = False,
+        debug: bool = True,
+    ):
+        """
+        Args:
+            name: name in scripts, without the @
+            fn: implementation, called with the evaluated arguments
+            signature: parameters as seen by scripts, e.g. "(x, y, k=3)",
+                instead of those of fn
+            stateful: fn takes the Interpreter as its first argument
+            debug: False to evaluate the arguments with the debugger off
+        """
+        self.name = name
+        self.fn = fn
+        self.stateful = stateful
+        self.debug = debug
+        if signature is not None:
+            params = list(parse_signature(signature).parameters.values())
+        else:
+            params = list(_signature(fn).parameters.values())
+            if stateful:
+                params = params[1:]
+        self.signature = inspect.Signature(params)
+        positional = [p for p in params if p.kind in _POSITIONAL]
+        self.min_args = sum(1 for p in positional if p.default is p.empty)
+        if any(p.kind is p.VAR_POSITIONAL for p in params):
+            self.max_args = None
+        else:
+            self.max_args = len(positional)
+
+    def __repr__(self):
+        return f"<builtin @{self.name}{self.signature}>"
+
+    def check(self, argc: int) -> str | None:
+        """
+        Returns:
+            The error for a call with argc arguments, or None if it is valid
+        """
+        if argc >= self.min_args and (self.max_args is None or argc <= self.max_args):
+            return None
+        if self.max_args is None:
+            expected = f"at least {self.min_args}"
+        elif self.min_args == self.max_args:
+            expected = f"exactly {self.min_args}"
+        elif self.max_args == self.min_args + 1:
+            expected = f"{self.min_args} or {self.max_args}"
+        else:
+            expected = f"{self.min_args} to {self.max_args}"
+        plural = "argument" if expected.endswith(" 1") else "arguments"
+        return f"{self.name}{self.signature} takes {expected} {plural}, got {argc}"
+
+    def bind(self, interp) -> Callable:
+        """
+        Returns:
+            fn, ready to be called with the arguments of a call
+        """
+        return partial(self.fn, interp) if self.stateful else self.fn
+
+    def call(self, interp, args: list[Any]) -> Any:
+        """
+        Check and run a call with already evaluated arguments.
+        """
+        error = self.check(len(args))
+        if error is not None:
+            raise Exception(error)
+        return self.bind(interp)(*args)
+
+
+_EMPTY = inspect.Parameter.empty
+_POSITIONAL = (
+    inspect.Parameter.POSITIONAL_ONLY,
+    inspect.Parameter.POSITIONAL_OR_KEYWORD,
+)
+
+# name -> Builtin, shared by every engine
+BUILTINS: dict[str, Builtin] = {}
+
+
+def builtin(
+    name: str, signature: str | None = None, stateful: bool = False, debug: bool = True
+):
+    """
+    Decorator registering a function as the builtin @name.
+    See Builtin for the arguments.
+    """
+
+    def register(fn: Callable) -> Callable:
+        BUILTINS[name] = Builtin(
+            name, fn, signature=signature, stateful=stateful, debug=debug
+        )
+        return fn
+
+    return register
+
+
+def register_builtin(
+    name: str, fn: Callable, signature: str | None = None, replace: bool = False
+) -> Builtin:
+    """
+    Make fn callable from scripts as @name(...).
+
+    Arguments and return values are passed as they are, without copying:
+    numbers, strings, tuples and lists are the same Python objects in both
+    languages (true/false are 1/0, null is None), so a list changed by fn
+    is changed for the script too. Any other object fn returns can be
+    stored and passed back to Python.
+
+    Args:
+        name: name in scripts, without the @
+        fn: any Python callable
+        signature: parameters as seen by scripts, e.g. "(x, y, k=3)", for
+            callables that cannot be introspected or take other parameters
+        replace: allow replacing a builtin registered under the same name
+
+    Raises:
+        Exception: if name is not a valid name or is already taken
+    """
+    if not name.isidentifier() or name == "foreach_tick":
+        raise Exception(f"Invalid builtin name: {name!r}")
+    # registers the core builtins, which plugins may not take over by accident
+    import macroni.interpreter.macroni_interpret  # noqa: F401
+
+    found = BUILTINS.get(name)
+    if found is not None and found.fn is not fn and not replace:
+        raise Exception(f"Builtin @{name} is already registered")
+    BUILTINS[name] = Builtin(name, fn, signature=signature)
+    return BUILTINS[name]
+
+
+def parse_signature(text: str) -> inspect.Signature:
+    """
+    Parse a Python parameter list such as "(x, y=2, *rest)". Defaults must
+    be literals.
+    """
+    text = text.strip()
+    if not text.startswith("("):
+        text = f"({text})"
+    try:
+        args = ast.parse(f"def _{text}: pass").body[0].args
+        defaults = [ast.literal_eval(d) for d in args.defaults]
+    except (SyntaxError, ValueError) as e:
+        raise Exception(f"Invalid builtin signature {text}: {e}")
+    if args.kwonlyargs or args.kwarg:
+        raise Exception(f"Invalid builtin signature {text}: scripts pass no keywords")
+    positional = args.posonlyargs + args.args
+    first_default = len(positional) - len(defaults)
+    params = [
+        inspect.Parameter(
+            arg.arg,
+            inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            default=defaults[i - first_default] if i >= first_default else _EMPTY,
+        )
+        for i, arg in enumerate(positional)
+    ]
+    if args.vararg:
+        params.append(
+            inspect.Parameter(args.vararg.arg, inspect.Parameter.VAR_POSITIONAL)
+        )
+    return inspect.Signature(params)
+
+
+def _signature(fn: Callable) -> inspect.Signature:
+    try:
+        return inspect.signature(fn)
+    except (TypeError, ValueError):
+        # e.g. some C functions: accept anything, fn checks its arguments
+        return parse_signature("(*args)")
+
+
+def lookup(name: str) -> Builtin:
+    """
+    Raises:
+        Exception: if there is no builtin called name
+    """
+    found = BUILTINS.get(name)
+    if found is None:
+        raise Exception(f"Unknown built-in: @{name}")
+    return found
+
+
+def name_of(node) -> str:
+    """
+    Name of the builtin a `builtin` tree node calls, without the @.
+    """
+    return str(node.children[0])[1:]
@@ -0,0 +1,64 @@
+from lark import Tree, Token
+from .types import UNSET
+
+# every name some function frame may bind (parameters, assigned locals and
+# `outer` names); a function reading any other name it does not assign can
+# only find it at the top level, without walking its callers
+FRAME_NAMES: set[str] = set()
+
+
+class Scope:
+    """
+    Static layout of a function frame.
+
+    Parameters come first, followed by every other name assigned in the
+    body, each with a fixed slot index. Names declared with `outer` keep a
+    slot too: until the `outer` statement runs they behave like locals.
+    """
+
+    __slots__ = ("name", "names", "index", "outer", "nparams", "_unset_tail")
+
+    def __init__(self, name: str, params: list[str], assigned: list[str], outer):
+        self.name = name
+        self.names = list(params) + [n for n in assigned if n not in params]
+        self.index = {n: i for i, n in enumerate(self.names)}
+        self.outer = frozenset(outer)
+        self.nparams = len(params)
+        self._unset_tail = [UNSET] * (len(self.names) - self.nparams)
+        FRAME_NAMES.update(self.names)
+        FRAME_NAMES.update(self.outer)
+
+    def new_slots(self, args: list) -> list:
+        """
+        Build the slot array for a call: arguments, then unset locals.
+        """
+        return args + self._unset_tail if self._unset_tail else args
+
+    def __repr__(self):
+        return f"Scope({self.name}: {', '.join(self.names)})"
+
+
+def resolve_function(name: str, params: list[str], body: Tree) -> Scope:
+    """
+    Resolver pass for a function body: collect every name it assigns and
+    every name it declares `outer`. Nested function definitions get their
+    own scope and are not descended into.
+    """
+    assigned: list[str] = []
+    outer: list[str] = []
+    stack = [body]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, Tree):
+            continue
+        if node.data == "func_def":
+            continue
+        if node.data == "store_val":
+            for child in node.children:
+                if isinstance(child, Token) and child.type == "NAME":
+                    if child not in assigned:
+                        assigned.append(str(child))
+        elif node.data == "outer_stmt":
+            outer.extend(str(child) for child in node.children)
+        stack.extend(reversed(node.children))
+    return Scope(name, params, assigned, outer)
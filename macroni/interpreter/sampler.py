@@ -0,0 +1,225 @@
+import os
+import signal
+import sys
+import threading
+from types import CodeType, FrameType
+from typing import Any
+from lark import Tree
+from . import compiler, trampoline
+from .macroni_interpret import Interpreter
+from .registry import BUILTINS
+
+
+def _nested_code(fn, name: str) -> CodeType:
+    # code object of the closure called name defined inside fn
+    for const in fn.__code__.co_consts:
+        if isinstance(const, CodeType) and const.co_name == name:
+            return const
+    raise Exception(f"No {name} in {fn.__qualname__}")
+
+
+# Python frames that tell where a macroni script is, by engine
+_STMT_LOOPS = frozenset(
+    {
+        _nested_code(compiler.Compiler._c_stmt_block, "run"),
+        _nested_code(compiler.Compiler._debug_block, "run"),
+        _nested_code(trampoline.StackCompiler._s_stmt_block, "run"),
+        _nested_code(trampoline.StackCompiler._s_debug_block, "run"),
+    }
+)
+_COMPILED_CALL = compiler.call_function.__code__
+_STACK_CALL = trampoline.call_function.__code__
+_DRIVE = trampoline.drive.__code__
+_TREE_EVAL = Interpreter.eval_node.__code__
+
+
+class Sampler:
+    """
+    Statistical profiler: a background thread looks at the Python stack of
+    the thread running the script every interval seconds and maps it back
+    to macroni frames (source lines, user functions, builtins), so the
+    script itself runs unchanged.
+
+    Works with every engine except code compiled by `macroni compile`,
+    where only builtins show up.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        """
+        Args:
+            interval: seconds between samples
+        """
+        self.interval = interval
+        # labels from the outermost frame down -> number of samples
+        self.samples: dict[tuple[str, ...], int] = {}
+        self.total = 0
+        # id(statement) -> file name, see add_program
+        self._files: dict[int, str] = {}
+        self._builtins: dict[CodeType, str] = {}
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add_program(self, program):
+        """
+        Label the lines of a modules.Program with the file they are in.
+        """
+        for module in [*program.imports, program.main]:
+            name = os.path.basename(module.path)
+            for block in module.tree.find_data("stmt_block"):
+                for stmt in block.children:
+                    self._files[id(stmt)] = name
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, thread_id: int | None = None):
+        """
+        Start sampling thread_id (by default the calling thread).
+        """
+        if self._thread is not None:
+            return
+        self._thread_id = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="macroni-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            try:
+                stack = self.macroni_stack(frame)
+            except Exception:
+                # the frame changed under us; skip this sample
+                continue
+            with self._lock:
+                self.total += 1
+                if stack:
+                    self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def macroni_stack(self, frame: FrameType) -> tuple[str, ...]:
+        """
+        Macroni frames of a Python stack, outermost first.
+        """
+        if len(self._builtins) != len(BUILTINS):
+            self._builtins = {
+                b.fn.__code__: f"@{b.name}"
+                for b in BUILTINS.values()
+                if hasattr(b.fn, "__code__")
+            }
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        labels = []
+        for frame in reversed(frames):
+            code = frame.f_code
+            if code is _DRIVE:
+                # generators suspended on the stack engine's explicit stack
+                for gen in frame.f_locals.get("stack", ())[:-1]:
+                    if gen.gi_frame is not None:
+                        self._label(gen.gi_frame, labels)
+                continue
+            self._label(frame, labels)
+        return tuple(labels)
+
+    def _label(self, frame: FrameType, labels: list[str]):
+        code = frame.f_code
+        if code in _STMT_LOOPS:
+            stmt_node = frame.f_locals.get("stmt_node")
+            if stmt_node is not None:
+                labels.append(self._line(stmt_node))
+        elif code is _COMPILED_CALL:
+            labels.append(f"{frame.f_locals['name']}()")
+        elif code is _STACK_CALL:
+            labels.append(f"{frame.f_locals['fn'].name}()")
+        elif code is _TREE_EVAL:
+            node = frame.f_locals.get("node")
+            if isinstance(node, Tree):
+                if node.data == "stmt_block" and "stmt" in frame.f_locals:
+                    labels.append(self._line(frame.f_locals["stmt"]))
+                elif node.data == "call" and node.children:
+                    labels.append(f"{node.children[0]}()")
+        elif code in self._builtins:
+            labels.append(self._builtins[code])
+
+    def _line(self, node: Any) -> str:
+        line = getattr(getattr(node, "meta", None), "line", "?")
+        return f"{self._files.get(id(node), '<script>')}:{line}"
+
+    def table(self, limit: int = 30) -> str:
+        """
+        Frames by the share of samples they were on the stack in.
+        """
+        with self._lock:
+            samples = dict(self.samples)
+            total = self.total
+        inclusive: dict[str, int] = {}
+        exclusive: dict[str, int] = {}
+        for stack, count in samples.items():
+            for label in set(stack):
+                inclusive[label] = inclusive.get(label, 0) + count
+            exclusive[stack[-1]] = exclusive.get(stack[-1], 0) + count
+        rows = sorted(inclusive.items(), key=lambda kv: kv[1], reverse=True)
+        lines = [
+            f"{total} samples every {self.interval * 1000:g} ms",
+            f"{'name':<40} {'total %':>8} {'self %':>8}",
+        ]
+        for label, count in rows[:limit]:
+            lines.append(
+                f"{label[-40:]:<40} {100 * count / max(total, 1):>7.1f}% "
+                f"{100 * exclusive.get(label, 0) / max(total, 1):>7.1f}%"
+            )
+        if len(rows) > limit:
+            lines.append(f"... {len(rows) - limit} more")
+        return "\n".join(lines)
+
+    def write_collapsed(self, path: str):
+        """
+        Write the samples in the collapsed format flamegraph tools read:
+        `frame;frame;frame count` per line.
+        """
+        with self._lock:
+            samples = dict(self.samples)
+        with open(path, "w") as f:
+            for stack, count in sorted(samples.items()):
+                f.write(f"{';'.join(s.replace(';', ':') for s in stack)} {count}\n")
+
+
+def install_dump_signal(sampler: Sampler, output: str, signum=None) -> bool:
+    """
+    Make a signal (SIGUSR1 by default) dump the profile to stderr and
+    output while the script keeps running. The first signal starts the
+    sampler if it is not running yet.
+
+    Returns:
+        bool: False where the signal does not exist (Windows)
+    """
+    signum = signum or getattr(signal, "SIGUSR1", None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def dump(signum, frame):
+        if not sampler.running:
+            sampler.start()
+            print("Sampling profiler started", file=sys.stderr)
+            return
+        print(sampler.table(), file=sys.stderr)
+        sampler.write_collapsed(output)
+        print(f"Collapsed stacks written to {output}", file=sys.stderr)
+
+    signal.signal(signum, dump)
+    return True
@@ -0,0 +1,554 @@
+from typing import Any, Generator
+from lark import Tree, Token
+from .compiler import (
+    Code,
+    CompiledFunction,
+    Compiler,
+    commit_tick_frame,
+    define_function,
+    destructure,
+    index_value,
+    tick_frame,
+)
+from .folding import OPERATORS
+from .registry import Builtin, name_of
+from .resolver import Scope, resolve_function
+from .types import (
+    ExecutionContext,
+    ControlSignal,
+    RET_SIG,
+    BRK_SIG,
+    EXIT_SIG,
+    CNT_SIG,
+    UNSET,
+)
+
+# A step is (fn, nested). fn takes the context; if nested is set it returns
+# a generator that yields the generators of its sub-steps to drive() and
+# is sent back their values, otherwise it returns the value itself.
+Step = tuple[Any, bool]
+
+# nodes that run or define user functions; anything else compiles to closures
+_STACK_NODES = frozenset({"call", "foreach_tick_func", "func_def"})
+
+_OPERATORS = {
+    **OPERATORS,
+    "index": index_value,
+    "tuple": lambda *vals: tuple(vals),
+    "args": lambda *vals: list(vals),
+    "list_items": lambda *vals: list(vals),
+}
+_ARITY = {"neg": 1, "tuple": None, "args": None, "list_items": None}
+
+
+class TailCall:
+    """
+    Value of `return f(...)` in tail position of a function body. The
+    frame is left and the caller's call loop makes the call instead, so a
+    chain of tail calls does not nest.
+    """
+
+    __slots__ = ("ctx", "fn", "args")
+
+    def __init__(self, ctx: ExecutionContext, fn: "StackFunction", args: list):
+        self.ctx = ctx
+        self.fn = fn
+        self.args = args
+
+
+class StackFunction(CompiledFunction):
+    """
+    A user function defined by the stack engine; code is a step function.
+    """
+
+    __slots__ = ("nested",)
+
+    def __init__(self, name, params, body, scope: Scope, step: Step):
+        super().__init__(name, params, body, scope, step[0])
+        self.nested = step[1]
+
+
+class StackCompiler(Compiler):
+    """
+    Compiler for the "stack" engine.
+
+    Calls into user functions, and every block or expression containing
+    one, become generators run by drive() on an explicit stack, so the
+    depth of macroni recursion is bounded by memory instead of the Python
+    recursion limit. Subtrees without calls are compiled to the regular
+    closures. Semantics are the same as the compiled engine.
+    """
+
+    def __init__(self, interp, debugger, builtins: dict[str, Builtin]):
+        super().__init__(interp, debugger, builtins)
+        # (id(node), scope, tail) -> (node, step); id(node) -> (node,
+        # whether it calls)
+        self._steps: dict[tuple[int, Scope | None, bool], tuple[Any, Step]] = {}
+        self._calls: dict[int, tuple[Any, bool]] = {}
+        # whether a return compiled now leaves the function (tail position)
+        self._tail = False
+
+    def compile(self, node: Any, scope: Scope | None = None) -> Code:
+        fn, nested = self.step(node, scope)
+        if not nested:
+            return fn
+        return lambda ctx: drive(fn(ctx))
+
+    def step(self, node: Any, scope: Scope | None = None) -> Step:
+        saved = self._scope, self._tail
+        self._scope, self._tail = scope, False
+        try:
+            return self._step(node)
+        finally:
+            self._scope, self._tail = saved
+
+    def function(self, name: str, params: list[str], body: Tree) -> StackFunction:
+        hit = self._functions.get(id(body))
+        if hit is not None and hit.body is body and hit.name == name:
+            return hit
+        scope = resolve_function(name, params, body)
+        saved = self._scope, self._tail
+        self._scope, self._tail = scope, True
+        try:
+            fn = StackFunction(name, params, body, scope, self._step(body))
+        finally:
+            self._scope, self._tail = saved
+        self._functions[id(body)] = fn
+        return fn
+
+    def _step(self, node: Any) -> Step:
+        key = (id(node), self._scope, self._tail)
+        hit = self._steps.get(key)
+        if hit is not None and hit[0] is node:
+            return hit[1]
+        step = None
+        if self._has_calls(node):
+            if node.data in _OPERATORS:
+                step = self._s_operator(node, node.children)
+            else:
+                handler = getattr(self, f"_s_{node.data}", None)
+                if handler is not None:
+                    step = handler(node, node.children)
+                elif len(node.children) == 1:
+                    # passthrough for inlined rules
+                    step = self._step(node.children[0])
+        if step is None:
+            # no calls inside, or a malformed node the closure reports
+            step = (self._code(node), False)
+        self._steps[key] = (node, step)
+        return step
+
+    def _expr(self, node: Any) -> Step:
+        saved = self._tail
+        self._tail = False
+        try:
+            return self._step(node)
+        finally:
+            self._tail = saved
+
+    def _has_calls(self, node: Any) -> bool:
+        if not isinstance(node, Tree):
+            return False
+        hit = self._calls.get(id(node))
+        if hit is not None and hit[0] is node:
+            return hit[1]
+        calls = node.data in _STACK_NODES or any(
+            [self._has_calls(child) for child in node.children]
+        )
+        self._calls[id(node)] = (node, calls)
+        return calls
+
+    # ---------- statements ----------
+
+    def _s_stmt_block(self, node, c) -> Step:
+        pairs = [(stmt, self._step(stmt)) for stmt in c]
+        if self.debug:
+            return self._s_debug_block(pairs), True
+
+        def run(ctx: ExecutionContext):
+            last = 0
+            for stmt_node, (stmt, nested) in pairs:
+                last = (yield stmt(ctx)) if nested else stmt(ctx)
+                if last.__class__ is TailCall or (
+                    last.__class__ is ControlSignal
+                    and (
+                        last.signal is RET_SIG
+                        or last.signal is BRK_SIG
+                        or last.signal is CNT_SIG
+                    )
+                ):
+                    return last
+            return last
+
+        return run, True
+
+    def _s_debug_block(self, pairs: list):
+        at_statement = self.debugger.at_statement
+
+        def run(ctx: ExecutionContext):
+            last = 0
+            for stmt_node, (stmt, nested) in pairs:
+                if ctx.debug:
+                    at_statement(ctx, stmt_node)
+                last = (yield stmt(ctx)) if nested else stmt(ctx)
+                if last.__class__ is TailCall or (
+                    last.__class__ is ControlSignal
+                    and (
+                        last.signal is RET_SIG
+                        or last.signal is BRK_SIG
+                        or last.signal is CNT_SIG
+                    )
+                ):
+                    return last
+            return last
+
+        return run
+
+    def _s_store_val(self, node, c) -> Step:
+        num_names = 0
+        for i in range(len(c) - 1):
+            if isinstance(c[i], Token) and c[i].type == "NAME":
+                num_names += 1
+        stores = [self._compile_store(str(x)) for x in c[:num_names]]
+        exprs = [self._expr(e) for e in c[num_names:]]
+
+        def run(ctx: ExecutionContext):
+            vals = []
+            for expr, nested in exprs:
+                vals.append((yield expr(ctx)) if nested else expr(ctx))
+            for store, val in zip(stores, destructure(vals, num_names)):
+                store(ctx, val)
+            return None
+
+        return run, True
+
+    def _s_expr_stmt(self, node, c) -> Step | None:
+        if len(c) != 1:
+            return None
+        return self._step(c[0])
+
+    def _s_return_stmt(self, node, c) -> Step | None:
+        if len(c) != 1:
+            return None
+        if self._tail and isinstance(c[0], Tree) and c[0].data == "call":
+            call = self._call_args(c[0])
+            if call is not None:
+                return self._tail_call(*call)
+        expr, nested = self._expr(c[0])
+
+        def run(ctx: ExecutionContext):
+            v = (yield expr(ctx)) if nested else expr(ctx)
+            return ControlSignal(v, RET_SIG)
+
+        return run, True
+
+    def _tail_call(self, name: str, items: list[Step]) -> Step:
+        def run(ctx: ExecutionContext):
+            args = []
+            for item, nested in items:
+                args.append((yield item(ctx)) if nested else item(ctx))
+            return TailCall(ctx, find_function(ctx, name, args), args)
+
+        return run, True
+
+    def _s_func_def(self, node, c) -> Step | None:
+        if not c:
+            return None
+        name = str(c[0])
+        params = []
+        body = None
+        for child in c[1:]:
+            if isinstance(child, Tree) and child.data == "params":
+                params = [str(x) for x in child.children]
+            elif isinstance(child, Tree) and child.data == "stmt_block":
+                body = child
+        if body is None:
+            return None
+        defined = f"Defined {name}({', '.join(params)})"
+        fn = self.function(name, params, body)
+
+        def run(ctx: ExecutionContext):
+            define_function(ctx, fn)
+            return defined
+
+        return run, False
+
+    def _s_loop_stmt(self, node, c) -> Step | None:
+        if len(c) != 2:
+            return None
+        condition, cond_nested = self._expr(c[0])
+        block, block_nested = self._step(c[1])
+
+        def run(ctx: ExecutionContext):
+            while ((yield condition(ctx)) if cond_nested else condition(ctx)) != 0:
+                v = (yield block(ctx)) if block_nested else block(ctx)
+                if v.__class__ is ControlSignal:
+                    if v.signal is BRK_SIG:
+                        break
+                    if v.signal is RET_SIG:
+                        return v
+                elif v.__class__ is TailCall:
+                    return v
+            return 0
+
+        return run, True
+
+    def _s_foreach_tick_func(self, node, c) -> Step | None:
+        if len(c) != 2:
+            return None
+        tick_provider_name = str(c[0])
+        func_name = str(c[1])
+
+        def run(ctx: ExecutionContext):
+            while True:
+                provider = ctx.funcs.get(tick_provider_name)
+                if provider is None:
+                    raise Exception(
+                        f"Tick provider func not found: {tick_provider_name}"
+                    )
+
+                # controls timeout
+                results = yield run_body(ctx, provider)
+                if results is None or (
+                    isinstance(results, ControlSignal) and results.is_signal(EXIT_SIG)
+                ):
+                    break
+                fn = ctx.funcs.get(func_name)
+                if fn is None:
+                    raise Exception(f"Function not found: {func_name}")
+                results = yield run_body(ctx, fn)
+            return results
+
+        return run, True
+
+    # ---------- expressions ----------
+
+    def _s_conditional_expr(self, node, c) -> Step | None:
+        if len(c) not in (2, 3):
+            return None
+        condition, cond_nested = self._expr(c[0])
+        t_block, t_nested = self._step(c[1])
+        f_block, f_nested = self._step(c[2]) if len(c) == 3 else (None, False)
+
+        def run(ctx: ExecutionContext):
+            if (yield condition(ctx)) if cond_nested else condition(ctx):
+                return (yield t_block(ctx)) if t_nested else t_block(ctx)
+            if f_block is None:
+                return None
+            return (yield f_block(ctx)) if f_nested else f_block(ctx)
+
+        return run, True
+
+    def _s_call(self, node, c) -> Step | None:
+        call = self._call_args(node)
+        if call is None:
+            return None
+        name, items = call
+
+        if not any(nested for _, nested in items):
+            # arguments without calls: the call's generator is the step's
+            def call_direct(ctx: ExecutionContext):
+                args = [item(ctx) for item, _ in items]
+                return call_function(ctx, find_function(ctx, name, args), args)
+
+            return call_direct, True
+
+        def run(ctx: ExecutionContext):
+            args = []
+            for item, nested in items:
+                args.append((yield item(ctx)) if nested else item(ctx))
+            fn = find_function(ctx, name, args)
+            return (yield call_function(ctx, fn, args))
+
+        return run, True
+
+    def _call_args(self, node: Tree) -> tuple[str, list[Step]] | None:
+        c = node.children
+        if len(c) == 2 and isinstance(c[1], Tree) and c[1].data == "args":
+            return str(c[0]), [self._expr(x) for x in c[1].children]
+        if len(c) == 1:
+            return str(c[0]), []
+        return None
+
+    def _s_builtin(self, node, c) -> Step | None:
+        found = self.builtins.get(name_of(node))
+        if found is None or len(c) != 2 or found.check(len(c[1].children)):
+            # the compiled closure reports it
+            return None
+        fn = found.bind(self.interp)
+        items = [self._expr(x) for x in c[1].children]
+
+        def run(ctx: ExecutionContext):
+            args = []
+            for item, nested in items:
+                args.append((yield item(ctx)) if nested else item(ctx))
+            return fn(*args)
+
+        return run, True
+
+    def _s_operator(self, node, c) -> Step | None:
+        arity = _ARITY.get(node.data, 2)
+        if arity is not None and len(c) != arity:
+            return None
+        apply = _OPERATORS[node.data]
+        operands = [self._expr(x) for x in c]
+
+        def run(ctx: ExecutionContext):
+            vals = []
+            for operand, nested in operands:
+                vals.append((yield operand(ctx)) if nested else operand(ctx))
+            return apply(*vals)
+
+        return run, True
+
+    def _s_and_op(self, node, c) -> Step | None:
+        if len(c) != 2:
+            return None
+        (left, l_nested), (right, r_nested) = self._expr(c[0]), self._expr(c[1])
+
+        def run(ctx: ExecutionContext):
+            if not ((yield left(ctx)) if l_nested else left(ctx)):
+                return 0
+            return 1 if ((yield right(ctx)) if r_nested else right(ctx)) else 0
+
+        return run, True
+
+    def _s_or_op(self, node, c) -> Step | None:
+        if len(c) != 2:
+            return None
+        (left, l_nested), (right, r_nested) = self._expr(c[0]), self._expr(c[1])
+
+        def run(ctx: ExecutionContext):
+            if (yield left(ctx)) if l_nested else left(ctx):
+                return 1
+            return 1 if ((yield right(ctx)) if r_nested else right(ctx)) else 0
+
+        return run, True
+
+    def _s_list(self, node, c) -> Step | None:
+        if len(c) == 1 and isinstance(c[0], Tree) and c[0].data == "list_items":
+            return self._step(c[0])
+        return None
+
+
+# ---------- runtime ----------
+
+
+def drive(gen: Generator) -> Any:
+    """
+    Run a step's generator to completion. Generators yielded by a running
+    generator are pushed on an explicit stack and their return value is
+    sent back, so nesting costs no Python frames.
+    """
+    stack = [gen]
+    value = None
+    while True:
+        try:
+            sub = stack[-1].send(value)
+        except StopIteration as stop:
+            stack.pop()
+            if not stack:
+                return stop.value
+            value = stop.value
+            continue
+        stack.append(sub)
+        value = None
+
+
+def find_function(ctx: ExecutionContext, name: str, args: list) -> StackFunction:
+    fn = ctx.funcs.get(name)
+    if fn is None:
+        raise Exception(f"Function not found: {name}")
+    if len(args) != fn.scope.nparams:
+        raise Exception(f"Arity mismatch: {name} expects {fn.scope.nparams} args")
+    return fn
+
+
+def call_function(ctx: ExecutionContext, fn: StackFunction, args: list):
+    """
+    Generator calling fn in a new frame, following tail calls in a loop.
+    """
+    tails = 0
+    view = None
+    while True:
+        frame = ctx.create_frame(fn.scope, args, fn.body)
+        v = (yield fn.code(frame)) if fn.nested else fn.code(frame)
+        if v.__class__ is not TailCall:
+            break
+        # the callee sees the returning frame's names, as when the call
+        # nests, through a view replacing that frame (see tail_view)
+        view = ctx = tail_view(v.ctx, view)
+        fn, args = v.fn, v.args
+        tails += 1
+
+    if v.__class__ is ControlSignal and v.signal is RET_SIG:
+        v = v.get_single() if v.is_single() else v.get_multiple()
+    elif v is None:
+        # return is optional, so if values are present return them
+        v = 0
+    for _ in range(tails):
+        # each skipped `return f(...)` returns the value like any return
+        v = ControlSignal(v, RET_SIG)
+        v = v.get_single() if v.is_single() else v.get_multiple()
+    return v
+
+
+def tail_view(frame: ExecutionContext, view: ExecutionContext | None):
+    """
+    Context to make a tail call from frame in: the names frame and its
+    callers resolve, with frame itself dropped. When frame was itself a
+    tail callee, its parent is the previous view and is merged too, so a
+    chain of tail calls keeps a constant depth to look names up through.
+
+    Args:
+        frame: The frame returning the tail call
+        view: The view frame was called from, if it was a tail callee
+
+    Returns:
+        ExecutionContext: A context without slots, child of frame's caller
+    """
+    parent = frame.parent
+    if view is not None and parent is view:
+        vars, outer_vars = dict(view.vars), dict(view.outer_vars)
+        parent = view.parent
+    else:
+        view, vars, outer_vars = None, {}, {}
+    # within a context `outer` bindings come first, then its own names
+    for name, val in frame.snapshot_vars().items():
+        vars[name] = val
+        outer_vars.pop(name, None)
+    for name, target in frame.outer_vars.items():
+        if target is not view:
+            outer_vars[name] = target
+            continue
+        # bound to the previous view: resolve it as that view did
+        vars.pop(name, None)
+        if name in view.outer_vars:
+            outer_vars[name] = view.outer_vars[name]
+        elif name in view.vars:
+            vars[name] = view.vars[name]
+    return ExecutionContext(
+        vars=vars,
+        funcs=frame.funcs,
+        depth=frame.depth,
+        debug=frame.debug,
+        eval_cback=frame.eval_cback,
+        parent=parent,
+        outer_vars=outer_vars,
+    )
+
+
+def run_body(ctx: ExecutionContext, fn: StackFunction):
+    """
+    Generator running the body of fn without arguments and returning its
+    raw value (signals included), as foreach_tick expects. The body runs as
+    part of ctx, see tick_frame.
+    """
+    frame = tick_frame(ctx, fn)
+    try:
+        v = (yield fn.code(frame)) if fn.nested else fn.code(frame)
+        if v.__class__ is TailCall:
+            v = ControlSignal((yield call_function(v.ctx, v.fn, v.args)), RET_SIG)
+    finally:
+        commit_tick_frame(ctx, frame)
+    return v
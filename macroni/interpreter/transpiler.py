@@ -0,0 +1,472 @@
+import ast
+from typing import Any
+from lark import Tree, Token
+from .registry import Builtin, name_of
+from .resolver import Scope, resolve_function
+
+# rules whose value is always 1 or 0, usable directly as a Python condition
+BOOLEAN_RULES = frozenset({"gt", "lt", "ge", "le", "eq", "ne", "and_op", "or_op"})
+COMPARISONS = {"gt": ">", "lt": "<", "ge": ">=", "le": "<="}
+# rules the engines reject with "Unknown node type" when misshapen
+SHAPED_RULES = frozenset(
+    {"conditional_expr", "index", "add", "sub", "mul", "div", "neg", "mod"}
+    | {"eq", "ne", "foreach_tick_func", *COMPARISONS}
+)
+
+_NO_LITERAL = object()
+
+
+class _Function:
+    """
+    Emission state of one generated Python function.
+    """
+
+    def __init__(self, kind: str, scope: Scope | None, base: int = 1):
+        # "main", "fn" (a macroni function) or "if" (an if used as a value)
+        self.kind = kind
+        self.scope = scope
+        # nested functions defined ahead of the body
+        self.prelude: list[str] = []
+        self.lines: list[str] = []
+        self.base = base
+        self.indent = base
+        self.loops = 0
+
+
+class Transpiler:
+    """
+    Lowers a Lark tree into Python source.
+
+    The generated module defines one Python function per macroni function
+    and a `_main(ctx)` for the top-level code. Loops, conditionals,
+    arithmetic and comparisons become native Python; variables, calls and
+    builtins go through the same frames and helpers as the compiled engine
+    (see aot.runtime_namespace), so both behave the same.
+    """
+
+    def __init__(self, builtins: dict[str, Builtin]):
+        self.builtins = builtins
+        # names of the builtins called, bound once when the module runs
+        self._used: set[str] = set()
+        self._defs: list[str] = []
+        self._fn: _Function | None = None
+        self._counter = 0
+
+    def transpile(self, tree: Tree) -> str:
+        main = _Function("main", None)
+        self._enter(main, self._statements(tree))
+        lines = ["def _main(ctx):", "    g = ctx.vars", *main.prelude, *main.lines]
+        bound = [f"_b_{name} = _builtin({name!r})" for name in sorted(self._used)]
+        return "\n".join(bound + self._defs + lines) + "\n"
+
+    def _enter(self, fn: _Function, stmts: list, want: bool = False):
+        saved = self._fn
+        self._fn = fn
+        try:
+            self._block(stmts, want)
+        finally:
+            self._fn = saved
+
+    def _name(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}"
+
+    def _emit(self, line: str):
+        self._fn.lines.append("    " * self._fn.indent + line)
+
+    @staticmethod
+    def _statements(node) -> list:
+        # start -> stmt_block, blocks are stmt_block trees
+        while isinstance(node, Tree) and node.data != "stmt_block":
+            if len(node.children) != 1:
+                raise Exception(f"Unexpected program node: {node.data}")
+            node = node.children[0]
+        return list(node.children)
+
+    # ---------- statements ----------
+
+    def _block(self, stmts: list, want: bool):
+        """
+        Emit stmts. With want set, the value of the block (its last
+        statement, 0 when empty) is left in _v.
+        """
+        if not stmts:
+            self._emit("_v = 0" if want else "pass")
+            return
+        for i, stmt in enumerate(stmts):
+            self._stmt(stmt, want and i == len(stmts) - 1)
+
+    def _stmt(self, node, want: bool):
+        kind = node.data if isinstance(node, Tree) else None
+        c = node.children if isinstance(node, Tree) else []
+        match kind:
+            case "import_stmt":
+                # imports should be pre-loaded by now
+                self._emit("_v = None" if want else "pass")
+            case "outer_stmt" if len(c) == 1:
+                self._emit(f"_bind_outer(ctx, {str(c[0])!r})")
+                if want:
+                    self._emit("_v = None")
+            case "store_val":
+                self._store_val(c)
+                if want:
+                    self._emit("_v = None")
+            case "func_def" if c:
+                self._func_def(c, want)
+            case "loop_stmt" if len(c) == 2:
+                self._loop(c, want)
+            case "return_stmt":
+                self._return(c)
+            case "break_stmt":
+                self._jump("break")
+            case "continue_stmt":
+                self._jump("continue")
+            case "expr_stmt" if len(c) == 1:
+                self._expr_stmt(c[0], want)
+            case _:
+                self._expr_stmt(node, want)
+
+    def _expr_stmt(self, node, want: bool):
+        node = _unwrap(node)
+        if isinstance(node, Tree) and node.data == "conditional_expr":
+            if len(node.children) in (2, 3):
+                self._if(node.children, want)
+                return
+        if isinstance(node, Tree) and node.data == "foreach_tick_func":
+            # the last handler run may have returned, which ends the block
+            self._emit(f"_r = {self._expr(node)}")
+            self._emit("if _r.__class__ is ControlSignal:")
+            self._emit(f"    {'return _r' if self._fn.kind != 'main' else 'return'}")
+            if want:
+                self._emit("_v = _r")
+            return
+        value = self._expr(node)
+        self._emit(f"_v = {value}" if want else value)
+
+    def _if(self, c: list, want: bool):
+        self._emit(f"if {self._cond(c[0])}:")
+        self._nested(self._statements(c[1]), want)
+        if len(c) == 3:
+            self._emit("else:")
+            self._nested(self._statements(c[2]), want)
+        elif want:
+            self._emit("else:")
+            self._emit("    _v = None")
+
+    def _loop(self, c: list, want: bool):
+        condition = _unwrap(c[0])
+        if isinstance(condition, Tree) and condition.data in BOOLEAN_RULES:
+            test = self._cond(condition)
+        else:
+            test = f"{self._expr(condition)} != 0"
+        self._emit(f"while {test}:")
+        self._fn.loops += 1
+        self._nested(self._statements(c[1]), False)
+        self._fn.loops -= 1
+        if want:
+            self._emit("_v = 0")
+
+    def _nested(self, stmts: list, want: bool):
+        self._fn.indent += 1
+        self._block(stmts, want)
+        self._fn.indent -= 1
+
+    def _return(self, c: list):
+        if len(c) != 1:
+            # mirrors the engines, which reject a bare `return;`
+            self._emit(f"_fail({_unknown_node()!r})")
+            return
+        value = self._expr(c[0])
+        match self._fn.kind:
+            case "fn":
+                self._emit(f"return ControlSignal({value}, RET_SIG)")
+            case "main":
+                self._emit(value)
+                self._emit("return")
+            case _:
+                raise Exception("return inside an if expression cannot be compiled")
+
+    def _jump(self, keyword: str):
+        if not self._fn.loops:
+            raise Exception(f"{keyword} outside of a loop cannot be compiled")
+        self._emit(keyword)
+
+    def _store_val(self, c: list):
+        num_names = 0
+        for i in range(len(c) - 1):
+            if isinstance(c[i], Token) and c[i].type == "NAME":
+                num_names += 1
+        names = [str(x) for x in c[:num_names]]
+        exprs = [self._expr(e) for e in c[num_names:]]
+
+        if num_names == 1 and len(exprs) == 1:
+            self._emit(self._store(names[0], exprs[0]))
+            return
+        self._emit(f"_t = _destructure([{', '.join(exprs)}], {num_names})")
+        for i, name in enumerate(names):
+            self._emit(self._store(name, f"_t[{i}]"))
+
+    def _func_def(self, c: list, want: bool):
+        name = str(c[0])
+        params = []
+        body = None
+        for child in c[1:]:
+            if isinstance(child, Tree) and child.data == "params":
+                params = [str(x) for x in child.children]
+            elif isinstance(child, Tree) and child.data == "stmt_block":
+                body = child
+        if body is None:
+            self._emit(f"_fail({f'Function body missing for {name}'!r})")
+            return
+
+        scope = resolve_function(name, params, body)
+        py_name = self._name(f"_fn_{name}_")
+        fn = _Function("fn", scope)
+        self._enter(fn, list(body.children), want=True)
+        self._defs.append(f"def {py_name}(ctx):")
+        self._defs.append("    s = ctx.slots")
+        self._defs.extend(fn.prelude)
+        self._defs.extend(fn.lines)
+        self._defs.append("    return _v")
+        assigned = scope.names[scope.nparams :]
+        self._defs.append(
+            f"{py_name}_obj = CompiledFunction({name!r}, {params!r}, None, "
+            f"Scope({name!r}, {params!r}, {assigned!r}, {sorted(scope.outer)!r}), "
+            f"{py_name})"
+        )
+
+        self._emit(f"_define(ctx, {py_name}_obj)")
+        if want:
+            self._emit(f"_v = {f'Defined {name}({", ".join(params)})'!r}")
+
+    # ---------- variables ----------
+
+    def _load(self, name: str) -> str:
+        scope = self._fn.scope
+        if scope is None:
+            # top level: missing names raise through Globals.__missing__
+            return f"g[{name!r}]"
+        i = scope.index.get(name)
+        if i is None:
+            return f"_load_name(ctx, {name!r})"
+        if name in scope.outer:
+            return f"_read_outer(ctx, {i}, {name!r})"
+        # not assigned yet, the caller's value is visible
+        return f"(s[{i}] if s[{i}] is not UNSET else ctx.parent.lookup({name!r}))"
+
+    def _store(self, name: str, value: str) -> str:
+        scope = self._fn.scope
+        if scope is None:
+            return f"g[{name!r}] = {value}"
+        i = scope.index.get(name)
+        if i is None:
+            return f"ctx.vars[{name!r}] = {value}"
+        if name in scope.outer:
+            return f"_write_outer(ctx, {i}, {name!r}, {value})"
+        return f"s[{i}] = {value}"
+
+    # ---------- expressions ----------
+
+    def _cond(self, node) -> str:
+        """
+        Python expression usable as the test of an if/while.
+        """
+        node = _unwrap(node)
+        if isinstance(node, Tree):
+            c = node.children
+            match node.data:
+                case "and_op" if len(c) == 2:
+                    return f"({self._cond(c[0])} and {self._cond(c[1])})"
+                case "or_op" if len(c) == 2:
+                    return f"({self._cond(c[0])} or {self._cond(c[1])})"
+                case op if op in COMPARISONS and len(c) == 2:
+                    return f"({self._expr(c[0])} {COMPARISONS[op]} {self._expr(c[1])})"
+                case "eq" | "ne" if len(c) == 2:
+                    return self._equality(node.data, c, cond=True)
+                case "true":
+                    return "True"
+                case "false":
+                    return "False"
+        return self._expr(node)
+
+    def _equality(self, op: str, c: list, cond: bool) -> str:
+        left, right = _literal(c[0]), _literal(c[1])
+        a, b = self._expr(c[0]), self._expr(c[1])
+        if left is None or right is None:
+            test = f"{a} {'is' if op == 'eq' else 'is not'} {b}"
+        elif left is not _NO_LITERAL or right is not _NO_LITERAL:
+            # a literal is never null, so no null check is needed
+            test = f"{a} {'==' if op == 'eq' else '!='} {b}"
+        else:
+            return f"_{op}({a}, {b})"
+        return f"({test})" if cond else f"(1 if {test} else 0)"
+
+    def _expr(self, node) -> str:
+        node = _unwrap(node)
+        if isinstance(node, Token):
+            literal = _literal(node)
+            if literal is not _NO_LITERAL:
+                return repr(literal)
+            if node.type == "NAME":
+                return self._load(str(node))
+            return repr(str(node))
+
+        if not isinstance(node, Tree):
+            return f"_fail({_unknown_node()!r})"
+
+        c = node.children
+        match node.data:
+            case "const":
+                return repr(c[0])
+            case "null":
+                return "None"
+            case "true":
+                return "1"
+            case "false":
+                return "0"
+            case "call":
+                if len(c) == 2 and isinstance(c[1], Tree) and c[1].data == "args":
+                    items = [self._expr(x) for x in c[1].children]
+                elif len(c) == 1:
+                    items = []
+                else:
+                    return f"_fail({'Invalid call syntax'!r})"
+                return f"_call(ctx, {str(c[0])!r}, [{', '.join(items)}])"
+            case "builtin":
+                return self._builtin(node, c)
+            case "foreach_tick_func" if len(c) == 2:
+                return f"_foreach_tick(ctx, {str(c[0])!r}, {str(c[1])!r})"
+            case "conditional_expr" if len(c) in (2, 3):
+                return self._if_expr(c)
+            case "index" if len(c) == 2:
+                return f"_index({self._expr(c[0])}, {self._expr(c[1])})"
+            case "add" if len(c) == 2:
+                return self._add(c)
+            case "sub" if len(c) == 2:
+                return f"({self._expr(c[0])} - {self._expr(c[1])})"
+            case "mul" if len(c) == 2:
+                return f"({self._expr(c[0])} * {self._expr(c[1])})"
+            case "div" if len(c) == 2:
+                return f"({self._expr(c[0])} / {self._expr(c[1])})"
+            case "neg" if len(c) == 1:
+                return f"(-{self._expr(c[0])})"
+            case "mod" if len(c) == 2:
+                t = self._name("_t")
+                # Convert to int if result is a whole number
+                return (
+                    f"(int({t}) if isinstance({t} := {self._expr(c[0])} % "
+                    f"{self._expr(c[1])}, float) and {t}.is_integer() else {t})"
+                )
+            case "and_op" | "or_op" if len(c) == 2:
+                return f"(1 if {self._cond(node)} else 0)"
+            case op if op in COMPARISONS and len(c) == 2:
+                return f"(1 if {self._cond(node)} else 0)"
+            case "eq" | "ne" if len(c) == 2:
+                return self._equality(node.data, c, cond=False)
+            case "tuple":
+                return f"({''.join(self._expr(x) + ', ' for x in c)})"
+            case "list":
+                if len(c) == 1 and isinstance(c[0], Tree):
+                    return self._expr(c[0])
+                return "[]"
+            case "list_items" | "args":
+                return f"[{', '.join(self._expr(x) for x in c)}]"
+            case "and_op" | "or_op":
+                return f"_fail({f'{node.data} requires exactly two operands'!r})"
+            case rule if rule in SHAPED_RULES:
+                return f"_fail({_unknown_node()!r})"
+        if len(c) == 1 and node.data not in ("stmt_block", "params"):
+            return self._expr(c[0])
+        return f"_fail({f'Unknown tree node: {node.data}'!r})"
+
+    def _builtin(self, node, c: list) -> str:
+        name = name_of(node)
+        found = self.builtins.get(name)
+        if found is None:
+            return f"_fail({f'Unknown built-in: @{name}'!r})"
+        items = [self._expr(x) for x in c[1].children] if len(c) == 2 else []
+        error = found.check(len(items))
+        if error is not None:
+            return f"_fail({error!r})"
+        self._used.add(name)
+        return f"_b_{name}({', '.join(items)})"
+
+    def _add(self, c: list) -> str:
+        left, right = _literal(c[0]), _literal(c[1])
+        a, b = self._expr(c[0]), self._expr(c[1])
+        if isinstance(left, str) or isinstance(right, str):
+            return f"(str({a}) + str({b}))"
+        if _is_number(left) and _is_number(right):
+            return f"({a} + {b})"
+        ta, tb = self._name("_t"), self._name("_t")
+        if _is_number(right):
+            return f"(str({ta}) + {str(right)!r} if isinstance({ta} := {a}, str) else {ta} + {b})"
+        # both operands are evaluated before either is checked
+        return (
+            f"(str({ta}) + str({tb}) if isinstance({ta} := {a}, str) | "
+            f"isinstance({tb} := {b}, str) else {ta} + {tb})"
+        )
+
+    def _if_expr(self, c: list) -> str:
+        """
+        An if used as a value becomes a nested function returning the value
+        of the branch taken. It is defined once, at the top of the
+        enclosing function.
+        """
+        py_name = self._name("_if")
+        outer = self._fn
+        fn = _Function("if", outer.scope, base=outer.base + 1)
+        self._fn = fn
+        try:
+            self._if(c, want=True)
+        finally:
+            self._fn = outer
+        indent = "    " * outer.base
+        outer.prelude.append(f"{indent}def {py_name}():")
+        outer.prelude.extend(fn.prelude)
+        outer.prelude.extend(fn.lines)
+        outer.prelude.append(f"{indent}    return _v")
+        return f"{py_name}()"
+
+
+def _unwrap(node):
+    # passthrough for inlined rules (number, string, var, parenthesised exprs)
+    while isinstance(node, Tree) and len(node.children) == 1:
+        if node.data not in ("number", "string", "var", "expr", "atom"):
+            break
+        node = node.children[0]
+    return node
+
+
+def _literal(node) -> Any:
+    """
+    Python value of a literal node, None for null, or _NO_LITERAL.
+    """
+    node = _unwrap(node)
+    if isinstance(node, Tree) and node.data == "const":
+        # decoded and folded by folding.fold_constants
+        return node.children[0]
+    if isinstance(node, Token):
+        if node.type == "NUMBER":
+            val = float(node)
+            return int(val) if val.is_integer() else val
+        if node.type == "STRING":
+            return ast.literal_eval(str(node))
+        return _NO_LITERAL
+    if isinstance(node, Tree) and not node.children:
+        match node.data:
+            case "null":
+                return None
+            case "true":
+                return 1
+            case "false":
+                return 0
+    return _NO_LITERAL
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float))
+
+
+def _unknown_node() -> str:
+    return f"Unknown node type: {Tree}"
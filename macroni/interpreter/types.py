@@ -1,7 +1,70 @@
 from dataclasses import dataclass
+from typing import Any
+
+
+class Sigl: ...
+
+
+# used to track return signal
+RET_SIG: Sigl = Sigl()
+BRK_SIG: Sigl = Sigl()
+EXIT_SIG: Sigl = Sigl()
+CNT_SIG: Sigl = Sigl()
+# marks a frame slot whose local has not been assigned yet
+UNSET: Sigl = Sigl()
+
+# "compiled" lowers the tree into closures once, "stack" does the same but
+# runs calls on an explicit stack, "tree" walks the tree every time
+ENGINES = ("compiled", "stack", "tree")
+
+
+class ScriptTimeout(Exception):
+    """
+    Raised in a script that ran longer than the timeout given to Program.run
+    (see embed). It can arrive in any code the script runs, so handlers that
+    wrap or swallow errors on the way must let it through.
+    """
+
+
+class ControlSignal:
+    def __init__(self, values: list[Any], signal: Sigl = None):
+        self.values = []
+        if isinstance(values, list) or isinstance(values, tuple):
+            self.values = values
+        else:
+            self.values = [values]
+        self.signal = signal
+
+    def is_single(self) -> bool:
+        return len(self.values) == 1
+
+    def get_single(self) -> Any:
+        if self.is_single():
+            return self.values[0]
+        raise Exception("Multiple return values present")
+
+    def get_multiple(self) -> list[Any]:
+        return self.values
+
+    def is_signal(self, signal: Sigl) -> bool:
+        return self.signal is signal
 
 
 class ExecutionContext:
+    __slots__ = (
+        "vars",
+        "funcs",
+        "depth",
+        "node",
+        "eval_cback",
+        "debug",
+        "parent",
+        "outer_vars",
+        "slots",
+        "scope",
+        "root",
+    )
+
     def __init__(
         self,
         vars=None,
@@ -12,6 +75,8 @@ class ExecutionContext:
         debug=False,
         parent: "ExecutionContext" = None,
         outer_vars=None,
+        slots: list = None,
+        scope=None,
     ):
         """
         Initialize execution context.
@@ -21,6 +86,8 @@ class ExecutionContext:
             funcs: Dictionary of functions (if None, creates empty dict)
             depth: Current recursion depth
             outer_vars: Dictionary mapping variable names to their outer contexts
+            slots: Fixed-size locals of a compiled function frame
+            scope: resolver.Scope describing the layout of slots
         """
         self.vars = vars if vars is not None else {}
         self.funcs = funcs if funcs is not None else {}
@@ -30,6 +97,10 @@ class ExecutionContext:
         self.debug = debug  # Enable debugging features
         self.parent = parent  # Reference to parent context, if any
         self.outer_vars = outer_vars if outer_vars is not None else {}
+        self.slots = slots
+        self.scope = scope
+        # bottom of the parent chain, where top-level variables live
+        self.root = parent.root if parent is not None else self
 
     def create_sibling_context(self, node: any = None):
         """
@@ -48,6 +119,8 @@ class ExecutionContext:
             eval_cback=self.eval_cback,
             parent=self.parent,
             outer_vars=self.outer_vars,
+            slots=self.slots,
+            scope=self.scope,
         )
 
     def create_child_context(self, local_vars=None, node: any = None):
@@ -80,3 +153,100 @@ class ExecutionContext:
             parent=self,
             outer_vars={},  # Start with empty outer_vars for child context
         )
+
+    def create_frame(self, scope, args: list, node: any = None):
+        """
+        Create a child context for a compiled function call.
+        Locals live in a fixed-size slot array laid out by scope, so nothing
+        is copied from the caller; names not local to the function are found
+        by walking the parent chain (see lookup). Functions are shared with
+        the caller until the callee defines its own.
+
+        Args:
+            scope: resolver.Scope of the called function
+            args: Argument values, in parameter order
+
+        Returns:
+            ExecutionContext: New child context with incremented depth
+        """
+        return ExecutionContext(
+            vars={},
+            funcs=self.funcs,
+            depth=self.depth + 1,
+            node=node,
+            debug=self.debug,
+            eval_cback=self.eval_cback,
+            parent=self,
+            outer_vars={},
+            slots=scope.new_slots(args),
+            scope=scope,
+        )
+
+    def has_var(self, name: str) -> bool:
+        """
+        Whether name is bound in this context itself (not its parents).
+        """
+        if self.scope is not None:
+            i = self.scope.index.get(name)
+            if i is not None and self.slots[i] is not UNSET:
+                return True
+        return name in self.vars
+
+    def read_var(self, name: str) -> Any:
+        if self.scope is not None:
+            i = self.scope.index.get(name)
+            if i is not None and self.slots[i] is not UNSET:
+                return self.slots[i]
+        return self.vars.get(name, None)
+
+    def write_var(self, name: str, val: Any):
+        if self.scope is not None:
+            i = self.scope.index.get(name)
+            if i is not None:
+                self.slots[i] = val
+                return
+        self.vars[name] = val
+
+    def read_view(self, name: str) -> Any:
+        """
+        The value of name as seen from this context: its own binding, else
+        the one it inherited from its callers (see lookup).
+        """
+        if self.has_var(name):
+            return self.read_var(name)
+        return self.lookup(name)
+
+    def sees(self, name: str) -> bool:
+        """
+        Whether name resolves from this context (see lookup).
+        """
+        ctx = self
+        while ctx is not None:
+            if name in ctx.outer_vars or ctx.has_var(name):
+                return True
+            ctx = ctx.parent
+        return False
+
+    def lookup(self, name: str) -> Any:
+        """
+        Resolve a name dynamically: this context, then each caller in turn.
+        A caller's `outer` binding for the name is followed to its target.
+        """
+        ctx = self
+        while ctx is not None:
+            if ctx.outer_vars and name in ctx.outer_vars:
+                return ctx.outer_vars[name].read_view(name)
+            if ctx.has_var(name):
+                return ctx.read_var(name)
+            ctx = ctx.parent
+        raise Exception(f"Variable not found: {name}")
+
+    def snapshot_vars(self) -> dict:
+        """
+        Variables bound in this context, including slot-backed locals.
+        """
+        if self.scope is None:
+            return dict(self.vars)
+        local = {n: v for n, v in zip(self.scope.names, self.slots) if v is not UNSET}
+        local.update(self.vars)
+        return local
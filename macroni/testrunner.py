@@ -0,0 +1,137 @@
+import concurrent.futures
+import contextlib
+import dataclasses
+import glob
+import io
+import os
+import re
+import time
+from typing import Iterable
+
+
+@dataclasses.dataclass
+class TestResult:
+    path: str
+    # None if the script ran to the end, else the uncaught exception
+    error: str | None = None
+    output: str = ""
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def discover(paths: Iterable[str]) -> list[str]:
+    """
+    Test scripts to run: the `test_*.macroni` files in each directory of
+    paths (recursively), and each file as given.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            pattern = os.path.join(path, "**", "test_*.macroni")
+            found.extend(sorted(glob.glob(pattern, recursive=True)))
+        else:
+            found.append(path)
+    # a file can be given both directly and through its directory
+    return list(dict.fromkeys(found))
+
+
+def required_engine(path: str) -> str | None:
+    """
+    The engine a test script must run on, from an `# engine: NAME` line in
+    its leading comments (e.g. deep recursion needs "stack"), else None.
+    """
+    with open(path, "r") as f:
+        for line in f:
+            if not line.lstrip().startswith("#"):
+                break
+            match = re.match(r"\s*#\s*engine:\s*(\w+)", line)
+            if match:
+                return match.group(1)
+    return None
+
+
+def run_test(path: str, engine: str = "compiled") -> TestResult:
+    """
+    Run one test script with its own Interpreter and root context, with
+    its output captured. The test fails on any uncaught exception (e.g.
+    from @fail), SystemExit included; only KeyboardInterrupt stops the run. A script requiring an engine (see required_engine) runs
+    on that one.
+    """
+    from macroni.interpreter import modules
+    from macroni.interpreter.macroni_interpret import Interpreter
+    from macroni.interpreter.types import ExecutionContext
+
+    result = TestResult(path)
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        engine = required_engine(path) or engine
+        with contextlib.redirect_stdout(output):
+            program = modules.load_program(path)
+            interp = Interpreter(engine=engine)
+            root_context = ExecutionContext(
+                node=program.main.tree, eval_cback=interp.execute
+            )
+            interp.run_program(root_context, program)
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        # e.g. SystemExit from a native call fails this test, not the run
+        result.error = f"{type(e).__name__}: {e}"
+    result.seconds = time.perf_counter() - start
+    result.output = output.getvalue()
+    return result
+
+
+def _init_worker(plugin_dirs: tuple, preload: bool):
+    # once per worker process, so each test starts warm
+    from macroni.interpreter import plugins
+
+    plugins.load_plugins(plugin_dirs)
+    if preload:
+        from macroni.interpreter.macroni_interpret import preload as preload_all
+
+        preload_all()
+
+
+def run_tests(
+    paths: list[str],
+    engine: str = "compiled",
+    jobs: int = 1,
+    plugin_dirs: tuple = (),
+    preload: bool = False,
+    on_result=None,
+) -> list[TestResult]:
+    """
+    Run test scripts in this process (jobs=1) or in a pool of jobs worker
+    processes. Dependencies are loaded once per process, not per test.
+
+    Args:
+        on_result: called with each TestResult as soon as it is done
+
+    Returns:
+        The results in the order of paths
+    """
+    results = {}
+    if jobs <= 1:
+        _init_worker(tuple(plugin_dirs), preload)
+        for path in paths:
+            results[path] = run_test(path, engine)
+            if on_result is not None:
+                on_result(results[path])
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(tuple(plugin_dirs), preload),
+        ) as pool:
+            futures = {pool.submit(run_test, path, engine): path for path in paths}
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                results[result.path] = result
+                if on_result is not None:
+                    on_result(result)
+    return [results[path] for path in paths]
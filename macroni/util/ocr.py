@@ -1,17 +1,30 @@
 import re
 import cv2
 import numpy as np
-import easyocr
 from macroni.util.template_match import screenshot_bgr
 import dataclasses
 import time
 import json
 import os
-from pynput import mouse
+from macroni.util.lazy import LazyModule
 
+# needs a display; loaded on first region capture so OCR works headless
+mouse = LazyModule("pynput.mouse")
 
 # Create once (slow to init). For speed, keep it global.
-reader = easyocr.Reader(["en"], gpu=True)  # set gpu=True if you have CUDA
+reader = None
+
+
+def get_reader():
+    """Create the easyocr reader on first use; importing easyocr loads torch."""
+    global reader
+    if reader is None:
+        import easyocr
+
+        print("Loading OCR model, this may take a moment the first time...")
+        reader = easyocr.Reader(["en"], gpu=True)  # set gpu=True if you have CUDA
+    return reader
+
 
 # Cache file for regions
 REGIONS_CACHE_FILE = "regions_cache.json"
@@ -178,6 +191,7 @@ def ocr_find_text(
     """
     # Convert region tuple to dictionary format for screenshot_bgr
     region_dict = None
+    origin = (0, 0)
     if region is not None:
         top_left_x, top_left_y, bottom_right_x, bottom_right_y = region
         region_dict = {
@@ -186,15 +200,36 @@ def ocr_find_text(
             "width": bottom_right_x - top_left_x,
             "height": bottom_right_y - top_left_y,
         }
+        origin = (top_left_x, top_left_y)
 
+    bgr = screenshot_bgr(region=region_dict, downscale=1.0)
+    return find_text_in_image(bgr, min_conf, filter, upscale, origin)
+
+
+def find_text_in_image(
+    bgr,
+    min_conf: float = 0.45,
+    filter: str | list | tuple | None = None,
+    upscale: float = 1.0,
+    origin: tuple[int, int] = (0, 0),
+) -> list[OCRResult] | None:
+    """
+    OCR an image that was already captured (see ocr_find_text).
+
+    Args:
+        bgr: BGR image (a screenshot, or a recorded or synthetic one)
+        origin: screen position of the image's top-left corner, added to bboxes
+
+    Returns:
+        List of OCRResult objects, or None if no text reached min_conf
+    """
     # try at + 20% and -20% upscales for robustness
     upscales = [upscale, upscale * 1.2, upscale * 0.8]
     for upscale in upscales:
-        bgr = screenshot_bgr(region=region_dict, downscale=1.0)
         img = preprocess_for_ocr(bgr, upscale=upscale)
 
         # easyocr expects RGB or grayscale; we already have grayscale/binary
-        results = reader.readtext(img)  # [(bbox, text, conf), ...]
+        results = get_reader().readtext(img)  # [(bbox, text, conf), ...]
 
         filtered_results = [
             (bbox, text, conf) for (bbox, text, conf) in results if conf >= min_conf
@@ -218,11 +253,9 @@ def ocr_find_text(
             # Scale bbox coordinates back down by upscale factor
             pts = np.array(bbox, np.float32) / upscale
 
-            # If region was specified, adjust coordinates to be relative to screen (not region)
-            if region is not None:
-                top_left_x, top_left_y, _, _ = region
-                pts[:, 0] += top_left_x  # Add X offset
-                pts[:, 1] += top_left_y  # Add Y offset
+            # Adjust coordinates to be relative to screen (not region)
+            pts[:, 0] += origin[0]  # Add X offset
+            pts[:, 1] += origin[1]  # Add Y offset
 
             # Convert to regular Python list for macroni compatibility (no numpy)
             bbox_list = [[float(x), float(y)] for x, y in pts]
@@ -0,0 +1,339 @@
+import os
+import threading
+import numpy as np
+from macroni.util.lazy import LazyModule
+
+cv2 = LazyModule("cv2")
+mss = LazyModule("mss")
+pyautogui = LazyModule("pyautogui")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".webm")
+
+
+class ScreenSource:
+    """
+    Where the vision and pixel builtins read the screen from: the display
+    (MssSource), or recorded frames for headless runs and replays.
+
+    Regions are (left, top, width, height) in screen points; frames are
+    BGR uint8 arrays.
+    """
+
+    def grab(self, region: tuple[int, int, int, int] | None = None) -> np.ndarray:
+        """
+        Returns:
+            The whole screen or region of it as a BGR image, possibly a
+            non-contiguous view. May be larger than region on high-DPI
+            displays (see size).
+        """
+        raise NotImplementedError
+
+    def grab_gray(self, region: tuple[int, int, int, int] | None = None) -> np.ndarray:
+        """
+        Returns:
+            The whole screen or region of it as a grayscale image, like grab
+        """
+        bgr = np.ascontiguousarray(self.grab(region))
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+
+    def size(self) -> tuple[int, int]:
+        """
+        Returns:
+            (width, height) of the whole screen in points, the unit of
+            mouse coordinates
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MssSource(ScreenSource):
+    """
+    The live display, captured with mss.
+    """
+
+    def __init__(self):
+        # mss handles must not be shared between threads
+        self._local = threading.local()
+
+    def _sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = mss.mss()
+        return sct
+
+    def _grab_bgra(self, region):
+        sct = self._sct()
+        if region is None:
+            # Capture primary monitor
+            monitor = sct.monitors[0]
+        else:
+            left, top, width, height = region
+            monitor = {"left": left, "top": top, "width": width, "height": height}
+        # MSS returns BGRA on all platforms (Windows, macOS, Linux); wrap
+        # its buffer instead of copying it
+        shot = sct.grab(monitor)
+        return np.frombuffer(shot.raw, np.uint8).reshape(shot.height, shot.width, 4)
+
+    def grab(self, region=None):
+        # Drop alpha channel to get BGR format for OpenCV
+        return self._grab_bgra(region)[:, :, :3]
+
+    def grab_gray(self, region=None):
+        # straight from BGRA, without a BGR image in between
+        return cv2.cvtColor(self._grab_bgra(region), cv2.COLOR_BGRA2GRAY)
+
+    def size(self):
+        width, height = pyautogui.size()
+        return int(width), int(height)
+
+    def close(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+
+class FrameSource(ScreenSource):
+    """
+    Base of the recorded sources: the screen is the current frame, one
+    image pixel per screen point. Subclasses implement next_frame.
+    """
+
+    def __init__(self, name: str, loop: bool = False):
+        self.name = name
+        self.loop = loop
+        self.frames_read = 0
+        self._size = None
+
+    def next_frame(self) -> np.ndarray | None:
+        """
+        Returns:
+            The next BGR frame, or None at the end of the recording
+        """
+        raise NotImplementedError
+
+    def rewind(self):
+        raise NotImplementedError
+
+    def _frame(self) -> np.ndarray:
+        frame = self.next_frame()
+        if frame is None and self.loop and self.frames_read > 0:
+            self.rewind()
+            frame = self.next_frame()
+        if frame is None:
+            raise Exception(f"Screen source {self.name} has no more frames")
+        self.frames_read += 1
+        return frame
+
+    def grab(self, region=None):
+        frame = self._frame()
+        self._size = frame.shape[1], frame.shape[0]
+        if region is None:
+            return frame.copy()
+        return frame[self._crop(region, frame)].copy()
+
+    def grab_gray(self, region=None):
+        # convert the frame (or a view of the region) without copying it first
+        frame = self._frame()
+        self._size = frame.shape[1], frame.shape[0]
+        if region is not None:
+            frame = frame[self._crop(region, frame)]
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def _crop(self, region, frame) -> tuple[slice, slice]:
+        left, top, width, height = (int(v) for v in region)
+        h, w = frame.shape[:2]
+        if width <= 0 or height <= 0 or left < 0 or top < 0:
+            raise Exception(f"Invalid region {region} for screen source {self.name}")
+        if left + width > w or top + height > h:
+            raise Exception(
+                f"Region {region} is outside the {w}x{h} frames of {self.name}"
+            )
+        return slice(top, top + height), slice(left, left + width)
+
+    def size(self):
+        size = self._size
+        if size is None:
+            frame = self.next_frame()
+            if frame is None:
+                raise Exception(f"Screen source {self.name} has no frames")
+            self.rewind()
+            size = self._size = frame.shape[1], frame.shape[0]
+        return size
+
+
+class ImageFileSource(FrameSource):
+    """
+    A single screenshot: every capture returns the same image.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.image = _read_image(path)
+
+    def next_frame(self):
+        return self.image
+
+    def rewind(self):
+        pass
+
+
+class ImageDirectorySource(FrameSource):
+    """
+    A recorded session as numbered screenshots: each capture returns the
+    next image, in file name order.
+    """
+
+    def __init__(self, directory: str, loop: bool = False):
+        super().__init__(directory, loop)
+        self.paths = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.paths:
+            raise Exception(f"No images in {directory}")
+        self._index = 0
+
+    def next_frame(self):
+        if self._index >= len(self.paths):
+            return None
+        self._index += 1
+        return _read_image(self.paths[self._index - 1])
+
+    def rewind(self):
+        self._index = 0
+
+
+class VideoSource(FrameSource):
+    """
+    A screen recording: each capture returns the next video frame.
+    """
+
+    def __init__(self, path: str, loop: bool = False):
+        super().__init__(path, loop)
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            raise Exception(f"Could not open video {path}")
+
+    def next_frame(self):
+        ok, frame = self._capture.read()
+        return frame if ok else None
+
+    def rewind(self):
+        self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def close(self):
+        self._capture.release()
+
+
+def _read_image(path: str) -> np.ndarray:
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise Exception(f"Could not read image {path}")
+    return img
+
+
+def open_source(spec: str, loop: bool = False) -> ScreenSource:
+    """
+    Args:
+        spec: "live" for the display, or the path of an image, a directory
+            of images or a video
+        loop: start recorded frames over at the end instead of failing
+
+    Returns:
+        The matching ScreenSource
+    """
+    if spec in ("live", "mss"):
+        return MssSource()
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, loop)
+    if not os.path.exists(spec):
+        raise Exception(f"Screen source not found: {spec}")
+    if spec.lower().endswith(VIDEO_EXTENSIONS):
+        return VideoSource(spec, loop)
+    return ImageFileSource(spec)
+
+
+_source: ScreenSource | None = None
+
+
+def get_source() -> ScreenSource:
+    """
+    Returns:
+        The screen source of this process, the display unless set_source
+        was called
+    """
+    global _source
+    if _source is None:
+        _source = MssSource()
+    return _source
+
+
+def set_source(source: ScreenSource | None):
+    """
+    Make the vision and pixel builtins read from source (None for the
+    display again).
+    """
+    global _source
+    if _source is not None and _source is not source:
+        _source.close()
+    _source = source
+
+
+def clip_region(region):
+    """
+    Returns:
+        region (left, top, width, height) clipped to the screen, or None if
+        none of it is on the screen
+    """
+    scr_w, scr_h = get_source().size()
+    left, top, width, height = (int(v) for v in region)
+    right = min(left + width, scr_w)
+    bottom = min(top + height, scr_h)
+    left, top = max(left, 0), max(top, 0)
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right - left, bottom - top
+
+
+def pixel_at(x: int, y: int) -> tuple[int, int, int]:
+    """
+    Returns:
+        (r, g, b) of the screen at (x, y)
+    """
+    b, g, r = get_source().grab((x, y, 1, 1))[0, 0]
+    return int(r), int(g), int(b)
+
+
+def color_in_radius(
+    center_x: int, center_y: int, radius: int, rgb: tuple, tolerance: int = 0
+) -> bool:
+    """
+    Returns:
+        bool: whether a pixel within radius of (center_x, center_y) has
+        color rgb, give or take tolerance per channel
+    """
+    # Capture the part of the square around the circle that is on the
+    # screen; on high-DPI displays it has more pixels than points, so the
+    # circle is scaled to the image
+    size = max(1, 2 * radius)
+    region = clip_region((center_x - radius, center_y - radius, size, size))
+    if region is None:
+        return False
+    left, top, region_w, _ = region
+    bgr = get_source().grab(region)
+    height, width = bgr.shape[:2]
+    k = width / region_w
+    ys, xs = np.ogrid[:height, :width]
+    # pixel offsets from the center, in points
+    dx = xs / k + left - center_x
+    dy = ys / k + top - center_y
+    in_circle = dx * dx + dy * dy <= radius * radius
+
+    target = np.array(rgb[::-1], np.int16)
+    matches = (np.abs(bgr.astype(np.int16) - target) <= tolerance).all(axis=2)
+    return bool((matches & in_circle).any())
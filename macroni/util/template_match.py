@@ -1,59 +1,73 @@
 import cv2
 import numpy as np
-import pyautogui
-import mss
-from macroni.util.mouse_utils import move_mouse_to
 import time
 import os
-from macroni.util.vision import Vision
+from macroni.util.vision import Vision, Haystack, COARSE_CANDIDATES
+from macroni.util import template_store
 import sys
 import concurrent.futures
 
+from macroni.util import screen as screen_source
+
 
 def screenshot_scale(screen_bgr, region=None):
+    """
+    Screenshot pixels per screen point of a capture of region (left, top,
+    width, height), or of the whole screen.
+    """
     img_h, img_w = screen_bgr.shape[:2]  # screenshot pixels
-    scr_w, scr_h = pyautogui.size()  # screen points
+    if region is not None:
+        scr_w, scr_h = region[2], region[3]  # region points
+    else:
+        scr_w, scr_h = screen_source.get_source().size()  # screen points
     return (img_w / scr_w), (img_h / scr_h)
 
 
+# clip a (left, top, width, height) region to the screen, None if off-screen
+clip_region = screen_source.clip_region
+
+
 def img_xy_to_screen_xy(x_img, y_img, sx, sy):
     return (x_img / sx, y_img / sy)
 
 
 def screenshot_bgr(region=None, downscale=1.0, debug=False):
     """
-    region: (left, top, width, height) in screen coords, or None for full screen.
-    returns: BGR uint8 image (OpenCV format)
+    region: (left, top, width, height) in screen coords, or a dict with those keys, or None for full screen.
+    returns: BGR uint8 image (OpenCV format), read from the current screen.ScreenSource
     Note: On retina displays, MSS captures at actual pixel resolution (2x logical resolution).
     The screenshot_scale function handles this by calculating the ratio between screenshot pixels
     and screen points, which is then used by img_xy_to_screen_xy to convert back correctly.
     """
-    with mss.mss() as sct:
-        if region is None:
-            # Capture primary monitor
-            monitor = sct.monitors[0]
-        else:
-            # region is (left, top, width, height) in screen points
-            # MSS needs actual pixel coordinates, so scale by the display scaling factor
-            # For retina displays, this is typically 2.0
-            monitor = region
-
-        # MSS returns BGRA on all platforms (Windows, macOS, Linux)
-        # Drop alpha channel to get BGR format for OpenCV
-        screenshot = sct.grab(monitor)
-        img = np.array(screenshot)
-        bgr = img[:, :, :3]  # Keep first 3 channels (BGR), drop alpha
-
-        # Apply downscaling for performance (if not already done above)
-        if downscale != 1.0:
-            new_w = int(bgr.shape[1] * downscale)
-            new_h = int(bgr.shape[0] * downscale)
-            bgr = cv2.resize(bgr, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        else:
-            # Ensure contiguous array when no resize (OpenCV requires this)
-            bgr = bgr.copy()
-
-        return bgr
+    if isinstance(region, dict):
+        region = (region["left"], region["top"], region["width"], region["height"])
+    bgr = screen_source.get_source().grab(region)
+
+    # Apply downscaling for performance
+    if downscale != 1.0:
+        new_w = int(bgr.shape[1] * downscale)
+        new_h = int(bgr.shape[0] * downscale)
+        bgr = cv2.resize(bgr, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    else:
+        # Ensure contiguous array when no resize (OpenCV requires this)
+        bgr = np.ascontiguousarray(bgr)
+
+    return bgr
+
+
+def screenshot_gray(region=None, downscale=1.0):
+    """
+    Like screenshot_bgr, as a grayscale image converted straight from the
+    capture.
+    """
+    if isinstance(region, dict):
+        region = (region["left"], region["top"], region["width"], region["height"])
+    gray = screen_source.get_source().grab_gray(region)
+    if downscale != 1.0:
+        new_w = int(gray.shape[1] * downscale)
+        new_h = int(gray.shape[0] * downscale)
+        gray = cv2.resize(gray, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    return gray
 
 
 def get_template_examples(template_dir, template_name):
@@ -74,64 +88,65 @@ def get_template_examples(template_dir, template_name):
 template_thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
 
 
-# just return center points of found templates
-def locate_template_on_screen(
-    template_dir: str = "./templates",
-    template_name: str = "default",
+def default_template_scale(downscale=1.0):
+    """
+    Scale to apply to template images so they match a screenshot resized
+    by downscale.
+    """
+    # On macOS, templates are typically at 2x retina resolution, but MSS captures at 1x
+    # So we need to scale templates by 0.5x to match MSS screenshots
+    if sys.platform == "darwin":
+        return downscale * 0.5  # Compensate for retina resolution difference
+    return downscale
+
+
+def locate_template_in_image(
+    screen,
+    template_paths: list[str],
     scales=np.linspace(0.8, 1.2, 5),
     threshold=0.8,
     use_gray=True,
-    downscale=0.8,
-    top_k=1,
+    template_scale=1.0,
     debug=False,
-) -> tuple | None:
-    total_perf_counter = time.perf_counter()
-    perf_counter = time.perf_counter()
-    screen = screenshot_bgr(region=None, downscale=downscale, debug=debug)
-    sx, sy = screenshot_scale(screen, region=None)
-    print(f"Screenshot took {time.perf_counter() - perf_counter:.3f} seconds")
+    pyramid_levels=0,
+    candidates=COARSE_CANDIDATES,
+) -> list[Vision.VisionHit]:
+    """
+    Find template examples in an image that was already captured.
 
-    # Get template paths
-    template_paths = get_template_examples(template_dir, template_name)
-    print("Start locating")
+    Args:
+        screen: BGR image to search (a screenshot, or a recorded or synthetic
+            one), or a grayscale one with use_gray
+        template_paths: image files of the template examples (loaded
+            through template_store.STORE)
+        template_scale: resize factor applied to each template before matching
+        pyramid_levels: 0 for an exhaustive search, or how many times to halve
+            the image for a coarse-to-fine search (faster, may miss matches)
+        candidates: with pyramid_levels, at most this many matches are kept
+            per template example and scale
 
-    perf_counter = time.perf_counter()
-    found = None
+    Returns:
+        Deduplicated hits in image coordinates
+    """
 
-    # On macOS, templates are typically at 2x retina resolution, but MSS captures at 1x
-    # So we need to scale templates by 0.5x to match MSS screenshots
-    template_scale = downscale
-    if sys.platform == "darwin":
-        template_scale *= 0.5  # Compensate for retina resolution difference
+    # Converted (and downsampled for the coarse level) once for all
+    # workers, which get read-only views of it
+    haystack = Haystack.prepare(screen, use_gray, pyramid_levels)
 
     def find_in_template(template_path) -> list[Vision.VisionHit]:
-        # Create Vision instance for this template
-        # Scale template to match the screenshot resolution
-        template_img = cv2.imread(template_path)
-        if template_scale != 1.0:
-            template_img = cv2.resize(
-                template_img,
-                (0, 0),
-                fx=template_scale,
-                fy=template_scale,
-                interpolation=cv2.INTER_AREA,
-            )
-            # Save temporarily to create Vision instance
-            temp_path = template_path.replace(".png", "_temp.png")
-            cv2.imwrite(temp_path, template_img)
-            vision = Vision(temp_path)
-            os.remove(temp_path)
-        else:
-            vision = Vision(template_path)
+        # Decoded and scaled to the screenshot resolution once per process
+        vision = template_store.STORE.vision(template_path, template_scale)
 
         # Find matches using multiscale
         points = vision.find_multiscale(
-            screen,
+            haystack,
             scales=scales,
             threshold=threshold,
             use_gray=use_gray,
             find_one=False,
             debug_mode=debug,
+            pyramid_levels=pyramid_levels,
+            candidates=candidates,
         )
         return points
 
@@ -146,46 +161,93 @@ def locate_template_on_screen(
         all_hits.extend(hits)
 
     # Dedupe results using groupRectangles
-    if len(all_hits) == 0:
-        print(f"Locating took {time.perf_counter() - perf_counter:.3f} seconds")
-        print(f"Total time: {time.perf_counter() - total_perf_counter:.3f} seconds")
-        return []
+    if len(all_hits) <= 1:
+        return all_hits
+
+    # Convert VisionHit bboxes to rectangles for grouping
+    rectangles = []
+    for hit in all_hits:
+        x, y, w, h = hit.bbox
+        rect = [int(x), int(y), int(w), int(h)]
+        rectangles.append(rect)
+        rectangles.append(rect)  # Add twice for groupRectangles to keep single boxes
+
+    # Group overlapping rectangles
+    grouped_rects, weights = cv2.groupRectangles(rectangles, groupThreshold=1, eps=0.5)
 
-    if len(all_hits) > 1:
-        # Convert VisionHit bboxes to rectangles for grouping
-        rectangles = []
-        for hit in all_hits:
-            x, y, w, h = hit.bbox
-            rect = [int(x), int(y), int(w), int(h)]
-            rectangles.append(rect)
-            rectangles.append(
-                rect
-            )  # Add twice for groupRectangles to keep single boxes
-
-        # Group overlapping rectangles
-        grouped_rects, weights = cv2.groupRectangles(
-            rectangles, groupThreshold=1, eps=0.5
+    # Extract deduplicated center points
+    deduped_hits = []
+    for x, y, w, h in grouped_rects:
+        center_x = x + w // 2
+        center_y = y + h // 2
+        deduped_hits.append(
+            Vision.VisionHit(bbox=(x, y, w, h), center=(center_x, center_y))
         )
 
-        # Extract deduplicated center points
-        deduped_hits = []
-        for x, y, w, h in grouped_rects:
-            center_x = x + w // 2
-            center_y = y + h // 2
-            deduped_hits.append(
-                Vision.VisionHit(bbox=(x, y, w, h), center=(center_x, center_y))
-            )
+    print(f"Templates found: {len(all_hits)} -> {len(deduped_hits)} after dedup")
+    return deduped_hits
 
-        print(f"Templates found: {len(all_hits)} -> {len(deduped_hits)} after dedup")
+
+# just return center points of found templates
+def locate_template_on_screen(
+    template_dir: str = "./templates",
+    template_name: str = "default",
+    scales=np.linspace(0.8, 1.2, 5),
+    threshold=0.8,
+    use_gray=True,
+    downscale=0.8,
+    top_k=1,
+    debug=False,
+    region=None,
+    pyramid_levels=0,
+) -> tuple | None:
+    """
+    region: (left, top, width, height) in screen points to search instead of
+    the whole screen; only that rectangle is captured and matched.
+    pyramid_levels: 0 searches exhaustively; 1 or 2 match a half or quarter
+    size screenshot first and refine only the best candidates at full size,
+    trading some recall for speed. At least top_k candidates are refined,
+    so up to top_k matches can still be found.
+    Returns up to top_k center points in screen coordinates.
+    """
+    total_perf_counter = time.perf_counter()
+    perf_counter = time.perf_counter()
+    if region is not None:
+        region = clip_region(region)
+        if region is None:
+            return []
+    if use_gray and not debug:
+        screen = screenshot_gray(region=region, downscale=downscale)
     else:
-        deduped_hits = all_hits
+        # debug draws the matches on the color screenshot
+        screen = screenshot_bgr(region=region, downscale=downscale, debug=debug)
+    sx, sy = screenshot_scale(screen, region=region)
+    print(f"Screenshot took {time.perf_counter() - perf_counter:.3f} seconds")
+
+    # Get template paths
+    template_paths = get_template_examples(template_dir, template_name)
+    print("Start locating")
+
+    perf_counter = time.perf_counter()
+    hits = locate_template_in_image(
+        screen,
+        template_paths,
+        scales=scales,
+        threshold=threshold,
+        use_gray=use_gray,
+        template_scale=default_template_scale(downscale),
+        debug=debug,
+        pyramid_levels=pyramid_levels,
+        candidates=max(top_k, COARSE_CANDIDATES),
+    )
 
     # Convert to screen coordinates and return top_k center points only
+    left, top = (region[0], region[1]) if region is not None else (0, 0)
     ret = []
-    for hit in deduped_hits[:top_k]:
+    for hit in hits[:top_k]:
         x_img, y_img = hit.center
         x_screen, y_screen = img_xy_to_screen_xy(x_img, y_img, sx, sy)
-        ret.append((int(x_screen), int(y_screen)))
+        ret.append((int(left + x_screen), int(top + y_screen)))
 
     print(f"Locating took {time.perf_counter() - perf_counter:.3f} seconds")
     print(f"Total time: {time.perf_counter() - total_perf_counter:.3f} seconds")
@@ -193,12 +255,14 @@ def locate_template_on_screen(
 
 
 if __name__ == "__main__":
-    # Load template from disk
-    template_dir = "/Users/sam.schreiber/src/macroni/templates"
-    template_name = "test"
+    # python -m macroni.util.template_match [TEMPLATE_DIR] [TEMPLATE_NAME]
+    from macroni.util.mouse_utils import move_mouse_to
+
+    template_dir = sys.argv[1] if len(sys.argv) > 1 else "./templates"
+    template_name = sys.argv[2] if len(sys.argv) > 2 else "test"
 
     pos = locate_template_on_screen(template_dir, template_name, debug=True)
-    if pos is not None:
+    if pos:
         pos = pos[0]
         print(f"Template '{template_name}' found at screen position: {pos}")
         move_mouse_to(pos[0], pos[1], pps=5000, humanLike=True)
@@ -0,0 +1,80 @@
+import collections
+import os
+import threading
+import cv2
+from macroni.util.vision import Vision
+
+# decoded templates kept in memory, by total size of their images
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class TemplateStore:
+    """
+    Process-wide cache of template examples, decoded, scaled and converted
+    to grayscale once, so lookups do not touch the disk.
+
+    Entries are keyed by file path, modification time and scale: an
+    edited example is reloaded, and the least recently used entries are
+    dropped once the images take more than max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # (path, mtime_ns, scale) -> (Vision, size in bytes)
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def vision(self, path: str, scale: float = 1.0) -> Vision:
+        """
+        Returns:
+            A Vision for the example image at path, resized by scale. It is
+            shared, so its images must not be modified.
+        """
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns, float(scale))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # decode outside the lock; two threads loading the same example
+        # at once both decode it, and one of the results is kept
+        vision = _load(path, scale)
+        size = vision.needle_img.nbytes + vision.needle_gray.nbytes
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (vision, size)
+                self.bytes += size
+                self._evict()
+            return self._entries[key][0]
+
+    def visions(self, paths: list[str], scale: float = 1.0) -> list[Vision]:
+        return [self.vision(path, scale) for path in paths]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _evict(self):
+        # keep the entry just added even if it alone is over the limit
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+
+
+def _load(path: str, scale: float) -> Vision:
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise Exception(f"Could not read template image {path}")
+    if scale != 1.0:
+        img = cv2.resize(img, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return Vision.from_image(img)
+
+
+STORE = TemplateStore()
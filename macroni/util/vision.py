@@ -2,11 +2,22 @@ import cv2 as cv
 import numpy as np
 import dataclasses
 
+# scaled needles kept per Vision; more distinct scales start the cache over
+MAX_CACHED_SCALES = 64
+
+# coarse-to-fine search: peaks kept per scale at the coarse level, how much
+# lower than threshold their coarse score may be, and the smallest coarse
+# needle worth matching (smaller ones are searched at full resolution)
+COARSE_CANDIDATES = 5
+COARSE_THRESHOLD_MARGIN = 0.2
+MIN_COARSE_NEEDLE = 8
+
 
 class Vision:
 
     # properties
     needle_img = None
+    needle_gray = None
     needle_w = 0
     needle_h = 0
     method = None
@@ -15,12 +26,39 @@ class Vision:
     def __init__(self, needle_img_path, method=cv.TM_CCOEFF_NORMED):
         # load the image we're trying to match
         # https://docs.opencv.org/4.2.0/d4/da8/group__imgcodecs.html
-        self.needle_img = cv.imread(needle_img_path, cv.IMREAD_UNCHANGED)
+        self._set_needle(cv.imread(needle_img_path, cv.IMREAD_UNCHANGED), method)
+
+    @classmethod
+    def from_image(cls, needle_img, method=cv.TM_CCOEFF_NORMED, needle_gray=None):
+        """
+        Build a Vision from a decoded image instead of a file.
+
+        Args:
+            needle_img: BGR, BGRA or grayscale image; not copied, so it must not be modified
+            needle_gray: grayscale version of needle_img, if already computed
+        """
+        vision = cls.__new__(cls)
+        vision._set_needle(needle_img, method, needle_gray)
+        return vision
+
+    def _set_needle(self, needle_img, method, needle_gray=None):
+        self.needle_img = needle_img
 
         # Drop alpha channel if present (ensure 3-channel BGR for consistency)
         if len(self.needle_img.shape) == 3 and self.needle_img.shape[2] == 4:
             self.needle_img = self.needle_img[:, :, :3].copy()
 
+        # Grayscale needle for find_multiscale, converted once
+        if needle_gray is None:
+            if len(self.needle_img.shape) == 3:
+                needle_gray = cv.cvtColor(self.needle_img, cv.COLOR_BGR2GRAY)
+            else:
+                needle_gray = self.needle_img
+        self.needle_gray = needle_gray
+
+        # (use_gray, scale) -> needle resized to that scale, see scaled_needle
+        self._scaled = {}
+
         # Save the dimensions of the needle image
         self.needle_w = self.needle_img.shape[1]
         self.needle_h = self.needle_img.shape[0]
@@ -104,6 +142,79 @@ class Vision:
 
         return points
 
+    def scaled_needle(self, scale, use_gray=True):
+        """
+        The needle (grayscale if use_gray) resized by scale, cached so
+        repeated lookups only run matchTemplate. The needle images never
+        change, so the cache never goes stale.
+        """
+        key = (use_gray, float(scale))
+        scaled = self._scaled.get(key)
+        if scaled is None:
+            needle = self.needle_gray if use_gray else self.needle_img
+            size = (int(self.needle_w * scale), int(self.needle_h * scale))
+            scaled = cv.resize(needle, size, interpolation=cv.INTER_AREA)
+            if len(self._scaled) >= MAX_CACHED_SCALES:
+                self._scaled.clear()
+            self._scaled[key] = scaled
+        return scaled
+
+    def match_coarse_to_fine(
+        self,
+        haystack,
+        coarse,
+        scale,
+        use_gray=True,
+        threshold=0.5,
+        candidates=COARSE_CANDIDATES,
+    ):
+        """
+        Match the needle at scale against coarse, a downsampled haystack,
+        then match it at full resolution only in a window around each of
+        the best candidates peaks.
+
+        Returns:
+            list of ((x, y), score) in haystack coordinates with score >=
+            threshold, or None if the needle is too small to match at the
+            coarse level
+        """
+        factor = coarse.shape[1] / haystack.shape[1]
+        coarse_needle = self.scaled_needle(scale * factor, use_gray)
+        ch, cw = coarse_needle.shape[:2]
+        if cw < MIN_COARSE_NEEDLE or ch < MIN_COARSE_NEEDLE:
+            return None
+        if cw > coarse.shape[1] or ch > coarse.shape[0]:
+            return None
+        result = cv.matchTemplate(coarse, coarse_needle, self.method)
+
+        needle = self.scaled_needle(scale, use_gray)
+        nh, nw = needle.shape[:2]
+        H, W = haystack.shape[:2]
+        # the coarse peak is off by up to one coarse pixel in each direction
+        pad = int(np.ceil(1 / factor)) + 1
+        matches = []
+        for _ in range(candidates):
+            _, peak, _, (cx, cy) = cv.minMaxLoc(result)
+            if peak < threshold - COARSE_THRESHOLD_MARGIN:
+                break
+            # Suppress this peak so the next one is another match
+            result[
+                max(0, cy - ch // 2) : cy + ch // 2 + 1,
+                max(0, cx - cw // 2) : cx + cw // 2 + 1,
+            ] = -1
+
+            x0 = max(0, int(cx / factor) - pad)
+            y0 = max(0, int(cy / factor) - pad)
+            x1 = min(W, int(cx / factor) + nw + pad)
+            y1 = min(H, int(cy / factor) + nh + pad)
+            if x1 - x0 < nw or y1 - y0 < nh:
+                continue
+            fine = cv.matchTemplate(haystack[y0:y1, x0:x1], needle, self.method)
+            ys, xs = np.where(fine >= threshold)
+            for x, y in zip(xs, ys):
+                matches.append(((int(x0 + x), int(y0 + y)), float(fine[y, x])))
+        return matches
+
     @dataclasses.dataclass
     class VisionHit:
         bbox: tuple[int, int, int, int]  # (x, y, w, h)
@@ -117,31 +228,44 @@ class Vision:
         use_gray=True,
         find_one=False,
         debug_mode=None,
+        pyramid_levels=0,
+        candidates=COARSE_CANDIDATES,
     ) -> list[VisionHit]:
         """
         Find needle in haystack at multiple scales.
         Returns list of (x, y) center points for matches found.
+
+        With pyramid_levels > 0, each scale is first matched on the haystack
+        and needle halved that many times, and only the best candidates
+        peaks found there are matched again at full resolution (see
+        match_coarse_to_fine). More levels are faster; fewer levels or more
+        candidates find more of the matches an exhaustive search would.
         """
         if scales is None:
             scales = np.linspace(0.7, 1.3, 10)
 
-        # Convert to grayscale if requested
-        if use_gray:
-            if len(haystack_img.shape) == 3:
-                haystack = cv.cvtColor(haystack_img, cv.COLOR_BGR2GRAY)
-            else:
-                haystack = haystack_img
-            if len(self.needle_img.shape) == 3:
-                needle = cv.cvtColor(self.needle_img, cv.COLOR_BGR2GRAY)
-            else:
-                needle = self.needle_img
-        else:
-            haystack = haystack_img
-            needle = self.needle_img
+        # Convert to grayscale if requested, unless a Haystack shared with
+        # other needles already was
+        if not isinstance(haystack_img, Haystack) or haystack_img.use_gray != use_gray:
+            if isinstance(haystack_img, Haystack):
+                haystack_img = haystack_img.image
+            haystack_img = Haystack.prepare(haystack_img, use_gray)
+        prepared = haystack_img
+        haystack_img = prepared.image
+        haystack = prepared.search
+        needle = self.needle_gray if use_gray else self.needle_img
 
         H, W = haystack.shape[:2]
         needle_h, needle_w = needle.shape[:2]
 
+        # Haystack for the coarse level, shared by all scales
+        coarse = None
+        if pyramid_levels > 0 and self.method in (
+            cv.TM_CCOEFF_NORMED,
+            cv.TM_CCORR_NORMED,
+        ):
+            coarse = prepared.pyramid(pyramid_levels)
+
         # Efficient path for find_one: just get the best match
         if find_one:
             for scale in scales:
@@ -154,24 +278,33 @@ class Vision:
                 if scaled_w > W or scaled_h > H:
                     continue
 
-                # Resize needle to current scale
-                scaled_needle = cv.resize(
-                    needle, (scaled_w, scaled_h), interpolation=cv.INTER_AREA
-                )
+                # Needle at current scale, resized once per Vision
+                scaled_needle = self.scaled_needle(scale, use_gray)
 
-                # Match template
-                result = cv.matchTemplate(haystack, scaled_needle, self.method)
+                matches = None
+                if coarse is not None:
+                    matches = self.match_coarse_to_fine(
+                        haystack, coarse, scale, use_gray, threshold, candidates
+                    )
+                if matches is not None:
+                    # Coarse-to-fine: the best of the refined matches
+                    if not matches:
+                        continue
+                    best_loc, best_val = max(matches, key=lambda m: m[1])
+                else:
+                    # Match template
+                    result = cv.matchTemplate(haystack, scaled_needle, self.method)
 
-                # Get best match using minMaxLoc
-                min_val, max_val, min_loc, max_loc = cv.minMaxLoc(result)
+                    # Get best match using minMaxLoc
+                    min_val, max_val, min_loc, max_loc = cv.minMaxLoc(result)
 
-                # For TM_SQDIFF and TM_SQDIFF_NORMED, best match is min, otherwise max
-                if self.method in [cv.TM_SQDIFF, cv.TM_SQDIFF_NORMED]:
-                    best_val = min_val
-                    best_loc = min_loc
-                else:
-                    best_val = max_val
-                    best_loc = max_loc
+                    # For TM_SQDIFF and TM_SQDIFF_NORMED, best match is min, otherwise max
+                    if self.method in [cv.TM_SQDIFF, cv.TM_SQDIFF_NORMED]:
+                        best_val = min_val
+                        best_loc = min_loc
+                    else:
+                        best_val = max_val
+                        best_loc = max_loc
 
                 # Check if best match exceeds threshold
                 if best_val >= threshold:
@@ -215,17 +348,23 @@ class Vision:
             if scaled_w > W or scaled_h > H:
                 continue
 
-            # Resize needle to current scale
-            scaled_needle = cv.resize(
-                needle, (scaled_w, scaled_h), interpolation=cv.INTER_AREA
-            )
+            # Needle at current scale, resized once per Vision
+            scaled_needle = self.scaled_needle(scale, use_gray)
 
-            # Match template
-            result = cv.matchTemplate(haystack, scaled_needle, self.method)
+            matches = None
+            if coarse is not None:
+                matches = self.match_coarse_to_fine(
+                    haystack, coarse, scale, use_gray, threshold, candidates
+                )
+            if matches is not None:
+                locations = [loc for loc, _ in matches]
+            else:
+                # Match template
+                result = cv.matchTemplate(haystack, scaled_needle, self.method)
 
-            # Find locations above threshold
-            locations = np.where(result >= threshold)
-            locations = list(zip(*locations[::-1]))
+                # Find locations above threshold
+                locations = np.where(result >= threshold)
+                locations = list(zip(*locations[::-1]))
 
             # Convert to rectangles with actual scaled dimensions
             for loc in locations:
@@ -287,3 +426,53 @@ class Vision:
             cv.imshow("Multiscale Matches", haystack_img)
 
         return points
+
+
+@dataclasses.dataclass
+class Haystack:
+    """
+    An image prepared once to match many needles against it, e.g. by all
+    the template workers of one capture. The arrays are read-only views,
+    so they can be shared between threads.
+    """
+
+    image: np.ndarray  # as captured, BGR or grayscale
+    search: np.ndarray  # what needles are matched against
+    use_gray: bool
+    # pyramid levels -> search halved that many times
+    coarse: dict = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def prepare(cls, image, use_gray=True, pyramid_levels=0):
+        """
+        Args:
+            image: BGR or grayscale image; with use_gray, a grayscale one
+                is matched as is
+            pyramid_levels: coarse level to compute now instead of on
+                first use (see Vision.find_multiscale)
+        """
+        if use_gray and len(image.shape) == 3:
+            search = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        else:
+            search = image.view()
+        search.flags.writeable = False
+        haystack = cls(image, search, use_gray)
+        if pyramid_levels > 0:
+            haystack.pyramid(pyramid_levels)
+        return haystack
+
+    def pyramid(self, levels):
+        """
+        Returns:
+            search halved levels times, computed once
+        """
+        coarse = self.coarse.get(levels)
+        if coarse is None:
+            factor = 0.5**levels
+            coarse = cv.resize(
+                self.search, None, fx=factor, fy=factor, interpolation=cv.INTER_AREA
+            )
+            coarse.flags.writeable = False
+            # two threads may both compute it; either result is kept
+            self.coarse[levels] = coarse
+        return coarse
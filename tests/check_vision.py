@@ -0,0 +1,205 @@
+"""
+Headless checks of the vision builtins, on a synthetic screen read through
+screen.ImageFileSource instead of the display.
+
+Usage:
+    python tests/check_vision.py
+
+The screen has a grid of identical buttons and a colored pixel in two
+corners. A macroni script finds the buttons with @find_template and
+@find_templates, exhaustively and coarse-to-fine, and reads the corners
+with @get_pixel_at and @check_pixel_color, whose circles are partly off
+the screen. locate_template_on_screen is checked to find the same matches
+with each pyramid level as with the exhaustive search. Exits 1 on any
+failure.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from macroni.testrunner import run_test
+from macroni.util import screen, template_match
+
+SCREEN_SIZE = (1280, 720)
+BUTTON_SIZE = (120, 40)
+# single pixels in the top-left and bottom-right corners, as (r, g, b)
+TOP_LEFT_RGB = (255, 0, 0)
+BOTTOM_RIGHT_RGB = (0, 255, 0)
+# top-left corners of the buttons, a 3x3 grid
+BUTTONS = [(160 + 400 * col, 120 + 200 * row) for row in range(3) for col in range(3)]
+
+
+def draw_screen() -> np.ndarray:
+    width, height = SCREEN_SIZE
+    rng = np.random.default_rng(0)
+    ramp = np.linspace(60, 140, width, dtype=np.float32)
+    img = np.empty((height, width, 3), np.uint8)
+    img[:] = np.stack([ramp, ramp * 0.8, ramp * 0.6], axis=-1).astype(np.uint8)
+    noise = rng.integers(-6, 7, img.shape, dtype=np.int16)
+    img = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    w, h = BUTTON_SIZE
+    for x, y in BUTTONS:
+        cv2.rectangle(img, (x, y), (x + w, y + h), (40, 120, 220), -1)
+        cv2.rectangle(img, (x, y), (x + w, y + h), (255, 255, 255), 2)
+        cv2.putText(
+            img,
+            "OK",
+            (x + 40, y + 28),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.8,
+            (255, 255, 255),
+            2,
+            cv2.LINE_AA,
+        )
+    img[0, 0] = TOP_LEFT_RGB[::-1]
+    img[height - 1, width - 1] = BOTTOM_RIGHT_RGB[::-1]
+    return img
+
+
+def write_fixtures(directory: str) -> str:
+    """
+    Returns:
+        Path of the screen image; the template is templates/button/ex0.png
+    """
+    img = draw_screen()
+    path = os.path.join(directory, "screen.png")
+    cv2.imwrite(path, img)
+
+    x, y = BUTTONS[0]
+    w, h = BUTTON_SIZE
+    example = img[y - 2 : y + h + 3, x - 2 : x + w + 3]
+    # templates are scaled by default_template_scale when matched (halved
+    # on macOS, where examples are taken at retina resolution)
+    k = 1 / template_match.default_template_scale(1.0)
+    if k != 1:
+        example = cv2.resize(example, None, fx=k, fy=k, interpolation=cv2.INTER_CUBIC)
+    os.makedirs(os.path.join(directory, "templates", "button"))
+    cv2.imwrite(os.path.join(directory, "templates", "button", "ex0.png"), example)
+    return path
+
+
+def centers() -> list[tuple[int, int]]:
+    w, h = BUTTON_SIZE
+    return [(x + w // 2, y + h // 2) for x, y in BUTTONS]
+
+
+def macroni_script(template_dir: str) -> str:
+    cx, cy = centers()[0]
+    rx, ry = centers()[4]
+    r1, g1, b1 = TOP_LEFT_RGB
+    r2, g2, b2 = BOTTOM_RIGHT_RGB
+    right, bottom = SCREEN_SIZE[0] - 1, SCREEN_SIZE[1] - 1
+    return f"""
+@set_template_dir({json.dumps(template_dir)});
+
+fn near(pos, x, y) {{
+    return pos[0] != null && pos[0] - x < 4 && x - pos[0] < 4 && pos[1] - y < 4 && y - pos[1] < 4;
+}}
+
+pos = @find_template("button");
+if pos[0] == null {{
+    @fail("find_template should find a button");
+}}
+pos = @find_template("button", 0, 0, 400, 250);
+if near(pos, {cx}, {cy}) == 0 {{
+    @fail("find_template in a region should find the first button, got", pos);
+}}
+pos = @find_template("button", 450, 250, 400, 200, 1);
+if near(pos, {rx}, {ry}) == 0 {{
+    @fail("coarse-to-fine find_template in a region should find the middle button, got", pos);
+}}
+
+all = @find_templates("button", 20);
+if @len(all) != {len(BUTTONS)} {{
+    @fail("find_templates should find {len(BUTTONS)} buttons, got", @len(all));
+}}
+coarse = @find_templates("button", 20, 2);
+if @len(coarse) != {len(BUTTONS)} {{
+    @fail("coarse-to-fine find_templates should find {len(BUTTONS)} buttons, got", @len(coarse));
+}}
+few = @find_templates("button", 3, 1);
+if @len(few) != 3 {{
+    @fail("find_templates should return top_k buttons, got", @len(few));
+}}
+
+if @get_pixel_at(0, 0) != ({r1}, {g1}, {b1}) {{
+    @fail("get_pixel_at(0, 0) should be the marker, got", @get_pixel_at(0, 0));
+}}
+if @get_pixel_at({right}, {bottom}) != ({r2}, {g2}, {b2}) {{
+    @fail("get_pixel_at in the corner should be the marker, got", @get_pixel_at({right}, {bottom}));
+}}
+# circles reaching off the screen check only the pixels on it
+if @check_pixel_color(0, 0, 3, {r1}, {g1}, {b1}) != 1 {{
+    @fail("check_pixel_color should find the top-left marker");
+}}
+if @check_pixel_color(3, 0, 3, {r1}, {g1}, {b1}) != 1 {{
+    @fail("check_pixel_color should find the marker 3 points away");
+}}
+if @check_pixel_color(4, 0, 3, {r1}, {g1}, {b1}) != 0 {{
+    @fail("check_pixel_color should not find the marker 4 points away");
+}}
+if @check_pixel_color({right}, {bottom}, 2, {r2}, {g2}, {b2}) != 1 {{
+    @fail("check_pixel_color should find the bottom-right marker");
+}}
+if @check_pixel_color(-10, -10, 3, {r1}, {g1}, {b1}) != 0 {{
+    @fail("check_pixel_color off the screen should find nothing");
+}}
+"""
+
+
+def check_recall(template_dir: str) -> list[str]:
+    """
+    Returns:
+        A message per pyramid level that finds other matches than the
+        exhaustive search
+    """
+    errors = []
+
+    def locate(levels):
+        return sorted(
+            template_match.locate_template_on_screen(
+                template_dir, "button", downscale=1.0, top_k=20, pyramid_levels=levels
+            )
+        )
+
+    exhaustive = locate(0)
+    if len(exhaustive) != len(BUTTONS):
+        errors.append(f"exhaustive search found {len(exhaustive)} of {len(BUTTONS)}")
+    for levels in (1, 2):
+        found = locate(levels)
+        if found != exhaustive:
+            errors.append(f"pyramid_levels={levels} found {found}, not {exhaustive}")
+    return errors
+
+
+def main():
+    errors = []
+    with tempfile.TemporaryDirectory() as directory:
+        screen.set_source(screen.ImageFileSource(write_fixtures(directory)))
+        template_dir = os.path.join(directory, "templates")
+        script = os.path.join(directory, "test_vision.macroni")
+        with open(script, "w") as f:
+            f.write(macroni_script(template_dir))
+
+        result = run_test(script)
+        if not result.ok:
+            errors.append(f"{script}: {result.error}")
+        errors += check_recall(template_dir)
+        screen.set_source(None)
+
+    for error in errors:
+        print(f"FAILED: {error}")
+    if errors:
+        sys.exit(1)
+    print("Vision checks passed")
+
+
+if __name__ == "__main__":
+    main()